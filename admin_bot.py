@@ -1,20 +1,99 @@
-import json
+import html
 import asyncio
+import logging
 import os
+import sys
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
 from aiogram import Bot, Dispatcher, types, F
-from aiogram.filters import Command, CommandStart
-from aiogram.types import Message, BotCommand, InlineKeyboardButton, InlineKeyboardMarkup, ReplyKeyboardMarkup, KeyboardButton
+from aiogram.filters import Command, CommandObject, CommandStart
+from aiogram.types import Message, BotCommand, FSInputFile, InlineKeyboardButton, InlineKeyboardMarkup, ReplyKeyboardMarkup, KeyboardButton
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.storage.memory import MemoryStorage
 from aiogram.fsm.state import StatesGroup, State
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
 from dotenv import load_dotenv
 import datetime
+from zoneinfo import ZoneInfo
+import time
 from contextlib import suppress
-from aiogram.types import FSInputFile
+from log_setup import setup_logging, DUMP_LOGGER
+from config_store import ConfigStore
+from scheduler import ScheduleIndex, DelayQueue, BurstPlanner, CATCH_UP_WINDOW, is_sent, sent_mark, utc_now, next_fire_time
+from recurrence import RULE_HELP, normalize_rule
+from broadcast import fan_out, is_transient
+from ratelimit import RateLimiter, RateLimitMiddleware
+from file_ids import FileIdCache
+from permissions import AdminStatusCache
+import metrics
+from metrics import MetricsMiddleware
+from media_store import MediaStore
+from media_gc import MediaCollector
+from media_groups import MediaGroupCollector
+from send_journal import SendJournal, send_key
+from bulk_io import BulkImport, DocumentError, FORMATS, document_format, export_records, read_records, write_document
+from content import PlanCache, PlanSender, capture_content, capture_item, album_content, stale_keys, CONTENT_KEYS
 
 load_dotenv()
+# Уровень логов (DEBUG/INFO/WARNING/...) и полные дампы конфига/записей (LOG_DUMPS=1, только для отладки)
+setup_logging(os.getenv('LOG_LEVEL', 'INFO'), dumps=os.getenv('LOG_DUMPS', '0') == '1')
+logger = logging.getLogger(__name__)
+dump_log = logging.getLogger(DUMP_LOGGER)
 TOKEN = os.getenv('BOT_TOKEN')
-CONFIG_PATH = os.path.join(os.path.dirname(__file__), 'config.json')
+CONFIG_PATH = os.getenv('CONFIG_PATH', os.path.join(os.path.dirname(__file__), 'config.json'))
+# Адрес Bot API (локальный сервер или заглушка для бенчмарков); по умолчанию api.telegram.org
+TELEGRAM_API_URL = os.getenv('TELEGRAM_API_URL')
+# Окно (сек.), за которое изменения конфига склеиваются в одну запись на диск
+CONFIG_FLUSH_DELAY = float(os.getenv('CONFIG_FLUSH_DELAY', '0.5'))
+# Хранилище конфига: json (config.json) или sqlite (config.db, при первом запуске переносится из config.json)
+STORAGE_BACKEND = os.getenv('STORAGE_BACKEND', 'json')
+# Сколько отправок рассылки идёт одновременно и сколько секунд ждать одну отправку
+BROADCAST_CONCURRENCY = int(os.getenv('BROADCAST_CONCURRENCY', '20'))
+SEND_TIMEOUT = float(os.getenv('SEND_TIMEOUT', '120'))
+# Лимиты Bot API: всего в секунду, в один чат в секунду, в одну группу в минуту
+RATE_GLOBAL_PER_SEC = float(os.getenv('RATE_GLOBAL_PER_SEC', '30'))
+RATE_CHAT_PER_SEC = float(os.getenv('RATE_CHAT_PER_SEC', '1'))
+RATE_GROUP_PER_MIN = float(os.getenv('RATE_GROUP_PER_MIN', '20'))
+# Записи расписания на одно и то же время уходят с темпом BURST_RATE в секунду, но не позже чем через BURST_MAX_SKEW с
+BURST_RATE = float(os.getenv('BURST_RATE', str(RATE_GLOBAL_PER_SEC)))
+BURST_MAX_SKEW = float(os.getenv('BURST_MAX_SKEW', '60'))
+# Сколько секунд доверять закэшированному статусу бота в группе (обновляется и апдейтами my_chat_member)
+ADMIN_STATUS_TTL = float(os.getenv('ADMIN_STATUS_TTL', '3600'))
+# Сколько файлов владельца скачивается одновременно
+MEDIA_DOWNLOAD_CONCURRENCY = int(os.getenv('MEDIA_DOWNLOAD_CONCURRENCY', '4'))
+# Файлы media/ без ссылок удаляются через MEDIA_GC_GRACE секунд; проверка раз в MEDIA_GC_INTERVAL секунд
+MEDIA_GC_GRACE = float(os.getenv('MEDIA_GC_GRACE', '3600'))
+MEDIA_GC_INTERVAL = float(os.getenv('MEDIA_GC_INTERVAL', '600'))
+# Альбом считается полным, если новых элементов не было столько секунд
+MEDIA_GROUP_QUIET = float(os.getenv('MEDIA_GROUP_QUIET', '1.0'))
+# Порт HTTP для метрик Prometheus (/metrics); 0 — не запускать
+METRICS_PORT = int(os.getenv('METRICS_PORT', '0'))
+METRICS_HOST = os.getenv('METRICS_HOST', '127.0.0.1')
+# Приём апдейтов: polling или webhook (HTTP на WEBHOOK_HOST:WEBHOOK_PORT за TLS-прокси, см. webhook.py)
+BOT_MODE = os.getenv('BOT_MODE', 'polling')
+WEBHOOK_URL = os.getenv('WEBHOOK_URL')
+WEBHOOK_HOST = os.getenv('WEBHOOK_HOST', '127.0.0.1')
+WEBHOOK_PORT = int(os.getenv('WEBHOOK_PORT', '8080'))
+WEBHOOK_SECRET = os.getenv('WEBHOOK_SECRET')
+WEBHOOK_CERT = os.getenv('WEBHOOK_CERT')
+if BOT_MODE == 'webhook' and not WEBHOOK_URL:
+    raise RuntimeError("BOT_MODE=webhook требует WEBHOOK_URL (публичный https-адрес прокси)")
+# Кто отправляет рассылку: inline (этот процесс) или outbox (очередь в SQLite + процессы sender_worker.py)
+SENDER_MODE = os.getenv('SENDER_MODE', 'inline')
+OUTBOX_PATH = os.getenv('OUTBOX_PATH', os.path.join(os.path.dirname(__file__), 'outbox.db'))
+# Сколько процессов-отправителей запускать самому (0 — они запускаются отдельно)
+SENDER_WORKERS = int(os.getenv('SENDER_WORKERS', '1'))
+# Состояния диалогов (FSM): sqlite переживает перезапуск, memory — как раньше; брошенные диалоги живут FSM_TTL секунд
+FSM_STORAGE = os.getenv('FSM_STORAGE', 'sqlite')
+FSM_DB_PATH = os.getenv('FSM_DB_PATH', os.path.join(os.path.dirname(__file__), 'fsm.db'))
+FSM_TTL = float(os.getenv('FSM_TTL', '86400'))
+# Часовой пояс расписания (IANA, например Europe/Moscow); по умолчанию — системный
+SCHEDULE_TZ = os.getenv('SCHEDULE_TZ')
+# Журнал отправок по расписанию (intent/sent/failed), по нему после перезапуска решается, что ещё отправить
+SEND_JOURNAL_PATH = os.getenv('SEND_JOURNAL_PATH', os.path.join(os.path.dirname(__file__), 'send_journal.log'))
+CONFIG_DB_PATH = os.getenv('CONFIG_DB_PATH', os.path.join(os.path.dirname(__file__), 'config.db'))
 # --- Ограничение доступа по user_id ---
 OWNER_ID = int(os.getenv('OWNER_ID'))
 
@@ -33,13 +112,23 @@ def owner_only(func):
         if not message:
             return await func(*args, **kwargs)
         if message.from_user.id != OWNER_ID:
-            print(f"[SECURITY] Попытка доступа не-OWNER: {message.from_user.id}, text: {getattr(message, 'text', None)}")
+            logger.warning("[SECURITY] Попытка доступа не-OWNER: %s, text: %s", message.from_user.id, getattr(message, 'text', None))
             await message.answer("<b>Доступ запрещён.</b>", parse_mode="HTML")
             return
-        print(f"[OWNER] Доступ разрешён: {message.from_user.id}, text: {getattr(message, 'text', None)}")
+        logger.debug("[OWNER] Доступ разрешён: %s, text: %s", message.from_user.id, getattr(message, 'text', None))
         return await func(*args, **kwargs)
     return wrapper
 
+async def log_fsm(state, message):
+    # Состояние FSM запрашивается у хранилища, только если DEBUG включён
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug("[FSM] Состояние: %s, message: %s", await state.get_state(), message.text)
+
+async def log_callback(name, callback, state=None):
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug("[CALLBACK] %s: from_user=%s, data=%s, state=%s", name, callback.from_user.id, callback.data,
+                     await state.get_state() if state else None)
+
 def private_chat_only(func):
     """Декоратор для ограничения команд только личным чатом"""
     @wraps(func)
@@ -54,12 +143,37 @@ def private_chat_only(func):
         if not message:
             return await func(*args, **kwargs)
         if message.chat.type != "private":
-            print(f"[SILENT] Игнорируем команду в группе: {message.chat.type}, text: {getattr(message, 'text', None)}")
+            logger.debug("[SILENT] Игнорируем команду в группе: %s, text: %s", message.chat.type, getattr(message, 'text', None))
             return  # Просто игнорируем, не отвечаем
         return await func(*args, **kwargs)
     return wrapper
-bot = Bot(token=TOKEN)
-dp = Dispatcher(storage=MemoryStorage())
+session = AiohttpSession(api=TelegramAPIServer.from_base(TELEGRAM_API_URL)) if TELEGRAM_API_URL else None
+bot = Bot(token=TOKEN, session=session)
+# Все bot.send_* проходят через ограничитель частоты (с повтором после RetryAfter)
+rate_limiter = RateLimiter(RATE_GLOBAL_PER_SEC, RATE_CHAT_PER_SEC, RATE_GROUP_PER_MIN)
+bot.session.middleware(RateLimitMiddleware(rate_limiter))
+# Длительность самих запросов к Bot API (без ожидания лимитов) по методам
+bot.session.middleware(MetricsMiddleware())
+# file_id уже загруженных в Telegram локальных файлов, чтобы не загружать их повторно
+if SENDER_MODE == 'outbox':
+    # Общий с процессами-отправителями кэш в базе outbox: туда же доходят удаления сборщика медиа
+    from outbox import OutboxFileIdCache
+    file_id_cache = OutboxFileIdCache(OUTBOX_PATH, legacy_path=os.path.join("media", "file_ids.json"))
+else:
+    file_id_cache = FileIdCache(os.path.join("media", "file_ids.json"))
+plan_sender = PlanSender(bot, file_id_cache)
+# Медиа владельца по file_unique_id: уже скачанные файлы не качаются повторно
+media_store = MediaStore(bot, "media", concurrency=MEDIA_DOWNLOAD_CONCURRENCY)
+# Элементы альбомов копятся в памяти и сохраняются одной записью
+media_groups = MediaGroupCollector(MEDIA_GROUP_QUIET)
+# Статус бота в группах: проверка прав без get_chat_member перед каждой отправкой
+admin_status = AdminStatusCache(ADMIN_STATUS_TTL)
+if FSM_STORAGE == 'sqlite':
+    from fsm_storage import SQLiteStorage
+    fsm_storage = SQLiteStorage(FSM_DB_PATH, ttl=FSM_TTL)
+else:
+    fsm_storage = MemoryStorage()
+dp = Dispatcher(storage=fsm_storage)
 
 # -----------------------------------
 # FSM состояния
@@ -88,27 +202,42 @@ class DeleteScheduleStates(StatesGroup):
     waiting_for_group = State()
     waiting_for_entry = State()
 
+class ImportStates(StatesGroup):
+    waiting_for_document = State()
+
 # -----------------------------------
 # Конфиг
 # -----------------------------------
 
-def load_config():
-    try:
-        with open(CONFIG_PATH, 'r') as f:
-            data = json.load(f)
-            print(f"[LOG] Загружен config: {data}")
-            return data
-    except Exception as e:
-        print(f"[ERROR] Не удалось загрузить config: {e}")
-        return {"chats": {}, "active": False, "scheduled": {}, "schedule_active": False}
+# Единый для процесса кэш конфига: файл читается с диска только при изменении
+if STORAGE_BACKEND == 'sqlite':
+    from storage_sqlite import open_sqlite_store
+    config_store = open_sqlite_store(CONFIG_DB_PATH, CONFIG_PATH, flush_delay=CONFIG_FLUSH_DELAY)
+else:
+    config_store = ConfigStore(CONFIG_PATH, flush_delay=CONFIG_FLUSH_DELAY)
+# Время чтения конфига из хранилища и каждой записи в него — в метрики
+config_store.observe_load = metrics.CONFIG_LOAD.observe
+config_store.observe_save = metrics.CONFIG_SAVE.observe
+
+# Куча записей расписания по времени следующей отправки, обновляется событиями конфига
+schedule_tz = ZoneInfo(SCHEDULE_TZ) if SCHEDULE_TZ else None
+schedule_index = ScheduleIndex(CATCH_UP_WINDOW, schedule_tz)
+# Сдвиг внутри залпа не должен выводить запись за окно догонялки
+burst_planner = BurstPlanner(BURST_RATE, min(BURST_MAX_SKEW, CATCH_UP_WINDOW))
+config_store.subscribe(schedule_index.on_config_event)
+# Очередь групп режима задержки: у каждой группы свой срок следующей отправки
+delay_queue = DelayQueue()
+config_store.subscribe(delay_queue.on_config_event)
+# Скомпилированные планы отправки, сбрасываются при редактировании сообщения
+plan_cache = PlanCache()
+config_store.subscribe(plan_cache.on_config_event)
+# Счётчики ссылок на файлы media/ из групп и записей расписания
+media_collector = MediaCollector("media", MEDIA_GC_GRACE, media_store, file_id_cache)
+config_store.subscribe(media_collector.on_config_event)
 
-def save_config(data):
-    try:
-        with open(CONFIG_PATH, 'w') as f:
-            json.dump(data, f, indent=2)
-            print(f"[LOG] Сохранён config: {data}")
-    except Exception as e:
-        print(f"[ERROR] Не удалось сохранить config: {e}")
+def load_config():
+    # Возвращает общий словарь из памяти — менять его нужно через методы config_store
+    return config_store.get()
 
 # -----------------------------------
 # Кнопки для групп
@@ -178,8 +307,7 @@ async def handle_group_add(message: Message):
     if link in groupnames:
         await message.answer("<i> 🔺 Данная группа уже добавлена </i>" , parse_mode="HTML",)
         return
-    config["chats"][link] = {"message": None, "delay": 60}
-    save_config(config)
+    config_store.add_chat(link, {"message": None, "delay": 60})
     await message.answer(f"<i> 🔸 Группа добавлена: </i> {link}", parse_mode="HTML",)
 
 # -----------------------------------
@@ -201,7 +329,7 @@ async def btn_setmsg(message: Message):
 
 @dp.callback_query(F.data.startswith("msg:"))
 async def group_msg_selected(callback: types.CallbackQuery, state: FSMContext):
-    print(f"[CALLBACK] msg: from_user={callback.from_user.id}, data={callback.data}, state={await state.get_state()}")
+    await log_callback("msg", callback, state)
     chat = callback.data.split("msg:")[1]
     await state.update_data(selected_group=chat)
     await callback.message.answer(f"<b> Отправьте сообщение для {chat}. Это может быть текст, медиа, текст + медиа.</b>",parse_mode="HTML",)
@@ -211,7 +339,7 @@ async def group_msg_selected(callback: types.CallbackQuery, state: FSMContext):
 @dp.message(BotStates.waiting_for_msg)
 @owner_only
 async def handle_msg_input(message: Message, state: FSMContext):
-    print(f"[FSM] Состояние: {await state.get_state()}, message: {message.text}")
+    await log_fsm(state, message)
     
     # Если это медиа-группа, переключаемся на специальный обработчик
     if message.media_group_id:
@@ -222,49 +350,19 @@ async def handle_msg_input(message: Message, state: FSMContext):
     
     data = await state.get_data()
     chat = data["selected_group"]
-    config = load_config()
-
-    if message.photo:
-        photo = message.photo[-1]
-        file = await bot.get_file(photo.file_id)
-        file_path = f"media/{photo.file_unique_id}.jpg"
-
-        # создаём папку если нет
-        os.makedirs("media", exist_ok=True)
-        await bot.download_file(file.file_path, destination=file_path)
-
-        config["chats"][chat]["media"] = file_path
-        config["chats"][chat]["message"] = message.caption or ""
-        config["chats"][chat]["caption_entities"] = [e.model_dump() for e in message.caption_entities] if message.caption_entities else None
-        await message.answer(f"<i>🔸 Медиа + подпись сохранены для {chat}</i>", parse_mode="HTML",)
 
-    elif message.document:
-        file_id = message.document.file_id
-        config["chats"][chat]["media"] = file_id
-        config["chats"][chat]["message"] = message.caption or ""
-        config["chats"][chat]["caption_entities"] = [e.model_dump() for e in message.caption_entities] if message.caption_entities else None
-        await message.answer(f"<i> 🔸 Медиа + подпись сохранены для {chat} </i>",parse_mode="HTML",)
+    content = await capture_content(media_store, message)
+    if content is None:
+        await message.answer("<b> ♦️ Не удалось распознать сообщение. Отправь текст или медиа.</b>", parse_mode="HTML",)
+        return
+    config_store.update_chat(chat, content, drop=stale_keys(content))
+    if message.text:
+        await message.answer(f"<i>🔸 Текст сохранен для {chat} </i>",parse_mode="HTML",)
     elif message.video:
-        video = message.video
-        file = await bot.get_file(video.file_id)
-        os.makedirs("media", exist_ok=True)
-        file_path = f"media/{video.file_unique_id}.mp4"
-        await bot.download_file(file.file_path, destination=file_path)
-        config["chats"][chat]["media"] = file_path
-        config["chats"][chat]["message"] = message.caption or ""
-        config["chats"][chat]["caption_entities"] = [e.model_dump() for e in message.caption_entities] if message.caption_entities else None
         await message.answer(f"<i>🔸 Видео + подпись сохранены для {chat}</i>", parse_mode="HTML",)
-    elif message.text:
-        config["chats"][chat]["message"] = message.text
-        config["chats"][chat]["entities"] = [e.model_dump() for e in message.entities] if message.entities else None
-        config["chats"][chat].pop("media", None)
-        config["chats"][chat].pop("caption_entities", None)
-        await message.answer(f"<i>🔸 Текст сохранен для {chat} </i>",parse_mode="HTML",)
     else:
-        await message.answer("<b> ♦️ Не удалось распознать сообщение. Отправь текст или медиа.</b>", parse_mode="HTML",)
-        return
+        await message.answer(f"<i>🔸 Медиа + подпись сохранены для {chat}</i>", parse_mode="HTML",)
 
-    save_config(config)
     await message.answer("<b> 🔽 Выберите действие: </b>", parse_mode="HTML", reply_markup=main_menu)
     await state.clear()
 
@@ -273,57 +371,27 @@ async def handle_msg_input(message: Message, state: FSMContext):
 @owner_only
 async def handle_delay_media_group(message: Message, state: FSMContext):
     """Обработка медиа-групп для режима задержки"""
-    print(f"[FSM] Обработка медиа-группы задержки: {message.media_group_id}")
-    
-    data = await state.get_data()
-    chat = data["selected_group"]
-    config = load_config()
-    
-    # Собираем медиа-группу
-    media_group_id = message.media_group_id
-    if media_group_id not in data.get("media_groups", {}):
-        data["media_groups"] = {media_group_id: []}
-        await state.update_data(media_groups=data["media_groups"])
-    
-    # Добавляем текущее медиа в группу
-    media_item = {}
-    if message.photo:
-        photo = message.photo[-1]
-        file = await bot.get_file(photo.file_id)
-        file_path = f"media/{photo.file_unique_id}.jpg"
-        os.makedirs("media", exist_ok=True)
-        await bot.download_file(file.file_path, destination=file_path)
-        media_item = {"type": "photo", "file_path": file_path}
-    elif message.video:
-        video = message.video
-        file = await bot.get_file(video.file_id)
-        file_path = f"media/{video.file_unique_id}.mp4"
-        os.makedirs("media", exist_ok=True)
-        await bot.download_file(file.file_path, destination=file_path)
-        media_item = {"type": "video", "file_path": file_path}
-    elif message.document:
-        file_id = message.document.file_id
-        media_item = {"type": "document", "file_id": file_id}
-    
-    if media_item:
-        data["media_groups"][media_group_id].append(media_item)
-        await state.update_data(media_groups=data["media_groups"])
-    
-    # Если это последнее сообщение в группе (нет caption или это текстовое сообщение)
-    if message.caption or (message.text and not message.photo and not message.video and not message.document):
-        # Сохраняем медиа-группу
-        config["chats"][chat]["media_group"] = data["media_groups"][media_group_id]
-        config["chats"][chat]["message"] = message.caption or message.text or ""
-        config["chats"][chat]["caption_entities"] = [e.model_dump() for e in message.caption_entities] if message.caption_entities else None
-        config["chats"][chat]["entities"] = [e.model_dump() for e in message.entities] if message.entities else None
-        config["chats"][chat].pop("media", None)  # Удаляем старый медиа
-        print(f"[DEBUG] Сохраняем медиа-группу задержки: {data['media_groups'][media_group_id]}")
-        
-        save_config(config)
+    logger.debug("[FSM] Обработка медиа-группы задержки: %s", message.media_group_id)
+
+    async def prepare():
+        # FSM читается один раз на альбом, а не на каждый элемент
+        return (await state.get_data())["selected_group"]
+
+    async def save_album(items, caption_message, chat):
+        if not items:
+            await message.answer("<i> ♦️ Не удалось сохранить медиа-группу. Попробуйте ещё раз.</i>", parse_mode="HTML")
+            await state.set_state(BotStates.waiting_for_msg)
+            return
+        content = album_content(items, caption_message)
+        dump_log.debug("Сохраняем медиа-группу задержки: %s", items)
+        config_store.update_chat(chat, content, drop=stale_keys(content))  # Удаляем старый медиа
         await message.answer(f"<i>🔸 Медиа-группа сохранена для {chat}</i>", parse_mode="HTML")
         await message.answer("<b> 🔽 Выберите действие: </b>", parse_mode="HTML", reply_markup=main_menu)
         await state.clear()
 
+    # Загрузка элемента стартует сразу, альбом сохраняется одной записью после паузы
+    media_groups.add(message, lambda chat: capture_item(media_store, message), save_album, prepare)
+
 # -----------------------------------
 # Задержка Выбор единицы времени (секунды, минуты, часы)
 # -----------------------------------
@@ -363,7 +431,7 @@ back_button = ReplyKeyboardMarkup(
 )
 @dp.callback_query(F.data.startswith("delay:"))
 async def group_delay_selected(callback: types.CallbackQuery, state: FSMContext):
-    print(f"[CALLBACK] delay: from_user={callback.from_user.id}, data={callback.data}, state={await state.get_state()}")
+    await log_callback("delay", callback, state)
     chat = callback.data.split("delay:")[1]
     await state.update_data(selected_group=chat)
     msg = await callback.message.answer("Текущая задержка: <b>00:00:00</b>", parse_mode="HTML")
@@ -376,7 +444,7 @@ async def group_delay_selected(callback: types.CallbackQuery, state: FSMContext)
 @dp.message(BotStates.waiting_for_delay_hours)
 @owner_only
 async def input_delay_hours(message: Message, state: FSMContext):
-    print(f"[FSM] Состояние: {await state.get_state()}, message: {message.text}")
+    await log_fsm(state, message)
     if message.text == "🔙 Назад":
         return  # обработка выше
     try:
@@ -398,7 +466,7 @@ async def input_delay_hours(message: Message, state: FSMContext):
             parse_mode="HTML"
         )
     except Exception as e:
-        print(f"[ERROR] Не удалось отредактировать сообщение (часы): {e}")
+        logger.error("Не удалось отредактировать сообщение (часы): %s", e)
     
     await message.bot.delete_message(message.chat.id, data["ask_msg_id"])
     ask = await message.answer("<i> Введите минуты: </i>", parse_mode="HTML", reply_markup=back_button)
@@ -408,7 +476,7 @@ async def input_delay_hours(message: Message, state: FSMContext):
 @dp.message(BotStates.waiting_for_delay_minutes)
 @owner_only
 async def input_delay_minutes(message: Message, state: FSMContext):
-    print(f"[FSM] Состояние: {await state.get_state()}, message: {message.text}")
+    await log_fsm(state, message)
     if message.text == "🔙 Назад":
         return  # обработка выше
     try:
@@ -431,7 +499,7 @@ async def input_delay_minutes(message: Message, state: FSMContext):
             parse_mode="HTML"
         )
     except Exception as e:
-        print(f"[ERROR] Не удалось отредактировать сообщение (минуты): {e}")
+        logger.error("Не удалось отредактировать сообщение (минуты): %s", e)
     
     await message.bot.delete_message(message.chat.id, data["ask_msg_id"])
     ask = await message.answer("<i> Введите секунды: </i>", parse_mode="HTML", reply_markup=back_button)
@@ -441,7 +509,7 @@ async def input_delay_minutes(message: Message, state: FSMContext):
 @dp.message(BotStates.waiting_for_delay_seconds)
 @owner_only
 async def input_delay_seconds(message: Message, state: FSMContext):
-    print(f"[FSM] Состояние: {await state.get_state()}, message: {message.text}")
+    await log_fsm(state, message)
     if message.text == "🔙 Назад":
         return  # обработка выше
     try:
@@ -465,14 +533,12 @@ async def input_delay_seconds(message: Message, state: FSMContext):
             parse_mode="HTML"
         )
     except Exception as e:
-        print(f"[ERROR] Не удалось отредактировать сообщение (секунды): {e}")
+        logger.error("Не удалось отредактировать сообщение (секунды): %s", e)
     
     await message.bot.delete_message(message.chat.id, data["ask_msg_id"])
     total_seconds = hours * 3600 + minutes * 60 + seconds
-    config = load_config()
     chat = data["selected_group"]
-    config["chats"][chat]["delay"] = total_seconds
-    save_config(config)
+    config_store.update_chat(chat, {"delay": total_seconds})
     await message.answer(f"<i>🔸 Задержка для {chat} обновлена на {hours:02d}:{minutes:02d}:{seconds:02d} </i>", parse_mode="HTML",)
     await state.clear()
     await message.answer("<b> 🔽 Выберите действие: </b>", parse_mode="HTML", reply_markup=main_menu)
@@ -501,48 +567,19 @@ async def btn_remove(message: Message):
 
 @dp.callback_query(F.data.startswith("remove:"))
 async def handle_remove(callback: types.CallbackQuery):
-    print(f"[CALLBACK] remove: from_user={callback.from_user.id}, data={callback.data}")
+    await log_callback("remove", callback)
     chat = callback.data.split("remove:")[1]
-    config = load_config()
-    print(f"[DELETE] Удаляем группу: {chat}")
-    print(f"[DELETE] Конфиг до удаления: {config}")
-    
-    removed_media = []
-    # Удаляем из chats
-    if chat in config["chats"]:
-        print(f"[DELETE] Удаляем из chats: {chat}")
-        # Сохраняем путь к медиа для удаления
-        media_path = config["chats"][chat].get("media")
-        if media_path and os.path.isfile(media_path):
-            removed_media.append(media_path)
-            print(f"[DELETE] Добавлен медиа-файл для удаления: {media_path}")
-        del config["chats"][chat]
-    else:
-        print(f"[DELETE] Группа {chat} не найдена в chats")
+    logger.info("[DELETE] Удаляем группу: %s", chat)
     
-    # Удаляем из scheduled
-    if "scheduled" in config and chat in config["scheduled"]:
-        print(f"[DELETE] Удаляем из scheduled: {chat}")
-        for entry in config["scheduled"][chat]:
-            media_path = entry.get("media")
-            if media_path and os.path.isfile(media_path):
-                removed_media.append(media_path)
-                print(f"[DELETE] Добавлен медиа-файл из scheduled для удаления: {media_path}")
-        del config["scheduled"][chat]
-    else:
-        print(f"[DELETE] Группа {chat} не найдена в scheduled")
-    
-    # Удаляем медиа-файлы
-    for path in removed_media:
-        with suppress(Exception):
-            os.remove(path)
-            print(f"[DELETE] Удален медиа-файл: {path}")
-    
-    # Сохраняем конфиг только один раз после всех операций удаления
-    print(f"[DELETE] Конфиг после удаления: {config}")
-    save_config(config)
-    print(f"[DELETE] Конфиг сохранен")
+    # Одна операция удаляет группу и все её записи расписания
+    chat_data, entries = config_store.remove_chat(chat)
+    if chat_data is None:
+        logger.info("[DELETE] Группа %s не найдена в chats", chat)
+    if not entries:
+        logger.info("[DELETE] Группа %s не найдена в scheduled", chat)
     
+    # Файлы группы и её записей удалит сборщик медиа, когда на них не останется ссылок
+    config = load_config()
     await callback.message.answer(f"<i> ♦️ Группа и все связанные сообщения удалены: {chat} </i>", parse_mode="HTML",)
     if not config["chats"]:
         await callback.message.answer("<i>🔶 Список групп пуст.</i>", parse_mode="HTML")
@@ -557,38 +594,32 @@ async def handle_remove(callback: types.CallbackQuery):
 @owner_only
 async def btn_list_groups(message: Message):
     config = load_config()
-    print(f"[LIST] Загружен конфиг для списка групп: {config}")
-    print(f"[LIST] Группы в chats: {list(config.get('chats', {}).keys())}")
+    dump_log.debug("[LIST] Загружен конфиг для списка групп: %s", config)
+    logger.debug("[LIST] Группы в chats: %s", list(config.get('chats', {}).keys()))
     if not config["chats"]:
         return await message.answer("<i> 🔶 Список групп пуст. </i>", parse_mode="HTML",)
     text = "\n".join([f"{chat}" for chat in config["chats"].keys()])
-    print(f"[LIST] Отправляем список: {text}")
+    dump_log.debug("[LIST] Отправляем список: %s", text)
     await message.answer(f"<b> Список добавленных групп:\n{text} </b>", parse_mode="HTML",)
 
 # --- Глобальный флаг для фоновой задачи ---
 schedule_broadcast_active = False
 
 def set_schedule_active(active: bool):
-    config = load_config()
-    config["schedule_active"] = active
-    save_config(config)
+    config_store.set_flag("schedule_active", active)
 
 @dp.message(F.text == "🟢 Старт рассылки")
 @private_chat_only
 @owner_only
 async def btn_launch(message: Message):
-    config = load_config()
-    config["active"] = True
-    save_config(config)
+    config_store.set_flag("active", True)
     await message.answer("<b>✅ Рассылка включена.</b>", parse_mode="HTML")
 
 @dp.message(F.text == "🔴 Стоп ")
 @private_chat_only
 @owner_only
 async def btn_stop(message: Message, state: FSMContext):
-    config = load_config()
-    config["active"] = False
-    save_config(config)
+    config_store.set_flag("active", False)
     await message.answer("<b>⛔️ Рассылка остановлена. </b>" , parse_mode="HTML")
 
 @dp.message(F.text == "✏️ Редактировать сообщения")
@@ -615,14 +646,14 @@ def get_schedule_entry_preview(entry, n=20):
 def get_edit_entry_inline_keyboard(entries):
     return InlineKeyboardMarkup(
         inline_keyboard=[
-            [InlineKeyboardButton(text=get_schedule_entry_preview(entry), callback_data=f"edit_schedule_entry:{i}")]
-            for i, entry in enumerate(entries)
+            [InlineKeyboardButton(text=get_schedule_entry_preview(entry), callback_data=f"edit_schedule_entry:{entry['id']}")]
+            for entry in entries
         ]
     )
 
 @dp.callback_query(F.data.startswith("edit_schedule_group:"))
 async def edit_schedule_group_selected(callback: types.CallbackQuery, state: FSMContext):
-    print(f"[CALLBACK] edit_schedule_group: from_user={callback.from_user.id}, data={callback.data}, state={await state.get_state()}")
+    await log_callback("edit_schedule_group", callback, state)
     group = callback.data.split(":", 1)[1]
     await state.update_data(selected_group=group)
     config = load_config()
@@ -644,13 +675,11 @@ async def edit_schedule_group_selected(callback: types.CallbackQuery, state: FSM
 
 @dp.callback_query(F.data.startswith("edit_schedule_entry:"))
 async def edit_schedule_entry_selected(callback: types.CallbackQuery, state: FSMContext):
-    print(f"[CALLBACK] edit_schedule_entry: from_user={callback.from_user.id}, data={callback.data}, state={await state.get_state()}")
-    entry_idx = int(callback.data.split(":", 1)[1])
-    data = await state.get_data()
-    group = data["selected_group"]
-    await state.update_data(edit_entry_idx=entry_idx)
+    await log_callback("edit_schedule_entry", callback, state)
+    entry_id = int(callback.data.split(":", 1)[1])
+    await state.update_data(edit_entry_id=entry_id)
     await callback.message.answer(
-        "<i> Введите новое время (ЧЧ:ММ:СС) или 0, чтобы оставить прежнее: </i>" , parse_mode="HTML")
+        f"<i> Введите новое время или правило ({html.escape(RULE_HELP)}) или 0, чтобы оставить прежнее: </i>" , parse_mode="HTML")
     await state.set_state(EditScheduleStates.waiting_for_new_time)
     await callback.answer()
 
@@ -670,23 +699,20 @@ async def save_new_time(message: Message, state: FSMContext):
         )
         await state.set_state(BotStates.selected_group)
         return
-    print(f"[FSM] Состояние: {await state.get_state()}, message: {message.text}")
-    import re
+    await log_fsm(state, message)
     data = await state.get_data()
     group = data["selected_group"]
-    idx = data["edit_entry_idx"]
-    config = load_config()
-    entry = config["scheduled"][group][idx]
+    entry_id = data["edit_entry_id"]
+    fields = {}
     if message.text.strip() != "0":
-        time_pattern = r"^([01]?\d|2[0-3]):[0-5]\d:[0-5]\d$"
-        if not re.match(time_pattern, message.text):
-            return await message.answer("<b> Введите корректное время в формате ЧЧ:ММ:СС (например, 15:35:00) или 0, чтобы оставить прежнее </b>" , parse_mode="HTML")
-        entry["time"] = message.text.strip()
+        try:
+            fields["time"] = normalize_rule(message.text)
+        except ValueError as e:
+            return await message.answer(f"<b> Некорректное правило ({html.escape(str(e))}). Формат: {html.escape(RULE_HELP)}. Или 0, чтобы оставить прежнее </b>" , parse_mode="HTML")
     # Сброс last_sent_date при изменении времени
-    if "last_sent_date" in entry:
-        del entry["last_sent_date"]
-    save_config(config)
-    await message.answer("<i>Отправьте новое сообщение или 0, чтобы оставить прежнее сообщение:</i>",parse_mode='html')
+    entry = config_store.update_scheduled(group, entry_id, fields, drop=("last_sent_date",))
+    note = burst_note(entry) if entry and fields else ""
+    await message.answer(f"<i>Отправьте новое сообщение или 0, чтобы оставить прежнее сообщение:</i>{note}",parse_mode='html')
     await state.set_state(EditScheduleStates.waiting_for_new_message)
 
 @dp.message(EditScheduleStates.waiting_for_new_message)
@@ -705,58 +731,27 @@ async def save_new_message(message: Message, state: FSMContext):
         )
         await state.set_state(BotStates.selected_group)
         return
-    print(f"[FSM] Состояние: {await state.get_state()}, message: {message.text}")
+    await log_fsm(state, message)
     data = await state.get_data()
     group = data["selected_group"]
-    idx = data["edit_entry_idx"]
-    config = load_config()
-    entry = config["scheduled"][group][idx]
+    entry_id = data["edit_entry_id"]
     if message.text and message.text.strip() == "0":
         # Оставляем прежний текст/медиа
         await message.answer("<i>🔸Сообщение по расписанию обновлено!</i>", parse_mode="HTML")
         await state.clear()
         return
-    if message.photo:
-        photo = message.photo[-1]
-        file = await bot.get_file(photo.file_id)
-        file_path = f"media/{photo.file_unique_id}.jpg"
-        os.makedirs("media", exist_ok=True)
-        await bot.download_file(file.file_path, destination=file_path)
-        entry["media"] = file_path
-        entry["message"] = message.caption or ""
-        entry["caption_entities"] = [e.model_dump() for e in message.caption_entities] if message.caption_entities else None
-    elif message.document:
-        file_id = message.document.file_id
-        entry["media"] = file_id
-        entry["message"] = message.caption or ""
-        entry["caption_entities"] = [e.model_dump() for e in message.caption_entities] if message.caption_entities else None
-    elif message.video:
-        video = message.video
-        file = await bot.get_file(video.file_id)
-        file_path = f"media/{video.file_unique_id}.mp4"
-        os.makedirs("media", exist_ok=True)
-        await bot.download_file(file.file_path, destination=file_path)
-        entry["media"] = file_path
-        entry["message"] = message.caption or ""
-        entry["caption_entities"] = [e.model_dump() for e in message.caption_entities] if message.caption_entities else None
-    elif message.text:
-        entry["message"] = message.text
-        entry["entities"] = [e.model_dump() for e in message.entities] if message.entities else None
-        entry.pop("media", None)
-        entry.pop("caption_entities", None)
-    else:
+    content = await capture_content(media_store, message)
+    if content is None:
         await message.answer("<i> ♦️ Не удалось распознать сообщение. Отправьте текст или медиа, либо 0 чтобы оставить прежнее.</i>", parse_mode="HTML")
         return
     # Сброс last_sent_date при изменении сообщения
-    if "last_sent_date" in entry:
-        del entry["last_sent_date"]
-    save_config(config)
+    config_store.update_scheduled(group, entry_id, content, drop=stale_keys(content) + ("last_sent_date",))
     await message.answer("<i> 🔸Сообщение по расписанию обновлено! </i>", parse_mode="HTML")
     await state.clear()
 
 @dp.callback_query(F.data == "edit_entry_back")
 async def edit_entry_back(callback: types.CallbackQuery, state: FSMContext):
-    print(f"[CALLBACK] edit_entry_back: from_user={callback.from_user.id}, data={callback.data}, state={await state.get_state()}")
+    await log_callback("edit_entry_back", callback, state)
     data = await state.get_data()
     group = data["selected_group"]
     config = load_config()
@@ -775,240 +770,349 @@ async def edit_entry_back(callback: types.CallbackQuery, state: FSMContext):
 
 async def set_bot_commands():
     commands = [
-        BotCommand(command="start", description="Открыть меню")
+        BotCommand(command="start", description="Открыть меню"),
+        BotCommand(command="metrics", description="Метрики рассылки"),
+        BotCommand(command="import", description="Импорт групп и расписания из файла"),
+        BotCommand(command="export", description="Выгрузить группы и расписание в файл")
     ]
     await bot.set_my_commands(commands)
 
 # -----------------------------------
 # Фоновые задачи ---
 # -----------------------------------
+# В режиме outbox циклы только ставят отправки в очередь, а шлют процессы sender_worker.py
+if SENDER_MODE == 'outbox':
+    from outbox import Outbox
+    # Запросы к outbox ждут блокировку записи, пока её держат отправители (до 30 с):
+    # выполняем их в отдельном потоке, одном на всё соединение, а не в event loop
+    outbox_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="outbox")
+    outbox = Outbox(OUTBOX_PATH, check_same_thread=False)
+    send_journal = None
+else:
+    outbox = None
+    send_journal = SendJournal(SEND_JOURNAL_PATH, CATCH_UP_WINDOW)
+
 schedule_broadcast_task = None
 delay_broadcast_task = None
+# Залпы расписания и пачки режима задержки отправляются фоновыми задачами с общим
+# (на каждый режим) лимитом одновременных отправок, а циклы тем временем продолжают
+# снимать с очередей следующие сроки
+scheduled_slots = asyncio.Semaphore(max(BROADCAST_CONCURRENCY, 1))
+scheduled_in_flight = set()
+delay_slots = asyncio.Semaphore(max(BROADCAST_CONCURRENCY, 1))
+delay_in_flight = set()
+send_tasks = set()
+
+
+def start_send_task(coro):
+    task = asyncio.create_task(coro)
+    send_tasks.add(task)
+    task.add_done_callback(send_tasks.discard)
+
+def log_throttling(loop_name, sent, throttled_before):
+    spent = rate_limiter.stats["throttled_seconds"] - throttled_before
+    if spent > 0:
+        logger.info("%s: %s отправок, ожидание лимитов %.1f с (всего %.1f с, RetryAfter: %s)",
+                    loop_name, sent, spent, rate_limiter.stats["throttled_seconds"], rate_limiter.stats["retry_after"])
+    if sent:
+        logger.debug("%s: get_chat_member сэкономлено всего %s, фоновых проверок прав %s",
+                     loop_name, admin_status.api_calls_saved, admin_status.refreshes)
 
 async def schedule_broadcast_loop():
-    print("[DEBUG] schedule_broadcast_loop запущен")
+    logger.debug("schedule_broadcast_loop запущен")
+    schedule_index.rebuild(load_config().get("scheduled", {}))
+    replayed = []
+    if send_journal is not None:
+        # Отправки, подтверждённые журналом, но не успевшие попасть в last_sent_date
+        for group, entry_id, fire in send_journal.sent_sends():
+            entry = config_store.find_scheduled(group, entry_id)
+            if entry and not is_sent(entry, fire, schedule_tz):
+                config_store.mark_sent(group, entry_id, sent_mark(fire))
+        # Начатые до падения отправки повторяем (журнал оставил только те, что ещё в окне догонялки)
+        for group, entry_id, fire in send_journal.pending_sends():
+            entry = config_store.find_scheduled(group, entry_id)
+            if entry is not None:
+                logger.warning("Повтор незавершённой отправки %s в %s (из журнала)", send_key(group, entry_id, fire), group)
+                replayed.append((group, entry, fire))
     while True:
+        if send_journal is not None and send_journal.compact_due():
+            try:
+                await send_journal.compact()
+            except Exception as e:
+                logger.error("Не удалось уплотнить журнал отправок: %s", e)
         config = load_config()
         if not config.get("schedule_active", False):
-            print("[LOG] schedule_broadcast_loop: schedule_active = False, sleep 5s")
-            await asyncio.sleep(5)
+            logger.debug("schedule_broadcast_loop: schedule_active = False, ждём включения")
+            # Пока рассылка выключена, только ждём изменений (не дольше 5 с)
+            schedule_index.changed.clear()
+            with suppress(asyncio.TimeoutError):
+                await asyncio.wait_for(schedule_index.changed.wait(), 5)
+            continue
+        now = utc_now()
+        due = []
+        for group, entry_id, fire in schedule_index.pop_due(now):
+            entry = config_store.find_scheduled(group, entry_id)
+            if entry is None:
+                continue
+            if send_key(group, entry_id, fire) in scheduled_in_flight:
+                # Куча перестроена, пока отправка ещё идёт: её исход отметит залп
+                continue
+            if send_journal is not None and send_journal.is_sent(send_key(group, entry_id, fire)):
+                # Уже отправлено (по журналу), просто фиксируем это в конфиге
+                config_store.mark_sent(group, entry_id, sent_mark(fire))
+                continue
+            lateness = (now - fire).total_seconds()
+            if lateness > CATCH_UP_WINDOW:
+                # Окно догонялки закрылось (например, рассылка была выключена) — ждём следующего раза
+                logger.info("Пропуск: %s в %s опоздание %.0f сек больше окна", group, entry['time'], lateness)
+                schedule_index.upsert(group, entry)
+                continue
+            logger.info("Время отправки для %s: %s, отправляем... (опоздание: %.3f сек)", group, entry['time'], lateness)
+            due.append((group, entry, fire))
+        due_keys = {send_key(group, entry["id"], fire) for group, entry, fire in due}
+        due.extend(item for item in replayed if send_key(item[0], item[1]["id"], item[2]) not in due_keys)
+        replayed = []
+        # Записи на одно время растягиваются по бюджету отправок в детерминированном порядке
+        planned = burst_planner.plan(due)
+        if len(planned) > 1:
+            logger.info("Залп из %s записей, последняя начнётся через %.1f с",
+                        len(planned), (max(item[0] for item in planned) - now).total_seconds())
+        if outbox is not None:
+            for start, group, entry, fire in planned:
+                if await enqueue_send("scheduled", group, entry["id"], entry,
+                                      dedup_key=f"scheduled:{group}:{entry['id']}:{fire:%Y-%m-%dT%H:%M:%S}",
+                                      not_before=start.timestamp(), not_after=fire.timestamp() + CATCH_UP_WINDOW):
+                    # Запись в outbox надёжна: дальше повторами занимается отправитель
+                    config_store.mark_sent(group, entry["id"], sent_mark(fire))
+                else:
+                    schedule_index.retry(group, entry, fire, 5)
+            await wait_schedule()
             continue
-        now = datetime.datetime.now().time()
-        for group, entries in config.get("scheduled", {}).items():
-            print(f"[LOG] Проверка расписания для группы {group}, entries: {entries}")
-            for entry in entries:
-                try:
-                    t = datetime.datetime.strptime(entry["time"], "%H:%M:%S").time()
-                except Exception as e:
-                    print(f"[ERROR] Некорректное время в entry: {entry}, ошибка: {e}")
-                    continue
-                last_sent = entry.get("last_sent_date")
-                today_str = datetime.datetime.now().strftime("%Y-%m-%d")
-                if last_sent == today_str:
-                    print(f"[INFO] Пропуск: уже отправлено сегодня для {group} в {entry['time']} (last_sent_date={last_sent})")
-                    continue
-                now_seconds = now.hour*3600 + now.minute*60 + now.second
-                t_seconds = t.hour*3600 + t.minute*60 + t.second
-                if 0 <= now_seconds - t_seconds <= 300:
-                    print(f"[LOG] Время отправки для {group}: {entry['time']}, отправляем... (опоздание: {now_seconds - t_seconds} сек)")
-                    try:
-                        await send_scheduled_message(group, entry)
-                        entry["last_sent_date"] = today_str
-                        save_config(config)
-                    except Exception as e:
-                        print(f"[ERROR] Не удалось отправить сообщение по расписанию в {group}: {e}")
-        await asyncio.sleep(5)
+        if planned:
+            scheduled_in_flight.update(send_key(group, entry["id"], fire) for _, group, entry, fire in planned)
+            start_send_task(send_burst(planned))
+        await wait_schedule()
 
 
-async def send_scheduled_message(group, entry):
-    print(f"[DEBUG] send_scheduled_message для {group}, entry: {entry}")
-    chat = group
+async def send_burst(planned):
+    """Отправляет залп по плану BurstPlanner и отмечает результат каждой записи.
+
+    Каждая запись ждёт своего start, не занимая слот отправки; таймаут
+    считается только от начала самой отправки.
+    """
+    throttled_before = rate_limiter.stats["throttled_seconds"]
     try:
-        # Проверяем права бота в группе
-        try:
-            chat_member = await bot.get_chat_member(chat_id=chat, user_id=bot.id)
-            if chat_member.status not in ['administrator', 'creator']:
-                print(f"[WARN] Бот не является администратором в {chat}, статус: {chat_member.status}")
-        except Exception as e:
-            print(f"[WARN] Не удалось проверить права бота в {chat}: {e}")
-        
-        if entry.get("media_group"):
-            print(f"[LOG] Отправка медиа-группы в {chat}: {len(entry['media_group'])} элементов")
-            print(f"[DEBUG] Содержимое медиа-группы: {entry['media_group']}")
-            media_group = []
-            for media_item in entry["media_group"]:
-                print(f"[DEBUG] Обработка элемента: {media_item}")
-                if media_item["type"] == "photo":
-                    input_file = FSInputFile(media_item["file_path"])
-                    media_group.append(types.InputMediaPhoto(media=input_file))
-                    print(f"[DEBUG] Добавлено фото: {media_item['file_path']}")
-                elif media_item["type"] == "video":
-                    input_file = FSInputFile(media_item["file_path"])
-                    media_group.append(types.InputMediaVideo(media=input_file))
-                    print(f"[DEBUG] Добавлено видео: {media_item['file_path']}")
-                elif media_item["type"] == "document":
-                    media_group.append(types.InputMediaDocument(media=media_item["file_id"]))
-                    print(f"[DEBUG] Добавлен документ: {media_item['file_id']}")
-            
-            # Добавляем подпись к первому элементу
-            if media_group and entry.get("message"):
-                media_group[0].caption = entry["message"]
-                if entry.get("caption_entities"):
-                    media_group[0].caption_entities = [types.MessageEntity.model_validate(e) for e in entry["caption_entities"]]
-            
-            await bot.send_media_group(chat_id=chat, media=media_group, disable_notification=True)
-        elif entry.get("media"):
-            print(f"[LOG] Отправка медиа в {chat}: {entry['media']}")
-            media_path = entry["media"]
-            if media_path.endswith(".jpg") or media_path.endswith(".png"):
-                input_file = FSInputFile(media_path)
-                await bot.send_photo(
-                    chat_id=chat, 
-                    photo=input_file, 
-                    caption=entry.get("message", ""), 
-                    caption_entities=[types.MessageEntity.model_validate(e) for e in entry.get("caption_entities", [])] if entry.get("caption_entities") else None,
-                    disable_notification=True
-                )
-            elif media_path.endswith(".mp4") or media_path.endswith(".mov") or media_path.endswith(".m4v"):
-                input_file = FSInputFile(media_path)
-                await bot.send_video(
-                    chat_id=chat,
-                    video=input_file,
-                    caption=entry.get("message", ""),
-                    caption_entities=[types.MessageEntity.model_validate(e) for e in entry.get("caption_entities", [])] if entry.get("caption_entities") else None,
-                    disable_notification=True
-                )
-            else:
-                input_file = FSInputFile(media_path)
-                await bot.send_document(
-                    chat_id=chat, 
-                    document=input_file, 
-                    caption=entry.get("message", ""), 
-                    caption_entities=[types.MessageEntity.model_validate(e) for e in entry.get("caption_entities", [])] if entry.get("caption_entities") else None,
-                    disable_notification=True
-                )
-        elif entry.get("message"):
-            print(f"[LOG] Отправка текста в {chat}: {entry['message']}")
-            await bot.send_message(
-                chat_id=chat, 
-                text=entry["message"], 
-                entities=[types.MessageEntity.model_validate(e) for e in entry.get("entities", [])] if entry.get("entities") else None, 
-                parse_mode=None,
-                disable_notification=True,  # Отключаем уведомления
-                disable_web_page_preview=True  # Отключаем превью ссылок
-            )
+        results = await fan_out(planned, lambda item: send_scheduled_journaled(*item[1:]),
+                                timeout=SEND_TIMEOUT, semaphore=scheduled_slots,
+                                delay=lambda item: (item[0] - utc_now()).total_seconds())
+    finally:
+        scheduled_in_flight.difference_update(send_key(group, entry["id"], fire) for _, group, entry, fire in planned)
+    log_throttling("schedule_broadcast_loop", len(planned), throttled_before)
+    for result in results:
+        _, group, entry, fire = result.target
+        if result.ok:
+            # Событие изменения записи само переставит её в куче на следующее срабатывание
+            config_store.mark_sent(group, entry["id"], sent_mark(fire))
+        elif is_transient(result.error):
+            logger.warning("Повтор отправки в %s через 5 с: %s", group, result.error)
+            schedule_index.retry(group, entry, fire, 5)
         else:
-            print(f"[WARN] Нет данных для отправки в {chat}")
+            logger.error("Отправка записи #%s в %s не удалась, ждём следующего срабатывания: %s",
+                         entry["id"], group, result.error)
+            schedule_index.skip(group, entry, fire)
+
+
+def burst_note(entry):
+    """Строка для владельца, если запись уходит одновременно с другими: сколько их и когда закончится отправка."""
+    fire = next_fire_time(entry, utc_now(), CATCH_UP_WINDOW, schedule_tz)
+    if fire is None:
+        return ""
+    size = schedule_index.burst_size(fire)
+    if size <= 1:
+        return ""
+    local = fire.astimezone(schedule_tz)
+    done = local + datetime.timedelta(seconds=burst_planner.expected_duration(size))
+    return (f"\n<i>На {local:%d.%m %H:%M:%S} запланировано записей: {size}. "
+            f"Они уйдут по очереди, последняя — примерно в {done:%H:%M:%S}.</i>")
+
+
+async def wait_schedule():
+    """Сон до ближайшей записи; после перевода системных часов куча пересчитывается от нового времени."""
+    if await schedule_index.wait():
+        schedule_index.rebuild(load_config().get("scheduled", {}))
+
+
+async def outbox_call(method, *args, **kwargs):
+    """Вызов метода outbox в его потоке: event loop не ждёт блокировок SQLite."""
+    return await asyncio.get_running_loop().run_in_executor(outbox_executor, partial(method, *args, **kwargs))
+
+async def enqueue_send(kind, chat, ref, content, **kwargs):
+    """Ставит отправку в outbox со снимком сообщения: отправитель не читает конфиг.
+
+    False — поставить не удалось (например, база занята дольше таймаута);
+    это временная ошибка, отправку стоит повторить.
+    """
+    payload = {key: content[key] for key in CONTENT_KEYS if key in content}
+    try:
+        if await outbox_call(outbox.enqueue, kind, chat, ref, payload, **kwargs) is None:
+            logger.debug("Отправка %s в %s уже в очереди", kind, chat)
+    except Exception as e:
+        logger.error("Не удалось поставить отправку %s в %s в очередь: %s", kind, chat, e)
+        metrics.SEND_ERRORS.inc(chat=chat)
+        return False
+    return True
+
+async def deliver(chat, key, content, label):
+    """Общая доставка для обоих режимов: сохранённый контент -> план -> вызов Bot API."""
+    try:
+        # Проверяем права бота в группе (только по кэшу, устаревший статус обновится в фоне)
+        admin_status.check(bot, chat)
         
+        # План (метод, entities, медиа) собирается один раз и живёт до редактирования сообщения
+        plan = plan_cache.get(key, content)
+        if plan.method is None:
+            logger.warning("Нет данных для отправки в %s", chat)
+            return
+        logger.debug("%s в %s: медиа %s", plan.method, chat, len(plan.media))
+        await plan_sender.send(chat, plan)
     except Exception as e:
-        print(f"[ERROR] Не удалось отправить сообщение по расписанию в {chat}: {e}")
+        logger.error("Не удалось отправить сообщение %s в %s: %s", label, chat, e)
+        metrics.SEND_ERRORS.inc(chat=chat)
+        # План пересоберётся при следующей отправке: вдруг файл удалили или вернули на место
+        plan_cache.invalidate(key)
+        raise
+
+async def send_scheduled_message(group, entry):
+    dump_log.debug("send_scheduled_message для %s, entry: %s", group, entry)
+    await deliver(group, ("scheduled", entry["id"]), entry, "по расписанию")
+
+async def send_scheduled_journaled(group, entry, fire):
+    """Отправка записи расписания с журналом: intent на диске до отправки, sent/failed — после."""
+    await send_journal.record("intent", group, entry["id"], fire)
+    try:
+        await send_scheduled_message(group, entry)
+    except Exception:
+        await send_journal.record("failed", group, entry["id"], fire)
+        raise
+    # Опоздание относительно назначенного момента на момент завершения отправки
+    lateness = (utc_now() - fire).total_seconds()
+    metrics.SCHEDULED_LATENESS.observe(max(lateness, 0))
+    logger.info("Отправлено в %s (запись #%s), опоздание %.3f с", group, entry["id"], lateness)
+    await send_journal.record("sent", group, entry["id"], fire, lateness=lateness)
+
+async def send_delay_message(group, data):
+    logger.debug("Попытка отправки в %s", group)
+    dump_log.debug("Данные группы %s: %s", group, data)
+    await deliver(group, ("chat", group), data, "по задержке")
 
 async def delay_broadcast_loop():
-    print("[DEBUG] delay_broadcast_loop запущен")
+    logger.debug("delay_broadcast_loop запущен")
+    delay_queue.rebuild(load_config().get("chats", {}))
     while True:
         config = load_config()
         if not config.get("active", False):
-            print("[LOG] delay_broadcast_loop: active = False, sleep 5s")
-            await asyncio.sleep(5)
+            logger.debug("delay_broadcast_loop: active = False, ждём включения")
+            delay_queue.changed.clear()
+            with suppress(asyncio.TimeoutError):
+                await asyncio.wait_for(delay_queue.changed.wait(), 5)
             continue
-        for group, data in config.get("chats", {}).items():
-            print(f"[LOG] Попытка отправки в {group}, data: {data}")
-            try:
-                # Проверяем права бота в группе
-                try:
-                    chat_member = await bot.get_chat_member(chat_id=group, user_id=bot.id)
-                    if chat_member.status not in ['administrator', 'creator']:
-                        print(f"[WARN] Бот не является администратором в {group}, статус: {chat_member.status}")
-                except Exception as e:
-                    print(f"[WARN] Не удалось проверить права бота в {group}: {e}")
-                
-                if data.get("media_group"):
-                    print(f"[LOG] Отправка медиа-группы в {group}: {len(data['media_group'])} элементов")
-                    print(f"[DEBUG] Содержимое медиа-группы задержки: {data['media_group']}")
-                    media_group = []
-                    for media_item in data["media_group"]:
-                        print(f"[DEBUG] Обработка элемента задержки: {media_item}")
-                        if media_item["type"] == "photo":
-                            input_file = FSInputFile(media_item["file_path"])
-                            media_group.append(types.InputMediaPhoto(media=input_file))
-                            print(f"[DEBUG] Добавлено фото задержки: {media_item['file_path']}")
-                        elif media_item["type"] == "video":
-                            input_file = FSInputFile(media_item["file_path"])
-                            media_group.append(types.InputMediaVideo(media=input_file))
-                            print(f"[DEBUG] Добавлено видео задержки: {media_item['file_path']}")
-                        elif media_item["type"] == "document":
-                            media_group.append(types.InputMediaDocument(media=media_item["file_id"]))
-                            print(f"[DEBUG] Добавлен документ задержки: {media_item['file_id']}")
-                    
-                    # Добавляем подпись к первому элементу
-                    if media_group and data.get("message"):
-                        media_group[0].caption = data["message"]
-                        if data.get("caption_entities"):
-                            media_group[0].caption_entities = [types.MessageEntity.model_validate(e) for e in data["caption_entities"]]
-                    
-                    await bot.send_media_group(chat_id=group, media=media_group, disable_notification=True)
-                elif data.get("media"):
-                    print(f"[LOG] Отправка медиа в {group}: {data['media']}")
-                    media_path = data["media"]
-                    if media_path.endswith(".jpg") or media_path.endswith(".png"):
-                        input_file = FSInputFile(media_path)
-                        await bot.send_photo(
-                            chat_id=group, 
-                            photo=input_file, 
-                            caption=data.get("message", ""), 
-                            caption_entities=[types.MessageEntity.model_validate(e) for e in data.get("caption_entities", [])] if data.get("caption_entities") else None,
-                            disable_notification=True
-                        )
-                    elif media_path.endswith(".mp4") or media_path.endswith(".mov") or media_path.endswith(".m4v"):
-                        input_file = FSInputFile(media_path)
-                        await bot.send_video(
-                            chat_id=group,
-                            video=input_file,
-                            caption=data.get("message", ""),
-                            caption_entities=[types.MessageEntity.model_validate(e) for e in data.get("caption_entities", [])] if data.get("caption_entities") else None,
-                            disable_notification=True
-                        )
-                    else:
-                        input_file = FSInputFile(media_path)
-                        await bot.send_document(
-                            chat_id=group, 
-                            document=input_file, 
-                            caption=data.get("message", ""), 
-                            caption_entities=[types.MessageEntity.model_validate(e) for e in data.get("caption_entities", [])] if data.get("caption_entities") else None,
-                            disable_notification=True
-                        )
-                elif data.get("message"):
-                    print(f"[LOG] Отправка текста в {group}: {data['message']}")
-                    await bot.send_message(
-                        chat_id=group, 
-                        text=data["message"], 
-                        entities=[types.MessageEntity.model_validate(e) for e in data.get("entities", [])] if data.get("entities") else None, 
-                        parse_mode=None,
-                        disable_notification=True,  # Отключаем уведомления
-                        disable_web_page_preview=True  # Отключаем превью ссылок
-                    )
-                else:
-                    print(f"[WARN] Нет данных для отправки в {group}")
-            except Exception as e:
-                print(f"[ERROR] Не удалось отправить сообщение по задержке в {group}: {e}")
-        delays = [data.get("delay", 60) for data in config.get("chats", {}).values()]
-        delay = min(delays) if delays else 60
-        print(f"[LOG] Ждём {delay} секунд до следующей рассылки")
-        await asyncio.sleep(delay)
+        # Отправляем только тем группам, у которых подошёл их собственный срок
+        sent_at = time.monotonic()
+        # Группа, чья прошлая отправка ещё идёт, встанет в очередь по её завершении
+        due = [(group, config["chats"][group]) for group in delay_queue.pop_due(sent_at)
+               if group in config.get("chats", {}) and group not in delay_in_flight]
+        if outbox is not None:
+            for group, data in due:
+                # Пока прошлая отправка группы не выполнена, новую не ставим
+                await enqueue_send("delay", group, group, data, coalesce=True)
+                delay_queue.reschedule(group, data, sent_at)
+            await delay_queue.wait()
+            continue
+        if due:
+            delay_in_flight.update(group for group, _ in due)
+            start_send_task(send_delay_batch(due, sent_at))
+        await delay_queue.wait()
+
+
+async def send_delay_batch(due, sent_at):
+    """Отправляет пачку групп режима задержки.
+
+    Группа возвращается в очередь сразу после своей отправки: медленная или
+    зависшая отправка в одну группу не сдвигает сроки остальных.
+    """
+    def finished(result):
+        group, _ = result.target
+        delay_in_flight.discard(group)
+        # Задержку берём из текущего конфига: её могли изменить, пока шла отправка
+        data = load_config().get("chats", {}).get(group)
+        if data is not None:
+            delay_queue.reschedule(group, data, sent_at)
+
+    throttled_before = rate_limiter.stats["throttled_seconds"]
+    try:
+        await fan_out(due, lambda item: send_delay_message(*item), timeout=SEND_TIMEOUT,
+                      semaphore=delay_slots, on_result=finished)
+    finally:
+        delay_in_flight.difference_update(group for group, _ in due)
+    log_throttling("delay_broadcast_loop", len(due), throttled_before)
+    metrics.DELAY_CYCLE.observe(time.monotonic() - sent_at)
+
+async def media_gc_loop():
+    media_collector.rebuild(load_config())
+    while True:
+        await asyncio.sleep(MEDIA_GC_INTERVAL)
+        try:
+            _, reclaimed = media_collector.sweep()
+            metrics.MEDIA_RECLAIMED.inc(reclaimed)
+        except Exception as e:
+            logger.error("Очистка медиа не удалась: %s", e)
+
+# Бота повысили, понизили или удалили из группы — обновляем кэш статуса
+@dp.my_chat_member()
+async def on_my_chat_member(update: types.ChatMemberUpdated):
+    admin_status.on_my_chat_member(update)
 
 # --- Запуск фоновых задач при старте ---
 async def main():
     global schedule_broadcast_task, delay_broadcast_task
-    print("[LOG] main() стартует")
+    logger.info("main() стартует")
     await set_bot_commands()
-    print("[LOG] set_bot_commands выполнен")
+    logger.info("set_bot_commands выполнен")
     # Запуск фоновых задач
     schedule_broadcast_task = asyncio.create_task(schedule_broadcast_loop())
-    print("[LOG] schedule_broadcast_loop запущен")
+    logger.info("schedule_broadcast_loop запущен")
     delay_broadcast_task = asyncio.create_task(delay_broadcast_loop())
-    print("[LOG] delay_broadcast_loop запущен")
-    await dp.start_polling(bot)
-    print("[LOG] dp.start_polling завершён")
+    logger.info("delay_broadcast_loop запущен")
+    asyncio.create_task(media_gc_loop())
+    workers = []
+    if outbox is not None:
+        # Процессы-отправители наследуют окружение (токен, OUTBOX_PATH, лимиты)
+        worker_script = os.path.join(os.path.dirname(os.path.abspath(__file__)), "sender_worker.py")
+        for _ in range(SENDER_WORKERS):
+            workers.append(await asyncio.create_subprocess_exec(sys.executable, worker_script,
+                                                                env={**os.environ, "OUTBOX_PATH": OUTBOX_PATH}))
+        logger.info("Режим outbox: запущено отправителей %s", len(workers))
+    metrics_runner = await metrics.start_metrics_server(METRICS_PORT, METRICS_HOST) if METRICS_PORT else None
+    try:
+        if BOT_MODE == 'webhook':
+            from webhook import run_webhook
+            await run_webhook(dp, bot, WEBHOOK_URL, WEBHOOK_HOST, WEBHOOK_PORT, WEBHOOK_SECRET, WEBHOOK_CERT)
+        else:
+            # Если раньше работали через webhook, getUpdates без его снятия не работает
+            await bot.delete_webhook()
+            await dp.start_polling(bot)
+    finally:
+        # Дописываем отложенные изменения конфига перед выходом
+        config_store.flush()
+        if send_journal is not None:
+            send_journal.close()
+        if metrics_runner:
+            await metrics_runner.cleanup()
+        for worker in workers:
+            with suppress(ProcessLookupError):
+                worker.terminate()
+            await worker.wait()
+    logger.info("Приём апдейтов (%s) завершён", BOT_MODE)
 
 # --- Главное меню ---
 main_menu = ReplyKeyboardMarkup(
@@ -1041,12 +1145,93 @@ spam_menu = ReplyKeyboardMarkup(
     resize_keyboard=True
 )
 
+# --- Сводка метрик для владельца ---
+@dp.message(Command("metrics"))
+@private_chat_only
+@owner_only
+async def cmd_metrics(message: Message):
+    text = metrics.format_summary()
+    if outbox is not None:
+        counts = await outbox_call(outbox.counts)
+        text += "\n\n<b>📮 Очередь отправок</b>\n" + ", ".join(f"{status}: {count}" for status, count in counts.items())
+        for chat, kind, error, _ in await outbox_call(outbox.recent_failures, 5):
+            text += f"\n  {chat} ({kind}): {html.escape(error or '')[:100]}"
+    await message.answer(text, parse_mode="HTML")
+
+# --- Импорт и экспорт групп и расписания документом ---
+@dp.message(Command("import"))
+@private_chat_only
+@owner_only
+async def cmd_import(message: Message, state: FSMContext):
+    await state.set_state(ImportStates.waiting_for_document)
+    await message.answer(
+        "<b>Отправьте файл .csv или .jsonl</b>\n"
+        "<i>CSV: колонки kind,chat,delay,time,message; kind — group (группа, задержка и сообщение режима задержки) "
+        "или schedule (запись расписания). JSON Lines — те же поля, по объекту на строку, как в /export. "
+        "Изменения применяются, только если в файле нет ошибок.</i>",
+        parse_mode="HTML"
+    )
+
+@dp.message(ImportStates.waiting_for_document)
+@owner_only
+async def handle_import_document(message: Message, state: FSMContext):
+    await log_fsm(state, message)
+    if message.text == "🔙 Назад":
+        await state.clear()
+        return await message.answer("<b> 🔽 Выберите действие: </b>", parse_mode="HTML", reply_markup=main_menu)
+    fmt = document_format(message.document.file_name) if message.document else None
+    if fmt is None:
+        return await message.answer("<i> ♦️ Нужен документ .csv или .jsonl </i>", parse_mode="HTML")
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = os.path.join(tmp_dir, "import")
+        try:
+            await bot.download(message.document, destination=path)
+        except Exception as e:
+            logger.error("Не удалось скачать файл импорта %s: %s", message.document.file_name, e)
+            return await message.answer(f"<i> ♦️ Не удалось скачать файл: {html.escape(str(e))} </i>", parse_mode="HTML")
+        # Документ проверяется построчно по индексу, построенному один раз
+        plan = BulkImport(load_config(), normalize_rule)
+        try:
+            with open(path, encoding="utf-8-sig", newline="") as f:
+                for line_no, record in read_records(f, fmt):
+                    plan.add(line_no, record)
+        except UnicodeDecodeError:
+            return await message.answer("<i> ♦️ Файл должен быть в кодировке UTF-8 </i>", parse_mode="HTML")
+        except DocumentError as e:
+            plan.errors.append((e.line_no, str(e)))
+    summary = html.escape(plan.summary())
+    if plan.errors:
+        return await message.answer(
+            f"<b>♦️ Ничего не применено: в файле есть ошибки</b>\n<pre>{summary}</pre>\n"
+            "<i>Исправьте файл и отправьте снова.</i>", parse_mode="HTML")
+    added, updated = plan.changes()
+    # Все изменения — одной записью конфига
+    config_store.import_bulk({**added, **updated}, plan.entries)
+    logger.info("Импорт из %s: %s", message.document.file_name, plan.summary().replace("\n", "; "))
+    await state.clear()
+    await message.answer(f"<b>🔸 Импорт выполнен</b>\n<pre>{summary}</pre>", parse_mode="HTML", reply_markup=main_menu)
+
+@dp.message(Command("export"))
+@private_chat_only
+@owner_only
+async def cmd_export(message: Message, command: CommandObject):
+    fmt = (command.args or "jsonl").strip().lower()
+    if fmt not in FORMATS:
+        return await message.answer("<i>Формат: /export jsonl (по умолчанию, со всеми полями) или /export csv (только текст)</i>", parse_mode="HTML")
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = os.path.join(tmp_dir, f"export.{fmt}")
+        # Записи пишутся в файл по мере обхода конфига, без сборки документа в памяти
+        with open(path, "w", encoding="utf-8", newline="") as f:
+            count = write_document(export_records(load_config()), f, fmt)
+        filename = f"export-{datetime.datetime.now():%Y%m%d-%H%M%S}.{fmt}"
+        await message.answer_document(FSInputFile(path, filename=filename), caption=f"Записей: {count}")
+
 # --- Обработчик для /start ---
 @dp.message(CommandStart())
 @private_chat_only
 @owner_only
 async def cmd_start(message: Message, state: FSMContext):
-    print(f"[FSM] Состояние: {await state.get_state()}, message: {message.text}")
+    await log_fsm(state, message)
     await state.clear()
     await message.answer(
         "<b>🔽 Выберите действие:</b>",
@@ -1103,8 +1288,7 @@ async def btn_schedule(message: Message, state: FSMContext):
     config = load_config()
     if not config["chats"] and (not config.get("scheduled") or not config["scheduled"]):
         # Останавливаем рассылку по расписанию
-        config["schedule_active"] = False
-        save_config(config)
+        config_store.set_flag("schedule_active", False)
         await message.answer("<i>🔶 Список групп пуст. Рассылка по расписанию остановлена.</i>", parse_mode="HTML")
         return
     await state.update_data(last_menu='schedule')
@@ -1118,36 +1302,48 @@ async def btn_schedule(message: Message, state: FSMContext):
 
 @dp.callback_query(F.data.startswith("schedule:"))
 async def schedule_group_selected(callback: types.CallbackQuery, state: FSMContext):
-    print(f"[CALLBACK] schedule: from_user={callback.from_user.id}, data={callback.data}, state={await state.get_state()}")
+    await log_callback("schedule", callback, state)
     chat = callback.data.split("schedule:")[1]
     await state.update_data(selected_group=chat)
-    await callback.message.answer("<b> Введите время отправки сообщения в формате ЧЧ:ММ:СС (например, 15:30:25): </b>" , parse_mode="HTML")
+    await callback.message.answer(f"<b> Введите время отправки сообщения в формате ЧЧ:ММ:СС (например, 15:30:25) или правило повторения: </b>\n<i>{html.escape(RULE_HELP)}</i>" , parse_mode="HTML")
     await state.set_state(ScheduleStates.waiting_for_time)
     await callback.answer()
 
+def has_scheduled_time(chat, scheduled_time):
+    """Есть ли у группы запись на то же правило (scheduled_time — из normalize_rule)."""
+    for entry in load_config().get("scheduled", {}).get(chat, []):
+        # Старые записи могли сохраниться не в канонической форме ("9:00:00")
+        try:
+            stored = normalize_rule(str(entry.get("time") or ""))
+        except ValueError:
+            stored = entry.get("time")
+        if stored == scheduled_time:
+            return True
+    return False
+
 @dp.message(ScheduleStates.waiting_for_time)
 @owner_only
 async def schedule_input_time(message: Message, state: FSMContext):
-    print(f"[FSM] Состояние: {await state.get_state()}, message: {message.text}")
-    import re
-    time_pattern = r"^([01]?\d|2[0-3]):[0-5]\d:[0-5]\d$"
-    if not re.match(time_pattern, message.text):
-        return await message.answer("<i> Введите корректное время в формате ЧЧ:ММ:СС </i>", parse_mode="HTML")
-    await state.update_data(scheduled_time=message.text)
+    await log_fsm(state, message)
+    try:
+        scheduled_time = normalize_rule(message.text or "")
+    except ValueError as e:
+        return await message.answer(f"<i> Некорректное правило ({html.escape(str(e))}). Формат: {html.escape(RULE_HELP)} </i>", parse_mode="HTML")
+    await state.update_data(scheduled_time=scheduled_time)
     await message.answer("<b>Отправьте сообщение для рассылки (текст, медиа, текст+медиа):</b>",parse_mode="HTML")
     await state.set_state(ScheduleStates.waiting_for_scheduled_message)
 
 @dp.message(ScheduleStates.waiting_for_scheduled_message)
 @owner_only
 async def schedule_input_message(message: Message, state: FSMContext):
-    print(f"[FSM] Состояние: {await state.get_state()}, message: {message.text}")
+    await log_fsm(state, message)
     if not (message.text or message.photo or message.document or message.video):
         await message.answer("<i> ♦️ Не удалось распознать сообщение. Отправьте текст или медиа. </i> ", parse_mode="HTML",)
         return
     
     # Если это медиа-группа, переключаемся на специальный обработчик
     if message.media_group_id:
-        print(f"[DEBUG] Обнаружена медиа-группа: {message.media_group_id}")
+        logger.debug("Обнаружена медиа-группа: %s", message.media_group_id)
         await state.set_state(ScheduleStates.collecting_media_group)
         # Обрабатываем первое сообщение медиа-группы
         await handle_media_group(message, state)
@@ -1156,57 +1352,24 @@ async def schedule_input_message(message: Message, state: FSMContext):
     data = await state.get_data()
     chat = data["selected_group"]
     scheduled_time = data["scheduled_time"]
-    config = load_config()
     # Проверка на дублирование времени
-    if "scheduled" in config and chat in config["scheduled"]:
-        for entry in config["scheduled"][chat]:
-            if entry["time"] == scheduled_time:
-                await message.answer(
-                    f"<i> ♦️ На {scheduled_time} уже запланировано сообщение для этой группы. Выберите другое время. </i>",
-                    parse_mode="HTML"
-                )
-                await message.answer(
-                    "<b>Введите время отправки сообщения в формате ЧЧ:ММ:СС (например, 15:30:25):</b>",
-                    parse_mode="HTML"
-                )
-                await state.set_state(ScheduleStates.waiting_for_time)
-                return
+    if has_scheduled_time(chat, scheduled_time):
+        await message.answer(
+            f"<i> ♦️ На {scheduled_time} уже запланировано сообщение для этой группы. Выберите другое время. </i>",
+            parse_mode="HTML"
+        )
+        await message.answer(
+            "<b>Введите время отправки сообщения в формате ЧЧ:ММ:СС (например, 15:30:25) или правило повторения:</b>",
+            parse_mode="HTML"
+        )
+        await state.set_state(ScheduleStates.waiting_for_time)
+        return
     # Сохраняем текст и/или медиа
     entry = {"time": scheduled_time}
-    if message.photo:
-        photo = message.photo[-1]
-        file = await bot.get_file(photo.file_id)
-        file_path = f"media/{photo.file_unique_id}.jpg"
-        os.makedirs("media", exist_ok=True)
-        await bot.download_file(file.file_path, destination=file_path)
-        entry["media"] = file_path
-        entry["message"] = message.caption or ""
-        entry["caption_entities"] = [e.model_dump() for e in message.caption_entities] if message.caption_entities else None
-    elif message.document:
-        file_id = message.document.file_id
-        entry["media"] = file_id
-        entry["message"] = message.caption or ""
-        entry["caption_entities"] = [e.model_dump() for e in message.caption_entities] if message.caption_entities else None
-    elif message.video:
-        video = message.video
-        file = await bot.get_file(video.file_id)
-        file_path = f"media/{video.file_unique_id}.mp4"
-        os.makedirs("media", exist_ok=True)
-        await bot.download_file(file.file_path, destination=file_path)
-        entry["media"] = file_path
-        entry["message"] = message.caption or ""
-        entry["caption_entities"] = [e.model_dump() for e in message.caption_entities] if message.caption_entities else None
-    elif message.text:
-        entry["message"] = message.text
-        entry["entities"] = [e.model_dump() for e in message.entities] if message.entities else None
+    entry.update(await capture_content(media_store, message))
     # Сохраняем в config
-    if "scheduled" not in config:
-        config["scheduled"] = {}
-    if chat not in config["scheduled"]:
-        config["scheduled"][chat] = []
-    config["scheduled"][chat].append(entry)
-    save_config(config)
-    await message.answer(f"<i>🔸 Сообщение по расписанию для {chat} добавлено на {scheduled_time} </i>", parse_mode="HTML")
+    entry = config_store.add_scheduled(chat, entry)
+    await message.answer(f"<i>🔸 Сообщение по расписанию для {chat} добавлено на {scheduled_time} </i>{burst_note(entry)}", parse_mode="HTML")
     await state.clear()
     await message.answer("<b> 🔽 Выберите действие: </b>", parse_mode="HTML", reply_markup=main_menu)
 
@@ -1215,82 +1378,48 @@ async def schedule_input_message(message: Message, state: FSMContext):
 @owner_only
 async def handle_media_group(message: Message, state: FSMContext):
     """Обработка медиа-групп для расписания"""
-    print(f"[FSM] Обработка медиа-группы: {message.media_group_id}")
-    
-    data = await state.get_data()
-    chat = data["selected_group"]
-    scheduled_time = data["scheduled_time"]
-    config = load_config()
-    
-    # Проверяем, есть ли уже запись с таким временем
-    if "scheduled" in config and chat in config["scheduled"]:
-        for entry in config["scheduled"][chat]:
-            if entry["time"] == scheduled_time:
-                await message.answer(
-                    f"<i> ♦️ На {scheduled_time} уже запланировано сообщение для этой группы. Выберите другое время. </i>",
-                    parse_mode="HTML"
-                )
-                await message.answer(
-                    "<b>Введите время отправки сообщения в формате ЧЧ:ММ:СС (например, 15:30:25):</b>",
-                    parse_mode="HTML"
-                )
-                await state.set_state(ScheduleStates.waiting_for_time)
-                return
-    
-    # Собираем медиа-группу
-    media_group_id = message.media_group_id
-    if media_group_id not in data.get("media_groups", {}):
-        data["media_groups"] = {media_group_id: []}
-        await state.update_data(media_groups=data["media_groups"])
-    
-    # Добавляем текущее медиа в группу
-    media_item = {}
-    if message.photo:
-        photo = message.photo[-1]
-        file = await bot.get_file(photo.file_id)
-        file_path = f"media/{photo.file_unique_id}.jpg"
-        os.makedirs("media", exist_ok=True)
-        await bot.download_file(file.file_path, destination=file_path)
-        media_item = {"type": "photo", "file_path": file_path}
-    elif message.video:
-        video = message.video
-        file = await bot.get_file(video.file_id)
-        file_path = f"media/{video.file_unique_id}.mp4"
-        os.makedirs("media", exist_ok=True)
-        await bot.download_file(file.file_path, destination=file_path)
-        media_item = {"type": "video", "file_path": file_path}
-    elif message.document:
-        file_id = message.document.file_id
-        media_item = {"type": "document", "file_id": file_id}
-    
-    if media_item:
-        data["media_groups"][media_group_id].append(media_item)
-        await state.update_data(media_groups=data["media_groups"])
-    
-    # Если это последнее сообщение в группе (нет caption или это текстовое сообщение)
-    if message.caption or (message.text and not message.photo and not message.video and not message.document):
-        # Сохраняем медиа-группу
-        entry = {
-            "time": scheduled_time,
-            "media_group": data["media_groups"][media_group_id],
-            "message": message.caption or message.text or "",
-            "caption_entities": [e.model_dump() for e in message.caption_entities] if message.caption_entities else None,
-            "entities": [e.model_dump() for e in message.entities] if message.entities else None
-        }
-        print(f"[DEBUG] Сохраняем медиа-группу: {entry}")
+    logger.debug("[FSM] Обработка медиа-группы: %s", message.media_group_id)
+
+    async def prepare():
+        # Один раз на альбом: данные FSM и проверка времени — до загрузки элементов
+        data = await state.get_data()
+        chat, scheduled_time = data["selected_group"], data["scheduled_time"]
+        return chat, scheduled_time, has_scheduled_time(chat, scheduled_time)
+
+    def capture(context):
+        # На занятое время альбом не сохраняется — и элементы не скачиваются
+        return None if context[2] else capture_item(media_store, message)
+
+    async def save_album(items, caption_message, context):
+        chat, scheduled_time, duplicate = context
+        if duplicate:
+            await message.answer(
+                f"<i> ♦️ На {scheduled_time} уже запланировано сообщение для этой группы. Выберите другое время. </i>",
+                parse_mode="HTML"
+            )
+            await message.answer(
+                "<b>Введите время отправки сообщения в формате ЧЧ:ММ:СС (например, 15:30:25) или правило повторения:</b>",
+                parse_mode="HTML"
+            )
+            await state.set_state(ScheduleStates.waiting_for_time)
+            return
+        if not items:
+            await message.answer("<i> ♦️ Не удалось сохранить медиа-группу. Попробуйте ещё раз.</i>", parse_mode="HTML")
+            await state.set_state(ScheduleStates.waiting_for_scheduled_message)
+            return
+        entry = {"time": scheduled_time}
+        entry.update(album_content(items, caption_message))
+        dump_log.debug("Сохраняем медиа-группу: %s", entry)
         
         # Сохраняем в config
-        if "scheduled" not in config:
-            config["scheduled"] = {}
-        if chat not in config["scheduled"]:
-            config["scheduled"][chat] = []
-        config["scheduled"][chat].append(entry)
-        save_config(config)
+        entry = config_store.add_scheduled(chat, entry)
         
-        await message.answer(f"<i>🔸 Медиа-группа по расписанию для {chat} добавлена на {scheduled_time} </i>", parse_mode="HTML")
+        await message.answer(f"<i>🔸 Медиа-группа по расписанию для {chat} добавлена на {scheduled_time} </i>{burst_note(entry)}", parse_mode="HTML")
         await state.clear()
         await message.answer("<b> 🔽 Выберите действие: </b>", parse_mode="HTML", reply_markup=main_menu)
 
+    media_groups.add(message, capture, save_album, prepare)
+
 @dp.message(F.text == "⏳ По задержке")
 @private_chat_only
 @owner_only
@@ -1298,8 +1427,7 @@ async def btn_spam_menu(message: Message, state: FSMContext):
     config = load_config()
     if not config["chats"]:
         # Останавливаем рассылку по задержке
-        config["active"] = False
-        save_config(config)
+        config_store.set_flag("active", False)
         await message.answer("<i>🔶 Список групп пуст. Рассылка по задержке остановлена.</i>", parse_mode="HTML")
         return
     await state.clear()
@@ -1317,8 +1445,7 @@ async def btn_launch_spam(message: Message):
     if config.get("active", False):
         await message.answer("<i>Рассылка по задержке уже запущена.</i>", parse_mode="HTML", reply_markup=spam_menu)
         return
-    config["active"] = True
-    save_config(config)
+    config_store.set_flag("active", True)
     await message.answer("<b>🟢 Рассылка по задержке запущена.</b>", parse_mode="HTML", reply_markup=spam_menu)
 
 @dp.message(F.text == "🔴 Cтоп")
@@ -1329,15 +1456,14 @@ async def btn_stop_spam(message: Message):
     if not config.get("active", False):
         await message.answer("<i>Рассылка по задержке уже остановлена.</i>", parse_mode="HTML", reply_markup=spam_menu)
         return
-    config["active"] = False
-    save_config(config)
+    config_store.set_flag("active", False)
     await message.answer("<b>🔴️ Рассылка по задержке остановлена.</b>", parse_mode="HTML", reply_markup=spam_menu)
 
 @dp.message(F.text == "🗑️ Удалить запись")
 @private_chat_only
 @owner_only
 async def delete_schedule_entry_start(message: Message, state: FSMContext):
-    print(f"[FSM] Состояние: {await state.get_state()}, message: {message.text}")
+    await log_fsm(state, message)
     config = load_config()
     groups = list(config.get("scheduled", {}).keys())
     if not groups:
@@ -1351,7 +1477,7 @@ async def delete_schedule_entry_start(message: Message, state: FSMContext):
 
 @dp.callback_query(F.data.startswith("delete_schedule_group:"), DeleteScheduleStates.waiting_for_group)
 async def delete_schedule_group_selected(callback: types.CallbackQuery, state: FSMContext):
-    print(f"[CALLBACK] delete_schedule_group: from_user={callback.from_user.id}, data={callback.data}, state={await state.get_state()}")
+    await log_callback("delete_schedule_group", callback, state)
     group = callback.data.split(":", 1)[1]
     config = load_config()
     entries = config.get("scheduled", {}).get(group, [])
@@ -1364,8 +1490,8 @@ async def delete_schedule_group_selected(callback: types.CallbackQuery, state: F
     entries_sorted = sorted(entries, key=lambda x: x.get("time", "00:00:00"))
     keyboard = InlineKeyboardMarkup(
         inline_keyboard=[
-            [InlineKeyboardButton(text=f"{entry['time']} | {entry.get('message', '')[:20]}", callback_data=f"delete_schedule_entry:{i}")]
-            for i, entry in enumerate(entries_sorted)
+            [InlineKeyboardButton(text=f"{entry['time']} | {entry.get('message', '')[:20]}", callback_data=f"delete_schedule_entry:{entry['id']}")]
+            for entry in entries_sorted
         ] + [[InlineKeyboardButton(text="🔙 Назад", callback_data="delete_schedule_back")]]
     )
     await callback.message.answer("<b> Выберите запись для удаления: </b>", reply_markup=keyboard, parse_mode="HTML")
@@ -1374,15 +1500,14 @@ async def delete_schedule_group_selected(callback: types.CallbackQuery, state: F
 
 @dp.callback_query(F.data.startswith("delete_schedule_entry:"), DeleteScheduleStates.waiting_for_entry)
 async def delete_schedule_entry_selected(callback: types.CallbackQuery, state: FSMContext):
-    print(f"[CALLBACK] delete_schedule_entry: from_user={callback.from_user.id}, data={callback.data}, state={await state.get_state()}")
-    idx = int(callback.data.split(":", 1)[1])
+    await log_callback("delete_schedule_entry", callback, state)
+    entry_id = int(callback.data.split(":", 1)[1])
     data = await state.get_data()
     group = data["selected_group"]
+    removed = config_store.remove_scheduled(group, entry_id)
     config = load_config()
     entries = config.get("scheduled", {}).get(group, [])
-    if 0 <= idx < len(entries):
-        removed = entries.pop(idx)
-        save_config(config)
+    if removed:
         await callback.message.answer(f"<i>♦️ Удалена запись на {removed['time']}</i>", parse_mode="HTML")
     # После удаления — если остались записи, снова показываем выбор, иначе возвращаем к выбору группы
     if entries:
@@ -1390,8 +1515,8 @@ async def delete_schedule_entry_selected(callback: types.CallbackQuery, state: F
         entries_sorted = sorted(entries, key=lambda x: x.get("time", "00:00:00"))
         keyboard = InlineKeyboardMarkup(
             inline_keyboard=[
-                [InlineKeyboardButton(text=f"{entry['time']} | {entry.get('message', '')[:20]}", callback_data=f"delete_schedule_entry:{i}")]
-                for i, entry in enumerate(entries_sorted)
+                [InlineKeyboardButton(text=f"{entry['time']} | {entry.get('message', '')[:20]}", callback_data=f"delete_schedule_entry:{entry['id']}")]
+                for entry in entries_sorted
             ] + [[InlineKeyboardButton(text="🔙 Назад", callback_data="delete_schedule_back")]]
         )
         await callback.message.answer("<b> Выберите запись для удаления: </b>", reply_markup=keyboard, parse_mode="HTML")
@@ -1410,7 +1535,7 @@ async def delete_schedule_entry_selected(callback: types.CallbackQuery, state: F
 
 @dp.callback_query(F.data == "delete_schedule_back", DeleteScheduleStates.waiting_for_entry)
 async def delete_schedule_back_to_group(callback: types.CallbackQuery, state: FSMContext):
-    print(f"[CALLBACK] delete_schedule_back: from_user={callback.from_user.id}, data={callback.data}, state={await state.get_state()}")
+    await log_callback("delete_schedule_back", callback, state)
     config = load_config()
     groups = list(config.get("scheduled", {}).keys())
     if not groups:
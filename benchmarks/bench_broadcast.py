@@ -0,0 +1,301 @@
+"""Пропускная способность рассылки против локальной заглушки Bot API.
+
+В отдельном процессе поднимается aiohttp-сервер вместо api.telegram.org
+с настраиваемой задержкой ответа, долей 429 (RetryAfter) и долей ошибок.
+Бот (admin_bot) направляется на него через TELEGRAM_API_URL, конфиг с N
+группами и M записями расписания генерируется во временном каталоге
+(CONFIG_PATH), после чего delay_broadcast_loop и/или
+schedule_broadcast_loop работают заданное число секунд.
+
+Результат — сообщений в секунду, p50/p99 длительности запроса, CPU и RSS
+процесса бота — печатается и сохраняется в JSON для сравнения прогонов.
+
+    python benchmarks/bench_broadcast.py --chats 200 --scheduled 500 --duration 30 \\
+        --latency 80 --rate-429 0.01 --failure-rate 0.005
+"""
+import argparse
+import asyncio
+import datetime
+import json
+import multiprocessing
+import os
+import random
+import resource
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+BENCH_TOKEN = "123456:bench-token"
+
+
+# -----------------------------------
+# Заглушка Bot API (отдельный процесс)
+# -----------------------------------
+
+def run_fake_api(port, latency, jitter, rate_429, retry_after, failure_rate, seed):
+    from aiohttp import web
+
+    rng = random.Random(seed)
+    stats = {"requests": {}, "ok": 0, "injected_429": 0, "injected_failures": 0}
+    message_ids = iter(range(1, 1 << 62))
+    bot_user = {"id": 123456, "is_bot": True, "first_name": "bench", "username": "bench_bot"}
+
+    def chat_for(chat_id):
+        chat_id = str(chat_id)
+        numeric = -1000000000000 - (abs(hash(chat_id)) % 10 ** 9) if chat_id.startswith("@") else int(chat_id)
+        chat = {"id": numeric, "type": "supergroup", "title": chat_id}
+        if chat_id.startswith("@"):
+            chat["username"] = chat_id[1:]
+        return chat
+
+    def message(params, **fields):
+        return {"message_id": next(message_ids), "date": int(time.time()), "chat": chat_for(params.get("chat_id", 0)), **fields}
+
+    def result_for(method, params):
+        if method == "getMe":
+            return bot_user
+        if method == "getChatMember":
+            return {"status": "creator", "user": bot_user, "is_anonymous": False}
+        if method == "sendMessage":
+            return message(params, text=params.get("text", ""))
+        if method == "sendPhoto":
+            return message(params, photo=[{"file_id": f"photo{rng.random()}", "file_unique_id": "u", "width": 1, "height": 1}])
+        if method == "sendVideo":
+            return message(params, video={"file_id": f"video{rng.random()}", "file_unique_id": "u", "width": 1, "height": 1, "duration": 1})
+        if method == "sendDocument":
+            return message(params, document={"file_id": f"doc{rng.random()}", "file_unique_id": "u"})
+        if method == "sendMediaGroup":
+            media = json.loads(params.get("media", "[]"))
+            return [message(params, photo=[{"file_id": f"photo{rng.random()}", "file_unique_id": "u", "width": 1, "height": 1}])
+                    for _ in media]
+        return True
+
+    async def handle(request):
+        method = request.match_info["method"]
+        params = dict(await request.post())
+        stats["requests"][method] = stats["requests"].get(method, 0) + 1
+        await asyncio.sleep(max(0.0, rng.gauss(latency, jitter)))
+        if method.startswith("send"):
+            roll = rng.random()
+            if roll < rate_429:
+                stats["injected_429"] += 1
+                return web.json_response({"ok": False, "error_code": 429,
+                                          "description": f"Too Many Requests: retry after {retry_after}",
+                                          "parameters": {"retry_after": retry_after}}, status=429)
+            if roll < rate_429 + failure_rate:
+                stats["injected_failures"] += 1
+                return web.json_response({"ok": False, "error_code": 400, "description": "Bad Request: chat not found"}, status=400)
+            stats["ok"] += 1
+        return web.json_response({"ok": True, "result": result_for(method, params)})
+
+    async def handle_stats(request):
+        return web.json_response(stats)
+
+    app = web.Application(client_max_size=64 * 1024 * 1024)
+    app.router.add_get("/_stats", handle_stats)
+    app.router.add_post("/bot{token}/{method}", handle)
+    web.run_app(app, host="127.0.0.1", port=port, print=None, handle_signals=True)
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+async def wait_for_port(port, timeout=10):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            _, writer = await asyncio.open_connection("127.0.0.1", port)
+            writer.close()
+            return
+        except OSError:
+            await asyncio.sleep(0.05)
+    raise RuntimeError(f"заглушка Bot API не поднялась на порту {port}")
+
+
+async def fetch_stats(port):
+    from aiohttp import ClientSession
+
+    async with ClientSession() as session:
+        async with session.get(f"http://127.0.0.1:{port}/_stats") as response:
+            return await response.json()
+
+
+# -----------------------------------
+# Конфиг и прогон
+# -----------------------------------
+
+def make_config(chats, scheduled, delay, duration, start_in=2):
+    now = datetime.datetime.now()
+    groups = [f"@bench_group{i}" for i in range(chats)]
+    config = {
+        "chats": {group: {"message": f"Сообщение для {group}", "entities": None, "delay": delay} for group in groups},
+        "active": False,
+        "scheduled": {},
+        "schedule_active": False,
+    }
+    for i in range(scheduled):
+        fire = now + datetime.timedelta(seconds=start_in + duration * i / max(scheduled, 1))
+        config["scheduled"].setdefault(groups[i % len(groups)], []).append(
+            {"time": fire.strftime("%H:%M:%S"), "message": f"Запись {i}", "entities": None})
+    return config
+
+
+def percentile(values, q):
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=REPO_ROOT, text=True).strip()
+    except Exception:
+        return None
+
+
+async def run(args, port):
+    import admin_bot
+    from aiogram.client.session.middlewares.base import BaseRequestMiddleware
+
+    latencies = []
+
+    class LatencyRecorder(BaseRequestMiddleware):
+        # Регистрируется последним, то есть внутри RateLimitMiddleware: меряет только HTTP-запрос
+        async def __call__(self, make_request, bot, method):
+            start = time.perf_counter()
+            try:
+                return await make_request(bot, method)
+            finally:
+                if method.__api_method__.startswith("send"):
+                    latencies.append(time.perf_counter() - start)
+
+    admin_bot.bot.session.middleware(LatencyRecorder())
+    await wait_for_port(port)
+    if args.mode in ("delay", "both"):
+        admin_bot.config_store.set_flag("active", True)
+    if args.mode in ("schedule", "both"):
+        admin_bot.config_store.set_flag("schedule_active", True)
+
+    usage_before = resource.getrusage(resource.RUSAGE_SELF)
+    started = time.perf_counter()
+    tasks = []
+    if args.mode in ("delay", "both"):
+        tasks.append(asyncio.create_task(admin_bot.delay_broadcast_loop()))
+    if args.mode in ("schedule", "both"):
+        tasks.append(asyncio.create_task(admin_bot.schedule_broadcast_loop()))
+    await asyncio.sleep(args.duration)
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+    elapsed = time.perf_counter() - started
+    usage_after = resource.getrusage(resource.RUSAGE_SELF)
+
+    server = await fetch_stats(port)
+    admin_bot.config_store.flush()
+    await admin_bot.bot.session.close()
+
+    cpu = (usage_after.ru_utime - usage_before.ru_utime) + (usage_after.ru_stime - usage_before.ru_stime)
+    p50, p99 = percentile(latencies, 0.5), percentile(latencies, 0.99)
+    return {
+        "timestamp": datetime.datetime.now().isoformat(timespec="seconds"),
+        "commit": git_commit(),
+        "params": vars(args),
+        "elapsed_seconds": round(elapsed, 3),
+        "messages_sent": server["ok"],
+        "messages_per_sec": round(server["ok"] / elapsed, 2),
+        "send_requests": len(latencies),
+        "latency_p50_ms": round(p50 * 1000, 2) if p50 is not None else None,
+        "latency_p99_ms": round(p99 * 1000, 2) if p99 is not None else None,
+        "cpu_seconds": round(cpu, 3),
+        "cpu_percent": round(100 * cpu / elapsed, 1),
+        "rss_max_mb": round(usage_after.ru_maxrss / 1024, 1),
+        "api_requests": server["requests"],
+        "injected_429": server["injected_429"],
+        "injected_failures": server["injected_failures"],
+        "rate_limiter": dict(admin_bot.rate_limiter.stats),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--chats", type=int, default=100)
+    parser.add_argument("--scheduled", type=int, default=200)
+    parser.add_argument("--delay", type=int, default=5, help="задержка групп в режиме задержки, с")
+    parser.add_argument("--duration", type=float, default=20, help="длительность прогона, с")
+    parser.add_argument("--mode", choices=("delay", "schedule", "both"), default="both")
+    parser.add_argument("--latency", type=float, default=50, help="средняя задержка ответа заглушки, мс")
+    parser.add_argument("--jitter", type=float, default=20, help="разброс задержки, мс")
+    parser.add_argument("--rate-429", type=float, default=0.0, help="доля ответов 429")
+    parser.add_argument("--retry-after", type=int, default=1)
+    parser.add_argument("--failure-rate", type=float, default=0.0, help="доля ответов 400")
+    parser.add_argument("--concurrency", type=int, default=None, help="BROADCAST_CONCURRENCY")
+    parser.add_argument("--rate-global", type=float, default=None, help="RATE_GLOBAL_PER_SEC")
+    parser.add_argument("--rate-chat", type=float, default=None, help="RATE_CHAT_PER_SEC")
+    parser.add_argument("--rate-group", type=float, default=None, help="RATE_GROUP_PER_MIN")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--out", default=None, help="файл JSON (по умолчанию benchmarks/results/broadcast-<время>.json)")
+    args = parser.parse_args()
+
+    port = free_port()
+    server = multiprocessing.Process(
+        target=run_fake_api,
+        args=(port, args.latency / 1000, args.jitter / 1000, args.rate_429, args.retry_after, args.failure_rate, args.seed),
+        daemon=True,
+    )
+    server.start()
+
+    workdir = tempfile.mkdtemp(prefix="bench_broadcast_")
+    config_path = os.path.join(workdir, "config.json")
+    with open(config_path, "w", encoding="utf-8") as f:
+        json.dump(make_config(args.chats, args.scheduled, args.delay, args.duration), f, ensure_ascii=False)
+    os.environ.update({
+        "BOT_TOKEN": BENCH_TOKEN,
+        "OWNER_ID": "1",
+        "CONFIG_PATH": config_path,
+        # Журнал отправок, FSM и outbox — тоже во временном каталоге: иначе бенчмарк
+        # пишет в файлы рядом с ботом, а следующий прогон читает их отметки об отправке
+        "SEND_JOURNAL_PATH": os.path.join(workdir, "send_journal.log"),
+        "FSM_DB_PATH": os.path.join(workdir, "fsm.db"),
+        "OUTBOX_PATH": os.path.join(workdir, "outbox.db"),
+        "TELEGRAM_API_URL": f"http://127.0.0.1:{port}",
+        "STORAGE_BACKEND": "json",
+        "LOG_LEVEL": os.environ.get("LOG_LEVEL", "WARNING"),
+    })
+    for option, variable in (("concurrency", "BROADCAST_CONCURRENCY"), ("rate_global", "RATE_GLOBAL_PER_SEC"),
+                             ("rate_chat", "RATE_CHAT_PER_SEC"), ("rate_group", "RATE_GROUP_PER_MIN")):
+        if getattr(args, option) is not None:
+            os.environ[variable] = str(getattr(args, option))
+    # media/ и кэш file_id бота — во временном каталоге, а не в репозитории
+    os.chdir(workdir)
+
+    try:
+        report = asyncio.run(run(args, port))
+    finally:
+        server.terminate()
+        server.join()
+
+    out = args.out or os.path.join(REPO_ROOT, "benchmarks", "results",
+                                   f"broadcast-{datetime.datetime.now():%Y%m%d-%H%M%S}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(out)), exist_ok=True)
+    with open(out, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+
+    print(f"групп: {args.chats}, записей расписания: {args.scheduled}, режим: {args.mode}, {report['elapsed_seconds']} с")
+    print(f"отправлено: {report['messages_sent']} ({report['messages_per_sec']} сообщ./с)")
+    print(f"запрос send*: p50 {report['latency_p50_ms']} мс, p99 {report['latency_p99_ms']} мс")
+    print(f"CPU: {report['cpu_seconds']} с ({report['cpu_percent']}%), RSS max: {report['rss_max_mb']} МиБ")
+    print(f"429: {report['injected_429']}, ошибок: {report['injected_failures']}")
+    print(f"результат: {out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+"""Сколько записей config.json экономит отложенная запись.
+
+Имитирует поток отметок last_sent_date (по умолчанию 1000 записей в минуту)
+и сравнивает прежнюю схему "одна мутация — одна запись с indent=2" с
+ConfigStore, который склеивает изменения за окно flush_delay.
+
+    python benchmarks/bench_config_writes.py --entries 1000 --duration 60
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config_store import ConfigStore  # noqa: E402
+
+
+def make_config(groups, entries_per_group):
+    return {
+        "chats": {f"@group{g}": {"message": "текст " * 20, "delay": 60} for g in range(groups)},
+        "active": True,
+        "scheduled": {
+            f"@group{g}": [{"time": f"{(e // 60) % 24:02d}:{e % 60:02d}:00", "message": "текст " * 20} for e in range(entries_per_group)]
+            for g in range(groups)
+        },
+        "schedule_active": True,
+    }
+
+
+def legacy_run(path, config, entries):
+    start = time.perf_counter()
+    flat = [entry for group in config["scheduled"].values() for entry in group]
+    for i in range(entries):
+        flat[i % len(flat)]["last_sent_date"] = "2026-01-01"
+        with open(path, 'w') as f:
+            json.dump(config, f, indent=2)
+    return time.perf_counter() - start, entries, os.path.getsize(path)
+
+
+async def store_run(path, config, entries, duration, flush_delay):
+    store = ConfigStore(path, flush_delay=flush_delay)
+    store.save(config)
+    store.flush()
+    store.writes = store.save_requests = 0
+    flat = [entry for group in config["scheduled"].values() for entry in group]
+    interval = duration / entries
+    start = time.perf_counter()
+    for i in range(entries):
+        flat[i % len(flat)]["last_sent_date"] = "2026-01-02"
+        store.save()
+        await asyncio.sleep(interval)
+    store.flush()
+    return time.perf_counter() - start, store.writes, os.path.getsize(path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--groups", type=int, default=100)
+    parser.add_argument("--entries-per-group", type=int, default=10)
+    parser.add_argument("--entries", type=int, default=1000, help="сколько мутаций за прогон")
+    parser.add_argument("--duration", type=float, default=60.0, help="за сколько секунд их разбросать")
+    parser.add_argument("--flush-delay", type=float, default=0.5)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "config.json")
+        legacy_time, legacy_writes, legacy_size = legacy_run(path, make_config(args.groups, args.entries_per_group), args.entries)
+        wall, writes, size = asyncio.run(store_run(
+            path, make_config(args.groups, args.entries_per_group), args.entries, args.duration, args.flush_delay
+        ))
+
+    print(f"мутаций: {args.entries} за {args.duration:.0f} с, окно {args.flush_delay} с")
+    print(f"прежняя схема:  {legacy_writes} записей, размер файла {legacy_size} байт, время записи {legacy_time:.3f} с")
+    print(f"ConfigStore:    {writes} записей, размер файла {size} байт, прогон {wall:.3f} с")
+    print(f"сэкономлено записей: {legacy_writes - writes} ({(1 - writes / max(legacy_writes, 1)) * 100:.1f}%)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+"""Этап доставки: разбор контента на каждую отправку против PlanCache + PlanSender.
+
+Bot API заменён заглушкой без задержки, поэтому замер показывает только
+стоимость подготовки вызова: валидацию entities, выбор метода, проверку
+file_id. Контент — смесь текстов с разметкой, одиночных медиа и альбомов.
+
+    python benchmarks/bench_delivery.py --groups 200 --rounds 50
+"""
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from content import PlanCache, PlanSender, compile_plan  # noqa: E402
+from file_ids import FileIdCache  # noqa: E402
+
+
+def fake_message(index):
+    file_id = f"AgAC{index:08d}"
+    return SimpleNamespace(photo=[SimpleNamespace(file_id=file_id)], video=None, animation=None, document=None, audio=None)
+
+
+class StubBot:
+    def __init__(self):
+        self.calls = 0
+
+    async def _sent(self, count=1):
+        self.calls += 1
+        messages = [fake_message(self.calls * 10 + i) for i in range(count)]
+        return messages if count > 1 else messages[0]
+
+    async def send_message(self, **kwargs):
+        return await self._sent()
+
+    async def send_photo(self, **kwargs):
+        return await self._sent()
+
+    async def send_video(self, **kwargs):
+        return await self._sent()
+
+    async def send_document(self, **kwargs):
+        return await self._sent()
+
+    async def send_media_group(self, chat_id, media, **kwargs):
+        return await self._sent(len(media))
+
+
+def make_contents(groups, media_dir):
+    entities = [{"type": "bold", "offset": 0, "length": 5}, {"type": "text_link", "offset": 6, "length": 6, "url": "https://t.me/x"}]
+    photo = os.path.join(media_dir, "AQAD1.jpg")
+    video = os.path.join(media_dir, "AQAD2.mp4")
+    for path in (photo, video):
+        with open(path, "wb") as f:
+            f.write(os.urandom(4096))
+    contents = {}
+    for i in range(groups):
+        kind = i % 3
+        if kind == 0:
+            contents[f"@group{i}"] = {"message": "Акция сегодня", "entities": entities}
+        elif kind == 1:
+            contents[f"@group{i}"] = {"media": photo, "message": "Акция сегодня", "caption_entities": entities}
+        else:
+            contents[f"@group{i}"] = {
+                "media_group": [{"type": "photo", "file_path": photo}, {"type": "video", "file_path": video}],
+                "message": "Акция сегодня",
+                "caption_entities": entities,
+            }
+    return contents
+
+
+async def run(args):
+    with tempfile.TemporaryDirectory() as tmp:
+        contents = make_contents(args.groups, tmp)
+        sends = args.groups * args.rounds
+
+        bot = StubBot()
+        sender = PlanSender(bot, FileIdCache(os.path.join(tmp, "ids_a.json"), media_dir=tmp))
+        start = time.perf_counter()
+        for _ in range(args.rounds):
+            for chat, content in contents.items():
+                await sender.send(chat, compile_plan(content))
+        per_send = time.perf_counter() - start
+
+        bot = StubBot()
+        cache = PlanCache()
+        sender = PlanSender(bot, FileIdCache(os.path.join(tmp, "ids_b.json"), media_dir=tmp))
+        start = time.perf_counter()
+        for _ in range(args.rounds):
+            for chat, content in contents.items():
+                await sender.send(chat, cache.get(("chat", chat), content))
+        cached = time.perf_counter() - start
+
+    print(f"отправок: {sends} ({args.groups} групп x {args.rounds} кругов)")
+    print(f"разбор на каждую отправку: {per_send:.3f} с ({per_send / sends * 1e6:.1f} мкс/отправка)")
+    print(f"PlanCache:                 {cached:.3f} с ({cached / sends * 1e6:.1f} мкс/отправка), "
+          f"компиляций {cache.compiles}, попаданий {cache.hits}, ускорение x{per_send / cached:.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--groups", type=int, default=200)
+    parser.add_argument("--rounds", type=int, default=50)
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+"""Рассылка на 500 групп: последовательно против broadcast.fan_out.
+
+Bot API заменён заглушкой с задержкой ответа (по умолчанию 50–300 мс,
+у 1% запросов — медленная загрузка на 3 с), так что замер показывает
+только выигрыш от параллельности.
+
+    python benchmarks/bench_fanout.py --groups 500 --concurrency 20
+"""
+import argparse
+import asyncio
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from broadcast import fan_out  # noqa: E402
+
+
+class StubBot:
+    def __init__(self, min_latency, max_latency, slow_rate, slow_latency, seed):
+        self.random = random.Random(seed)
+        self.min_latency = min_latency
+        self.max_latency = max_latency
+        self.slow_rate = slow_rate
+        self.slow_latency = slow_latency
+        self.calls = 0
+
+    async def send_message(self, chat_id, text):
+        self.calls += 1
+        if self.random.random() < self.slow_rate:
+            await asyncio.sleep(self.slow_latency)
+        else:
+            await asyncio.sleep(self.random.uniform(self.min_latency, self.max_latency))
+
+
+async def run(args):
+    groups = [f"@group{i}" for i in range(args.groups)]
+
+    bot = StubBot(args.min_latency, args.max_latency, args.slow_rate, args.slow_latency, args.seed)
+    start = time.perf_counter()
+    for group in groups:
+        await bot.send_message(group, "текст")
+    sequential = time.perf_counter() - start
+
+    bot = StubBot(args.min_latency, args.max_latency, args.slow_rate, args.slow_latency, args.seed)
+    start = time.perf_counter()
+    results = await fan_out(groups, lambda group: bot.send_message(group, "текст"),
+                            concurrency=args.concurrency, timeout=args.timeout)
+    concurrent = time.perf_counter() - start
+    failed = sum(1 for r in results if not r.ok)
+
+    print(f"групп: {args.groups}, одновременно: {args.concurrency}")
+    print(f"последовательно: {sequential:.2f} с")
+    print(f"fan_out:         {concurrent:.2f} с (ошибок/таймаутов: {failed}), ускорение x{sequential / concurrent:.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--groups", type=int, default=500)
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--timeout", type=float, default=120)
+    parser.add_argument("--min-latency", type=float, default=0.05)
+    parser.add_argument("--max-latency", type=float, default=0.3)
+    parser.add_argument("--slow-rate", type=float, default=0.01)
+    parser.add_argument("--slow-latency", type=float, default=3.0)
+    parser.add_argument("--seed", type=int, default=1)
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+"""Стоимость логирования в одной итерации цикла рассылки: print() против logging.
+
+"До" — как было: дамп всего конфига при каждом load_config и полные
+словари данных группы на каждую отправку через print(). "После" — уровни,
+%-форматирование и QueueHandler из log_setup (уровень INFO, дампы
+выключены). Вывод в обоих случаях идёт во временный файл.
+
+    python benchmarks/bench_logging.py --groups 500 --iterations 50
+"""
+import argparse
+import logging
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from log_setup import DUMP_LOGGER, setup_logging, stop_logging  # noqa: E402
+
+
+def make_config(groups):
+    entities = [{"type": "bold", "offset": 0, "length": 5, "url": None, "user": None, "language": None}] * 3
+    return {
+        "active": True,
+        "schedule_active": True,
+        "chats": {
+            f"@group{i}": {"message": "Акция сегодня " * 20, "entities": entities, "delay": 600} for i in range(groups)
+        },
+        "scheduled": {},
+    }
+
+
+def iteration_print(config, out):
+    print(f"[LOG] Загружен config: {config}", file=out)
+    for group, data in config["chats"].items():
+        print(f"[LOG] Попытка отправки в {group}, data: {data}", file=out)
+        print(f"[LOG] Отправка текста в {group}: {data['message']}", file=out)
+
+
+def iteration_logging(config, logger, dump_log):
+    logger.info("Загружен config: %s групп", len(config["chats"]))
+    for group, data in config["chats"].items():
+        logger.debug("Попытка отправки в %s", group)
+        dump_log.debug("Данные группы %s: %s", group, data)
+        logger.debug("%s в %s: медиа %s", "send_message", group, 0)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--groups", type=int, default=500)
+    parser.add_argument("--iterations", type=int, default=50)
+    args = parser.parse_args()
+    config = make_config(args.groups)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "print.log")
+        with open(path, "w", encoding="utf-8") as out:
+            start = time.perf_counter()
+            for _ in range(args.iterations):
+                iteration_print(config, out)
+            before = (time.perf_counter() - start) / args.iterations
+        before_size = os.path.getsize(path)
+
+        path = os.path.join(tmp, "logging.log")
+        with open(path, "w", encoding="utf-8") as out:
+            setup_logging("INFO", dumps=False, stream=out)
+            logger, dump_log = logging.getLogger("bench"), logging.getLogger(DUMP_LOGGER)
+            start = time.perf_counter()
+            for _ in range(args.iterations):
+                iteration_logging(config, logger, dump_log)
+            after = (time.perf_counter() - start) / args.iterations
+            stop_logging()
+        after_size = os.path.getsize(path)
+
+    print(f"групп: {args.groups}, итераций: {args.iterations}")
+    print(f"print():  {before * 1000:.2f} мс на итерацию, {before_size / 1024:.0f} КиБ логов")
+    print(f"logging:  {after * 1000:.2f} мс на итерацию, {after_size / 1024:.0f} КиБ логов, ускорение x{before / after:.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+"""Расписание "каждые N минут": сотни записей-дубликатов против одного правила.
+
+Прогоняет ScheduleIndex через сутки модельного времени: в варианте
+"дубликаты" на каждый момент рассылки заведена отдельная ежедневная
+запись, в варианте "правило" — одна запись вида 00:00-23:59/Nм. Для
+каждого варианта печатается время перестроения индекса, размер кучи и
+время обработки всех срабатываний за сутки (pop_due + отметка об отправке).
+
+    python benchmarks/bench_recurrence.py --groups 50 --step 5
+"""
+import argparse
+import datetime
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from scheduler import ScheduleIndex, sent_mark  # noqa: E402
+
+
+def duplicated(groups, step):
+    scheduled, entry_id = {}, 0
+    for group in range(groups):
+        entries = scheduled[f"-100{group}"] = []
+        for minute in range(0, 24 * 60, step):
+            entry_id += 1
+            entries.append({"id": entry_id, "time": f"{minute // 60:02d}:{minute % 60:02d}:00", "message": "x"})
+    return scheduled
+
+
+def with_rule(groups, step):
+    return {f"-100{group}": [{"id": group + 1, "time": f"00:00-23:59/{step}м", "message": "x"}] for group in range(groups)}
+
+
+def run_day(scheduled, start):
+    entries = {entry["id"]: entry for chat in scheduled.values() for entry in chat}
+    index = ScheduleIndex()
+    began = time.perf_counter()
+    index.rebuild(scheduled, start)
+    rebuild = time.perf_counter() - began
+    heap = len(index)
+    fired = 0
+    now = start
+    began = time.perf_counter()
+    end = start + datetime.timedelta(days=1)
+    while now < end:
+        for group, entry_id, fire in index.pop_due(now):
+            entry = entries[entry_id]
+            entry["last_sent_date"] = sent_mark(fire)
+            index.upsert(group, entry, now)
+            fired += 1
+        deadline = index.next_deadline()
+        if deadline is None:
+            break
+        now = max(deadline, now + datetime.timedelta(seconds=1))
+    return rebuild, heap, fired, time.perf_counter() - began
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--groups", type=int, default=50)
+    parser.add_argument("--step", type=int, default=5, help="шаг рассылки, мин")
+    args = parser.parse_args()
+    start = datetime.datetime(2026, 1, 5, tzinfo=datetime.timezone.utc)
+    for name, scheduled in (("дубликаты", duplicated(args.groups, args.step)), ("правило", with_rule(args.groups, args.step))):
+        rebuild, heap, fired, day = run_day(scheduled, start)
+        print(f"{name:10} записей в куче {heap:6d}, перестроение {rebuild * 1000:7.1f} мс, "
+              f"срабатываний за сутки {fired}, их обработка {day * 1000:7.1f} мс")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,180 @@
+"""Задержка "апдейт -> обработчик": long polling против webhook.
+
+Локальный aiohttp-сервер изображает Bot API: держит getUpdates до
+появления апдейта (long polling) и отвечает на setWebhook. Сетевая
+задержка в одну сторону моделируется параметром --network (мс): в
+polling её проходят и запрос getUpdates, и ответ, в webhook — POST от
+Telegram к боту. Апдейты "приходят" с интервалом --interval, замеряется
+время от появления апдейта до вызова обработчика aiogram, а для webhook
+ещё и время ответа 200 (то, что ждёт Telegram).
+
+    python benchmarks/bench_updates.py --updates 200 --interval 0.05 --network 30
+"""
+import argparse
+import asyncio
+import os
+import socket
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from aiogram import Bot, Dispatcher  # noqa: E402
+from aiogram.client.session.aiohttp import AiohttpSession  # noqa: E402
+from aiogram.client.telegram import TelegramAPIServer  # noqa: E402
+from aiohttp import ClientSession, web  # noqa: E402
+
+from webhook import start_webhook  # noqa: E402
+
+TOKEN = "123456:bench-token"
+SECRET = "bench-secret"
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def make_update(update_id):
+    return {
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id,
+            "date": int(time.time()),
+            "chat": {"id": 1, "type": "private"},
+            "from": {"id": 1, "is_bot": False, "first_name": "owner"},
+            "text": "ping",
+        },
+    }
+
+
+class FakeApi:
+    def __init__(self, network):
+        self.network = network
+        self.updates = []
+        self.arrived = asyncio.Event()
+        self.get_updates_calls = 0
+
+    def push(self, update):
+        self.updates.append(update)
+        self.arrived.set()
+
+    async def handle(self, request):
+        method = request.match_info["method"]
+        params = dict(await request.post())
+        if method == "getMe":
+            result = {"id": 123456, "is_bot": True, "first_name": "bench"}
+        elif method == "getUpdates":
+            self.get_updates_calls += 1
+            await asyncio.sleep(self.network)  # запрос идёт до сервера
+            offset = int(params.get("offset") or 0)
+            self.updates = [u for u in self.updates if u["update_id"] >= offset]
+            if not self.updates:
+                self.arrived.clear()
+                try:
+                    await asyncio.wait_for(self.arrived.wait(), float(params.get("timeout") or 0) or 0.001)
+                except asyncio.TimeoutError:
+                    pass
+            result = list(self.updates)
+            await asyncio.sleep(self.network)  # ответ идёт обратно
+        else:
+            result = True
+        return web.json_response({"ok": True, "result": result})
+
+    async def start(self, port):
+        app = web.Application()
+        app.router.add_post("/bot{token}/{method}", self.handle)
+        runner = web.AppRunner(app)
+        await runner.setup()
+        await web.TCPSite(runner, "127.0.0.1", port).start()
+        return runner
+
+
+def make_bot_and_dispatcher(api_port, sent, latencies, done, total):
+    bot = Bot(TOKEN, session=AiohttpSession(api=TelegramAPIServer.from_base(f"http://127.0.0.1:{api_port}")))
+    dp = Dispatcher()
+
+    @dp.message()
+    async def on_message(message):
+        latencies.append(time.perf_counter() - sent[message.message_id])
+        if len(latencies) >= total:
+            done.set()
+
+    return bot, dp
+
+
+async def run_polling(args, api, api_port):
+    sent, latencies, done = {}, [], asyncio.Event()
+    bot, dp = make_bot_and_dispatcher(api_port, sent, latencies, done, args.updates)
+    polling = asyncio.create_task(dp.start_polling(bot, handle_signals=False, polling_timeout=10))
+    await asyncio.sleep(0.5)
+    for update_id in range(1, args.updates + 1):
+        sent[update_id] = time.perf_counter()
+        api.push(make_update(update_id))
+        await asyncio.sleep(args.interval)
+    await asyncio.wait_for(done.wait(), 30)
+    await dp.stop_polling()
+    await polling
+    return latencies, []
+
+
+async def run_webhook(args, api_port, network):
+    sent, latencies, done = {}, [], asyncio.Event()
+    bot, dp = make_bot_and_dispatcher(api_port, sent, latencies, done, args.updates)
+    port = free_port()
+    runner = await start_webhook(dp, bot, f"http://127.0.0.1:{port}/webhook", "127.0.0.1", port, SECRET)
+    acks = []
+
+    async def deliver(session, update_id):
+        start = sent[update_id] = time.perf_counter()
+        await asyncio.sleep(network)  # POST от Telegram идёт до бота
+        async with session.post(f"http://127.0.0.1:{port}/webhook", json=make_update(update_id),
+                                headers={"X-Telegram-Bot-Api-Secret-Token": SECRET}) as response:
+            assert response.status == 200, response.status
+        acks.append(time.perf_counter() - start)
+
+    async with ClientSession() as session:
+        posts = []
+        for update_id in range(1, args.updates + 1):
+            posts.append(asyncio.create_task(deliver(session, update_id)))
+            await asyncio.sleep(args.interval)
+        await asyncio.gather(*posts)
+        await asyncio.wait_for(done.wait(), 30)
+    await runner.cleanup()
+    return latencies, acks
+
+
+def describe(name, values):
+    values = sorted(values)
+    p99 = values[min(len(values) - 1, int(0.99 * len(values)))]
+    return f"{name}: p50 {statistics.median(values) * 1000:.1f} мс, p99 {p99 * 1000:.1f} мс, среднее {statistics.mean(values) * 1000:.1f} мс"
+
+
+async def run(args):
+    network = args.network / 1000
+    api = FakeApi(network)
+    api_port = free_port()
+    api_runner = await api.start(api_port)
+    try:
+        polling, _ = await run_polling(args, api, api_port)
+        webhook, acks = await run_webhook(args, api_port, network)
+    finally:
+        await api_runner.cleanup()
+    print(f"апдейтов: {args.updates}, интервал {args.interval} с, сеть {args.network:.0f} мс в одну сторону")
+    print(describe("polling  апдейт -> обработчик", polling) + f" (запросов getUpdates: {api.get_updates_calls})")
+    print(describe("webhook  апдейт -> обработчик", webhook))
+    print(describe("webhook  ответ 200 для Telegram", acks))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--updates", type=int, default=200)
+    parser.add_argument("--interval", type=float, default=0.05, help="интервал между апдейтами, с")
+    parser.add_argument("--network", type=float, default=30, help="сетевая задержка в одну сторону, мс")
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,56 @@
+import asyncio
+import time
+from collections import namedtuple
+
+from aiohttp import ClientError
+from aiogram.exceptions import TelegramNetworkError, TelegramRetryAfter, TelegramServerError
+
+# Результат одной отправки: цель, успех, исключение (или None) и длительность в секундах
+SendResult = namedtuple("SendResult", "target ok error elapsed")
+# Ошибки, которые может исправить повтор: сеть, 5xx, RetryAfter, таймаут отправки.
+# Остальные ("chat not found", Forbidden, некорректное сообщение, пропавший файл
+# media/ — FileNotFoundError и прочие OSError) при повторе не пройдут
+TRANSIENT_ERRORS = (TelegramNetworkError, TelegramServerError, TelegramRetryAfter,
+                    ConnectionError, ClientError, TimeoutError, asyncio.TimeoutError)
+
+
+def is_transient(error):
+    return isinstance(error, TRANSIENT_ERRORS)
+
+
+async def fan_out(targets, send, concurrency=20, timeout=120, delay=None, semaphore=None, on_result=None):
+    """Рассылает по многим чатам параллельно, но не больше concurrency отправок одновременно.
+
+    send(target) — корутина отправки в один чат. Каждая отправка ограничена
+    timeout секундами, так что одна зависшая загрузка не задерживает
+    остальные группы. Возвращает список SendResult в порядке targets.
+
+    delay(target) — сколько секунд подождать перед отправкой; ожидание не
+    занимает слот и не входит в timeout. semaphore — общий лимит на случай,
+    когда несколько fan_out идут одновременно (иначе лимит свой на вызов).
+    on_result(result) вызывается сразу по завершении каждой отправки, не
+    дожидаясь остальных.
+    """
+    if semaphore is None:
+        semaphore = asyncio.Semaphore(max(concurrency, 1))
+
+    async def send_one(target):
+        async with semaphore:
+            start = time.perf_counter()
+            try:
+                await asyncio.wait_for(send(target), timeout)
+            except asyncio.TimeoutError:
+                return SendResult(target, False, TimeoutError(f"отправка дольше {timeout} с"), time.perf_counter() - start)
+            except Exception as e:
+                return SendResult(target, False, e, time.perf_counter() - start)
+            return SendResult(target, True, None, time.perf_counter() - start)
+
+    async def run(target):
+        if delay is not None:
+            await asyncio.sleep(max(delay(target), 0))
+        result = await send_one(target)
+        if on_result is not None:
+            on_result(result)
+        return result
+
+    return await asyncio.gather(*(run(target) for target in targets))
@@ -0,0 +1,226 @@
+"""Групповой импорт и экспорт групп и расписания документом (CSV или JSON Lines).
+
+Одна строка документа — один объект:
+
+    CSV (первая строка — заголовок):
+        kind,chat,delay,time,message
+        group,@news,3600,,Текст для режима задержки
+        schedule,@news,,10:00 пн-пт,Текст по расписанию
+
+    JSON Lines:
+        {"kind": "group", "chat": "@news", "delay": 3600, "message": "..."}
+        {"kind": "schedule", "chat": "@news", "time": "10:00 пн-пт", "message": "..."}
+
+В JSON Lines можно передать и остальные поля сохранённого сообщения
+(entities, media, media_group) — в таком виде бот отдаёт экспорт, так что
+экспорт можно загрузить обратно. Документ читается и проверяется
+построчно, дубликаты ищутся по индексу, построенному один раз, а
+применяется всё одной записью конфига — и только если ошибок нет.
+"""
+import csv
+import json
+
+from content import CONTENT_KEYS, check_content, stale_keys
+
+FIELDS = ("kind", "chat", "delay", "time", "message")
+FORMATS = ("jsonl", "csv")
+# Сколько ошибок показывать владельцу
+MAX_ERRORS_SHOWN = 10
+
+
+def document_format(filename):
+    """Формат по имени файла: csv или jsonl (None — не поддерживается)."""
+    name = (filename or "").lower()
+    if name.endswith(".csv"):
+        return "csv"
+    if name.endswith((".jsonl", ".ndjson", ".json")):
+        return "jsonl"
+    return None
+
+
+def normalize_chat(value):
+    """@name, https://t.me/name или числовой id -> ключ группы, как его сохраняет бот."""
+    link = str(value or "").strip()
+    if link.startswith("https://t.me/"):
+        link = "@" + link[len("https://t.me/"):]
+    if link.startswith("@"):
+        link = link.split()[0].split("/")[0]
+        if len(link) > 1:
+            return link
+    elif link.lstrip("-").isdigit():
+        return link
+    raise ValueError(f"некорректная группа: {value!r}")
+
+
+def _index_key(chat):
+    # @username в Telegram не зависит от регистра
+    return chat.lower() if chat.startswith("@") else chat
+
+
+class DocumentError(ValueError):
+    """Документ дальше не читается (битый CSV); line_no — строка, на которой чтение остановилось."""
+
+    def __init__(self, line_no, message):
+        super().__init__(message)
+        self.line_no = line_no
+
+
+def read_records(stream, fmt):
+    """Построчно читает документ: (номер строки, запись или None, если строка не разбирается)."""
+    if fmt == "csv":
+        reader = csv.DictReader(stream)
+        try:
+            for record in reader:
+                yield reader.line_num, record
+        except csv.Error as e:
+            # line_num — последняя строка, прочитанная целиком; ошибка — в следующей
+            raise DocumentError(reader.line_num + 1, f"ошибка CSV: {e}") from None
+        return
+    for line_no, line in enumerate(stream, 1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            yield line_no, json.loads(line)
+        except ValueError:
+            yield line_no, None
+
+
+class BulkImport:
+    """Проверка документа и подготовка изменений против текущего конфига.
+
+    Индексы групп и времён расписания строятся один раз в конструкторе;
+    add() проверяет одну запись документа. Результат — chats (группа ->
+    полные данные после импорта) и entries (новые записи расписания) для
+    ConfigStore.import_bulk().
+    """
+
+    def __init__(self, config, normalize_time):
+        self.normalize_time = normalize_time
+        self.existing = config.get("chats", {})
+        self._chats_index = {_index_key(chat): chat for chat in self.existing}
+        self._times = {
+            (chat, self._existing_time(entry.get("time")))
+            for chat, entries in config.get("scheduled", {}).items() for entry in entries
+        }
+        self.chats = {}
+        self.entries = []
+        self.duplicates = 0
+        self.errors = []
+
+    def _existing_time(self, value):
+        # Старые записи могли сохраниться не в канонической форме ("9:00:00")
+        try:
+            return self.normalize_time(value)
+        except (TypeError, ValueError):
+            return value
+
+    def add(self, line_no, record):
+        try:
+            self._add(record)
+        except ValueError as e:
+            self.errors.append((line_no, str(e)))
+
+    def _chat(self, value):
+        chat = normalize_chat(value)
+        # Группа уже есть в конфиге (или выше в документе) — пишем под её ключом
+        return self._chats_index.setdefault(_index_key(chat), chat)
+
+    def _chat_data(self, chat):
+        if chat not in self.chats:
+            self.chats[chat] = dict(self.existing.get(chat) or {"message": None, "delay": 60})
+        return self.chats[chat]
+
+    @staticmethod
+    def _content(record):
+        content = {key: record[key] for key in CONTENT_KEYS if record.get(key) not in (None, "")}
+        check_content(content)
+        return content
+
+    def _add(self, record):
+        if not isinstance(record, dict):
+            raise ValueError("строка не разобрана")
+        kind = str(record.get("kind") or "").strip().lower()
+        chat = self._chat(record.get("chat"))
+        if kind == "group":
+            delay = None
+            if record.get("delay") not in (None, ""):
+                try:
+                    delay = int(record["delay"])
+                except (TypeError, ValueError):
+                    raise ValueError(f"некорректная задержка: {record['delay']!r}") from None
+                if delay < 0:
+                    raise ValueError(f"некорректная задержка: {delay}")
+            content = self._content(record)
+            data = self._chat_data(chat)
+            if delay is not None:
+                data["delay"] = delay
+            if content:
+                data.update(content)
+                for key in stale_keys(content):
+                    data.pop(key, None)
+        elif kind == "schedule":
+            try:
+                time_str = self.normalize_time(str(record.get("time") or ""))
+            except ValueError as e:
+                raise ValueError(f"время {record.get('time')!r}: {e}") from None
+            content = self._content(record)
+            if not content:
+                raise ValueError("нет сообщения для записи расписания")
+            if (chat, time_str) in self._times:
+                self.duplicates += 1
+                return
+            self._times.add((chat, time_str))
+            # Запись расписания для новой группы добавляет и саму группу
+            self._chat_data(chat)
+            entry = {"time": time_str}
+            entry.update(content)
+            self.entries.append((chat, entry))
+        else:
+            raise ValueError(f"неизвестный kind: {kind!r} (нужен group или schedule)")
+
+    def changes(self):
+        """(добавленные группы, изменённые группы): без групп, которые импорт не меняет."""
+        added = {chat: data for chat, data in self.chats.items() if chat not in self.existing}
+        updated = {chat: data for chat, data in self.chats.items()
+                   if chat in self.existing and data != self.existing[chat]}
+        return added, updated
+
+    def summary(self):
+        added, updated = self.changes()
+        lines = [
+            f"Группы: добавлено {len(added)}, изменено {len(updated)}, "
+            f"без изменений {len(self.chats) - len(added) - len(updated)}",
+            f"Записи расписания: добавлено {len(self.entries)}, дубликатов пропущено {self.duplicates}",
+        ]
+        if self.errors:
+            lines.append(f"Ошибок: {len(self.errors)}")
+            lines.extend(f"  строка {line_no}: {error}" for line_no, error in self.errors[:MAX_ERRORS_SHOWN])
+        return "\n".join(lines)
+
+
+def export_records(config):
+    """Текущее состояние в виде записей документа: сначала группы, потом расписание."""
+    for chat, data in config.get("chats", {}).items():
+        record = {"kind": "group", "chat": chat, "delay": data.get("delay", 60)}
+        record.update({key: data[key] for key in CONTENT_KEYS if data.get(key) is not None})
+        yield record
+    for chat, entries in config.get("scheduled", {}).items():
+        for entry in entries:
+            record = {"kind": "schedule", "chat": chat, "time": entry.get("time")}
+            record.update({key: entry[key] for key in CONTENT_KEYS if entry.get(key) is not None})
+            yield record
+
+
+def write_document(records, stream, fmt):
+    """Пишет записи в поток построчно; в CSV попадает только текст сообщения. Возвращает число строк."""
+    count = 0
+    if fmt == "csv":
+        writer = csv.DictWriter(stream, FIELDS, extrasaction="ignore")
+        writer.writeheader()
+        for count, record in enumerate(records, 1):
+            writer.writerow(record)
+        return count
+    for count, record in enumerate(records, 1):
+        stream.write(json.dumps(record, ensure_ascii=False, separators=(",", ":")) + "\n")
+    return count
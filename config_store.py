@@ -0,0 +1,318 @@
+import asyncio
+import json
+import logging
+import os
+import tempfile
+import time
+from contextlib import contextmanager, suppress
+
+logger = logging.getLogger(__name__)
+
+
+def default_config():
+    return {"chats": {}, "active": False, "scheduled": {}, "schedule_active": False}
+
+
+# Ключ конфига со следующим свободным id записи расписания
+ENTRY_ID_KEY = "next_entry_id"
+
+
+def atomic_write_json(path, data):
+    """Атомарная запись JSON: временный файл рядом + fsync + rename.
+
+    При падении процесса на диске остаётся либо старая, либо новая версия
+    файла целиком, но никогда не обрезанная.
+    """
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(prefix=f".{os.path.basename(path)}.", suffix=".tmp", dir=directory)
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False, separators=(',', ':'))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        with suppress(OSError):
+            os.remove(tmp_path)
+        raise
+    # fsync каталога, чтобы сам rename пережил отключение питания
+    with suppress(OSError):
+        dir_fd = os.open(directory, os.O_RDONLY)
+        try:
+            os.fsync(dir_fd)
+        finally:
+            os.close(dir_fd)
+
+
+class ConfigStore:
+    """Общий для процесса кэш config.json.
+
+    Файл читается один раз, дальше чтения обслуживаются из памяти. Повторное
+    чтение с диска происходит только если у файла изменились mtime/inode/size
+    (например, его поправили руками). `version` монотонно растёт при каждом
+    изменении содержимого — по нему можно инвалидировать производные кэши.
+
+    Запись отложенная: save() только помечает конфиг изменённым, а все
+    изменения за окно `flush_delay` секунд попадают на диск одной атомарной
+    записью. При остановке нужно вызвать flush().
+    """
+
+    def __init__(self, path, default_factory=default_config, flush_delay=0.5):
+        self.path = path
+        self.default_factory = default_factory
+        self.flush_delay = flush_delay
+        self.version = 0
+        self.save_requests = 0
+        self.writes = 0
+        self._data = None
+        self._signature = None
+        self._dirty = False
+        self._flush_handle = None
+        self._next_entry_id = 1
+        self._listeners = []
+        # observe(секунды) для метрик: чтение из хранилища и запись в него (None — не замерять)
+        self.observe_load = None
+        self.observe_save = None
+
+    def subscribe(self, listener):
+        """listener(event, key, payload) вызывается после каждого изменения конфига.
+
+        События: "flag" (ключ, значение), "chat" (группа, данные),
+        "chat_removed" (группа, записи расписания), "scheduled" (группа, запись),
+        "scheduled_sent" (группа, запись — изменилась только отметка отправки),
+        "scheduled_removed" (группа, id записи), "reloaded" (None, весь конфиг).
+        """
+        self._listeners.append(listener)
+
+    def _notify(self, event, key, payload):
+        for listener in self._listeners:
+            try:
+                listener(event, key, payload)
+            except Exception as e:
+                logger.error("Подписчик конфига упал на событии %s: %s", event, e)
+
+    @contextmanager
+    def _timed(self, observe):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            if observe is not None:
+                observe(time.perf_counter() - start)
+
+    def _stat_signature(self):
+        try:
+            st = os.stat(self.path)
+        except OSError:
+            return None
+        return (st.st_ino, st.st_mtime_ns, st.st_size)
+
+    def _read(self):
+        """Конфиг с диска; None, если файл не читается, а в памяти уже есть прочитанный ранее."""
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            logger.info("Загружен config: %s групп, версия %s", len(data.get('chats', {})), self.version + 1)
+        except Exception as e:
+            if self._data is not None:
+                # Например, файл правят руками и сохранили с ошибкой: остаёмся на последней рабочей версии
+                logger.error("Не удалось перечитать config, остаётся версия %s: %s", self.version, e)
+                return None
+            logger.error("Не удалось загрузить config: %s", e)
+            data = self.default_factory()
+        for key, value in self.default_factory().items():
+            data.setdefault(key, value)
+        if self._assign_entry_ids(data):
+            # Старый конфиг без id у записей: фиксируем выданные id сразу
+            self._data = data
+            self._dirty = True
+            self.flush()
+        return data
+
+    def _assign_entry_ids(self, data):
+        """Выдаёт стабильные id записям расписания, у которых их ещё нет."""
+        entries = [entry for group in data.get("scheduled", {}).values() for entry in group]
+        self._next_entry_id = max([entry.get("id", 0) for entry in entries] + [data.get(ENTRY_ID_KEY, 1) - 1, 0]) + 1
+        assigned = False
+        for entry in entries:
+            if "id" not in entry:
+                entry["id"] = self._take_entry_id(data)
+                assigned = True
+        return assigned
+
+    def _take_entry_id(self, config):
+        """Следующий id записи расписания.
+
+        Счётчик хранится в самом конфиге: id удалённой записи не выдаётся
+        повторно и после перезапуска — иначе новая запись унаследовала бы
+        отметки об отправке старой (журнал отправок, dedup_key в outbox).
+        """
+        entry_id = self._next_entry_id
+        self._next_entry_id += 1
+        config[ENTRY_ID_KEY] = self._next_entry_id
+        return entry_id
+
+    def get(self):
+        """Возвращает общий (не копию!) словарь конфига, перечитывая файл только при его изменении."""
+        if self._dirty:
+            # В памяти изменения новее, чем на диске
+            return self._data
+        signature = self._stat_signature()
+        if self._data is None or signature != self._signature:
+            # Битый файл не перечитываем на каждом get(): ждём следующего его изменения
+            self._signature = signature
+            with self._timed(self.observe_load):
+                data = self._read()
+            if data is None:
+                return self._data
+            self._data = data
+            self.version += 1
+            self._notify("reloaded", None, self._data)
+        return self._data
+
+    def save(self, data=None):
+        replaced = data is not None and data is not self._data
+        if replaced:
+            self._data = data
+        if self._data is None:
+            return
+        if replaced:
+            self._notify("reloaded", None, self._data)
+        self.save_requests += 1
+        self.version += 1
+        self._dirty = True
+        if self.flush_delay <= 0:
+            self.flush()
+            return
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            # Вне event loop откладывать некуда — пишем сразу
+            self.flush()
+            return
+        if self._flush_handle is None:
+            self._flush_handle = loop.call_later(self.flush_delay, self.flush)
+
+    def flush(self):
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        if not self._dirty or self._data is None:
+            return
+        try:
+            self._write(self._data)
+        except Exception as e:
+            # Остаёмся "грязными": следующий save()/flush() повторит запись
+            logger.error("Не удалось сохранить config: %s", e)
+            return
+        self._dirty = False
+        self.writes += 1
+        self._signature = self._stat_signature()
+        logger.info("Сохранён config, версия %s (запросов на запись: %s, записей: %s)", self.version, self.save_requests, self.writes)
+
+    def _write(self, data):
+        with self._timed(self.observe_save):
+            atomic_write_json(self.path, data)
+
+    # -----------------------------------
+    # Точечные изменения. Обработчики меняют конфиг только через них, чтобы
+    # хранилище (JSON или SQLite) могло записать лишь затронутые строки.
+    # -----------------------------------
+
+    def set_flag(self, key, value):
+        self.get()[key] = value
+        self.save()
+        self._notify("flag", key, value)
+
+    def add_chat(self, chat, fields):
+        self.get()["chats"][chat] = dict(fields)
+        self.save()
+        self._notify("chat", chat, self.get()["chats"][chat])
+
+    def update_chat(self, chat, fields, drop=()):
+        data = self.get()["chats"][chat]
+        data.update(fields)
+        for key in drop:
+            data.pop(key, None)
+        self.save()
+        self._notify("chat", chat, data)
+
+    def remove_chat(self, chat):
+        """Удаляет группу и все её записи расписания, возвращает (данные группы, записи)."""
+        config = self.get()
+        chat_data = config["chats"].pop(chat, None)
+        entries = config.get("scheduled", {}).pop(chat, [])
+        self.save()
+        self._notify("chat_removed", chat, entries)
+        return chat_data, entries
+
+    def find_scheduled(self, chat, entry_id):
+        for entry in self.get().get("scheduled", {}).get(chat, []):
+            if entry.get("id") == entry_id:
+                return entry
+        return None
+
+    def add_scheduled(self, chat, entry):
+        config = self.get()
+        entry = dict(entry)
+        entry["id"] = self._take_entry_id(config)
+        config.setdefault("scheduled", {}).setdefault(chat, []).append(entry)
+        self.save()
+        self._notify("scheduled", chat, entry)
+        return entry
+
+    def import_bulk(self, chats, entries):
+        """Групповое изменение одной записью: chats — {группа: данные целиком}, entries — [(группа, новая запись)].
+
+        Возвращает добавленные записи расписания (с выданными id).
+        """
+        config = self.get()
+        config["chats"].update(chats)
+        added = self._append_entries(config, entries)
+        self.save()
+        self._notify_bulk(chats, added)
+        return added
+
+    def _append_entries(self, config, entries):
+        added = []
+        for chat, entry in entries:
+            entry = dict(entry)
+            entry["id"] = self._take_entry_id(config)
+            config.setdefault("scheduled", {}).setdefault(chat, []).append(entry)
+            added.append((chat, entry))
+        return added
+
+    def _notify_bulk(self, chats, added):
+        for chat, data in chats.items():
+            self._notify("chat", chat, data)
+        for chat, entry in added:
+            self._notify("scheduled", chat, entry)
+
+    def update_scheduled(self, chat, entry_id, fields, drop=()):
+        entry = self.find_scheduled(chat, entry_id)
+        if entry is None:
+            return None
+        entry.update(fields)
+        for key in drop:
+            entry.pop(key, None)
+        self.save()
+        self._notify("scheduled", chat, entry)
+        return entry
+
+    def remove_scheduled(self, chat, entry_id):
+        entries = self.get().get("scheduled", {}).get(chat, [])
+        for i, entry in enumerate(entries):
+            if entry.get("id") == entry_id:
+                removed = entries.pop(i)
+                self.save()
+                self._notify("scheduled_removed", chat, entry_id)
+                return removed
+        return None
+
+    def mark_sent(self, chat, entry_id, date_str):
+        entry = self.find_scheduled(chat, entry_id)
+        if entry is None:
+            return
+        entry["last_sent_date"] = date_str
+        self.save()
+        self._notify("scheduled_sent", chat, entry)
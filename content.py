@@ -0,0 +1,304 @@
+import logging
+import os
+import re
+from collections import namedtuple
+
+from aiogram import types
+from aiogram.exceptions import TelegramBadRequest
+from aiogram.types import FSInputFile
+
+from file_ids import message_file_id
+from media_store import MEDIA_NAME_RE
+
+logger = logging.getLogger(__name__)
+
+PHOTO_EXTENSIONS = {".jpg", ".jpeg", ".png"}
+VIDEO_EXTENSIONS = {".mp4", ".mov", ".m4v"}
+MEDIA_METHODS = {"photo": "send_photo", "video": "send_video", "document": "send_document"}
+# Ошибки Bot API, означающие, что отклонён сам file_id (а не чат, подпись и т.п.)
+FILE_ID_ERRORS = ("wrong file identifier", "wrong remote file", "failed to get http url content")
+# file_id Telegram: base64url без точек и слэшей
+FILE_ID_RE = re.compile(r"^[A-Za-z0-9_-]{20,}$")
+
+# Готовый к отправке "план" сообщения: метод Bot API, текст/подпись,
+# уже провалидированные entities и кортеж медиа (тип, путь или file_id;
+# local — ref это локальный файл, проверено при компиляции плана)
+SendPlan = namedtuple("SendPlan", "method text entities media")
+MediaRef = namedtuple("MediaRef", "type ref local")
+
+
+def media_type_for_path(path):
+    extension = os.path.splitext(path)[1].lower()
+    if extension in PHOTO_EXTENSIONS:
+        return "photo"
+    if extension in VIDEO_EXTENSIONS:
+        return "video"
+    return "document"
+
+
+def is_file_id_error(error):
+    message = str(getattr(error, "message", error)).lower()
+    return any(marker in message for marker in FILE_ID_ERRORS)
+
+
+def _entities(raw):
+    if not raw:
+        return None
+    return tuple(types.MessageEntity.model_validate(e) for e in raw)
+
+
+def _media_ref(media_type, ref):
+    # Файл на диске или file_id Telegram — решается один раз, а не на каждой отправке
+    return MediaRef(media_type, ref, os.path.isfile(ref))
+
+
+def compile_plan(content):
+    """Сохранённое сообщение (группа режима задержки или запись расписания) -> SendPlan.
+
+    Отправка по плану не обращается к файловой системе: какие ссылки — локальные
+    файлы, определяется здесь. План пересобирается, когда сообщение меняют.
+    """
+    if content.get("media_group"):
+        media = tuple(
+            _media_ref(item["type"], item.get("file_path") or item.get("file_id"))
+            for item in content["media_group"]
+            if item.get("type") in MEDIA_METHODS
+        )
+        return SendPlan("send_media_group", content.get("message") or "", _entities(content.get("caption_entities")), media)
+    if content.get("media"):
+        media_type = media_type_for_path(content["media"])
+        return SendPlan(MEDIA_METHODS[media_type], content.get("message", ""),
+                        _entities(content.get("caption_entities")), (_media_ref(media_type, content["media"]),))
+    if content.get("message"):
+        return SendPlan("send_message", content["message"], _entities(content.get("entities")), ())
+    return SendPlan(None, "", None, ())
+
+
+class PlanCache:
+    """Планы отправки, скомпилированные один раз на версию сообщения.
+
+    Ключ — ("chat", группа) или ("scheduled", id записи). План сбрасывается
+    только когда сообщение редактируют (события ConfigStore); отметка об
+    отправке план не трогает.
+    """
+
+    def __init__(self):
+        self._plans = {}
+        self.hits = 0
+        self.compiles = 0
+
+    def get(self, key, content):
+        plan = self._plans.get(key)
+        if plan is None:
+            plan = self._plans[key] = compile_plan(content)
+            self.compiles += 1
+        else:
+            self.hits += 1
+        return plan
+
+    def invalidate(self, key):
+        self._plans.pop(key, None)
+
+    def on_config_event(self, event, key, payload):
+        if event == "chat":
+            self.invalidate(("chat", key))
+        elif event == "chat_removed":
+            self.invalidate(("chat", key))
+            for entry in payload:
+                self.invalidate(("scheduled", entry.get("id")))
+        elif event == "scheduled":
+            self.invalidate(("scheduled", payload.get("id")))
+        elif event == "scheduled_removed":
+            self.invalidate(("scheduled", payload))
+        elif event == "reloaded":
+            self._plans.clear()
+
+
+class PlanSender:
+    """Выполняет SendPlan, подставляя file_id из кэша вместо повторной загрузки файлов."""
+
+    def __init__(self, bot, file_id_cache):
+        self.bot = bot
+        self.file_id_cache = file_id_cache
+
+    def media_input(self, item, cached=True):
+        """file_id из кэша, если файл уже загружался в Telegram, иначе загрузка с диска."""
+        if not item.local:
+            # Документы хранятся сразу как file_id Telegram
+            return item.ref
+        file_id = self.file_id_cache.get(item.ref) if cached else None
+        if file_id:
+            self.file_id_cache.uploads_saved += 1
+            return file_id
+        return FSInputFile(item.ref)
+
+    def _media_group(self, plan, cached):
+        media_group = []
+        for item in plan.media:
+            media = self.media_input(item, cached)
+            if item.type == "photo":
+                media_group.append(types.InputMediaPhoto(media=media))
+            elif item.type == "video":
+                media_group.append(types.InputMediaVideo(media=media))
+            else:
+                media_group.append(types.InputMediaDocument(media=media))
+        # Подпись — к первому элементу
+        if media_group and plan.text:
+            media_group[0].caption = plan.text
+            media_group[0].caption_entities = list(plan.entities) if plan.entities else None
+        return media_group
+
+    def _call(self, chat, plan, cached):
+        entities = list(plan.entities) if plan.entities else None
+        if plan.method == "send_media_group":
+            return self.bot.send_media_group(chat_id=chat, media=self._media_group(plan, cached), disable_notification=True)
+        if plan.method == "send_message":
+            return self.bot.send_message(
+                chat_id=chat,
+                text=plan.text,
+                entities=entities,
+                parse_mode=None,
+                disable_notification=True,  # Отключаем уведомления
+                disable_web_page_preview=True  # Отключаем превью ссылок
+            )
+        media_type = plan.media[0].type
+        return getattr(self.bot, plan.method)(
+            chat_id=chat,
+            caption=plan.text,
+            caption_entities=entities,
+            disable_notification=True,
+            **{media_type: self.media_input(plan.media[0], cached)}
+        )
+
+    async def send(self, chat, plan):
+        """Отправляет план; после отправки запоминает file_id загруженных файлов.
+
+        Если Telegram отверг сохранённый file_id, он забывается и файл
+        загружается заново. Остальные ошибки 400 ("chat not found", длинная
+        подпись) пробрасываются, не трогая кэш: повторная загрузка их не исправит.
+        """
+        if plan.method is None:
+            return None
+        local_paths = [item.ref for item in plan.media if item.local]
+        # Запоминать нужно только file_id реально загруженных файлов: отправка
+        # по уже известному file_id не пишет кэш на диск
+        uploaded = {path for path in local_paths if not self.file_id_cache.get(path)}
+        try:
+            result = await self._call(chat, plan, True)
+        except TelegramBadRequest as e:
+            if len(uploaded) == len(local_paths) or not is_file_id_error(e):
+                raise
+            logger.warning("file_id отклонён (%s), загружаем файлы заново: %s", e, local_paths)
+            for path in local_paths:
+                self.file_id_cache.forget(path)
+            uploaded = set(local_paths)
+            result = await self._call(chat, plan, False)
+        # send_media_group возвращает список сообщений в порядке элементов альбома
+        messages = result if isinstance(result, list) else [result]
+        for item, sent in zip(plan.media, messages):
+            if item.ref in uploaded:
+                self.file_id_cache.remember(item.ref, message_file_id(sent))
+        return result
+
+
+# -----------------------------------
+# Захват: входящее сообщение владельца -> сохраняемый контент
+# -----------------------------------
+
+# Все ключи контента: при сохранении нового сообщения ключи, которых в нём нет, удаляются
+CONTENT_KEYS = ("message", "entities", "caption_entities", "media", "media_group")
+
+
+def _dump_entities(entities):
+    return [e.model_dump() for e in entities] if entities else None
+
+
+async def capture_item(media_store, message):
+    """Элемент медиа-группы: {"type", "file_path"} или {"type": "document", "file_id"} (None — не медиа)."""
+    if message.photo:
+        photo = message.photo[-1]
+        return {"type": "photo", "file_path": await media_store.fetch(photo.file_id, photo.file_unique_id, ".jpg", "photo")}
+    if message.video:
+        video = message.video
+        return {"type": "video", "file_path": await media_store.fetch(video.file_id, video.file_unique_id, ".mp4", "video")}
+    if message.document:
+        return {"type": "document", "file_id": message.document.file_id}
+    return None
+
+
+async def capture_content(media_store, message):
+    """Одиночное сообщение -> контент для сохранения (None, если тип не поддерживается)."""
+    if message.photo or message.video:
+        item = await capture_item(media_store, message)
+        media = item["file_path"]
+    elif message.document:
+        media = message.document.file_id
+    elif message.text:
+        return {"message": message.text, "entities": _dump_entities(message.entities)}
+    else:
+        return None
+    return {"media": media, "message": message.caption or "", "caption_entities": _dump_entities(message.caption_entities)}
+
+
+def album_content(items, message):
+    """Собранная медиа-группа -> контент; подпись и entities берутся из сообщения с подписью."""
+    return {
+        "media_group": items,
+        "message": message.caption or message.text or "",
+        "caption_entities": _dump_entities(message.caption_entities),
+        "entities": _dump_entities(message.entities),
+    }
+
+
+def _is_media_path(ref, media_dir):
+    # Только файлы, скачанные MediaStore: media/{file_unique_id}.jpg|.mp4
+    name = os.path.basename(ref)
+    return (MEDIA_NAME_RE.match(name) is not None and os.path.normpath(ref) == os.path.join(media_dir, name)
+            and os.path.isfile(ref))
+
+
+def _is_file_id(ref):
+    # Строка, совпадающая с файлом на диске, ушла бы в Telegram как загрузка этого файла
+    return FILE_ID_RE.match(ref) is not None and not os.path.exists(ref)
+
+
+def check_content(content, media_dir="media"):
+    """Проверка контента из внешнего источника (импорт): ValueError, если его нельзя сохранить.
+
+    Медиа — только файлы из media/ или file_id (а не произвольный путь на
+    диске, который ушёл бы в группу загрузкой), entities — то, что примет
+    MessageEntity.
+    """
+    if content.get("message") is not None and not isinstance(content["message"], str):
+        raise ValueError("message должен быть строкой")
+    media = content.get("media")
+    if media is not None and not (isinstance(media, str) and (_is_media_path(media, media_dir) or _is_file_id(media))):
+        raise ValueError(f"media должен быть файлом {media_dir}/<id>.jpg|mp4 или file_id: {media!r}")
+    media_group = content.get("media_group")
+    if media_group is not None:
+        if not isinstance(media_group, list) or not media_group:
+            raise ValueError("media_group должен быть непустым списком")
+        for item in media_group:
+            if not isinstance(item, dict) or item.get("type") not in MEDIA_METHODS:
+                raise ValueError(f"элемент media_group без типа photo/video/document: {item!r}")
+            file_path, file_id = item.get("file_path"), item.get("file_id")
+            if file_path is not None:
+                if not (isinstance(file_path, str) and _is_media_path(file_path, media_dir)):
+                    raise ValueError(f"file_path должен быть файлом {media_dir}/<id>.jpg|mp4: {file_path!r}")
+            elif not (isinstance(file_id, str) and _is_file_id(file_id)):
+                raise ValueError(f"элемент media_group без file_path или file_id: {item!r}")
+    for key in ("entities", "caption_entities"):
+        raw = content.get(key)
+        if raw is None:
+            continue
+        if not isinstance(raw, list) or not all(isinstance(e, dict) for e in raw):
+            raise ValueError(f"{key} должен быть списком объектов")
+        try:
+            _entities(raw)
+        except ValueError as e:
+            raise ValueError(f"{key}: {str(e).splitlines()[0]}") from None
+
+
+def stale_keys(content):
+    """Ключи прежнего контента, которые нужно удалить при сохранении нового."""
+    return tuple(key for key in CONTENT_KEYS if key not in content)
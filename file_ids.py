@@ -0,0 +1,102 @@
+import hashlib
+import json
+import logging
+import os
+
+from config_store import atomic_write_json
+
+logger = logging.getLogger(__name__)
+
+
+def message_file_id(message):
+    """file_id медиа из отправленного сообщения (самый большой размер фото)."""
+    if message is None:
+        return None
+    if message.photo:
+        return message.photo[-1].file_id
+    for media in (message.video, message.animation, message.document, message.audio):
+        if media:
+            return media.file_id
+    return None
+
+
+def load_file_ids(path):
+    """Словарь ключ -> file_id из JSON-кэша (пустой, если файла нет или он битый)."""
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+    except Exception as e:
+        logger.error("Не удалось загрузить кэш file_id: %s", e)
+        return {}
+
+
+class FileIdCache:
+    """Запоминает file_id, который Telegram вернул после первой загрузки локального файла.
+
+    Дальше тот же файл отправляется по file_id, без повторной загрузки байтов.
+    Ключ — file_unique_id (файлы в media/ названы по нему), для прочих путей —
+    sha1 содержимого. Кэш хранится в JSON рядом с медиа.
+    """
+
+    def __init__(self, path, media_dir="media"):
+        self.path = path
+        self.media_dir = os.path.normpath(media_dir)
+        self.uploads_saved = 0
+        self._hashes = {}
+        self._file_ids = self._load()
+
+    def _load(self):
+        return load_file_ids(self.path)
+
+    def key(self, file_path):
+        if os.path.normpath(os.path.dirname(file_path)) == self.media_dir:
+            return os.path.splitext(os.path.basename(file_path))[0]
+        try:
+            st = os.stat(file_path)
+        except OSError:
+            return None
+        signature = (file_path, st.st_size, st.st_mtime_ns)
+        if signature not in self._hashes:
+            digest = hashlib.sha1()
+            with open(file_path, 'rb') as f:
+                for chunk in iter(lambda: f.read(1 << 20), b""):
+                    digest.update(chunk)
+            self._hashes[signature] = "sha1:" + digest.hexdigest()
+        return self._hashes[signature]
+
+    def get(self, file_path):
+        key = self.key(file_path)
+        return self._lookup(key) if key else None
+
+    def remember(self, file_path, file_id):
+        key = self.key(file_path)
+        if not key or not file_id or self._lookup(key) == file_id:
+            return
+        self._store(key, file_id)
+
+    def forget(self, file_path):
+        key = self.key(file_path)
+        if key:
+            self._drop(key)
+
+    # Хранение: словарь в памяти + JSON; OutboxFileIdCache хранит то же в SQLite
+
+    def _lookup(self, key):
+        return self._file_ids.get(key)
+
+    def _store(self, key, file_id):
+        self._file_ids[key] = file_id
+        self._save()
+
+    def _drop(self, key):
+        if self._file_ids.pop(key, None):
+            self._save()
+
+    def _save(self):
+        try:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            atomic_write_json(self.path, self._file_ids)
+        except Exception as e:
+            logger.error("Не удалось сохранить кэш file_id: %s", e)
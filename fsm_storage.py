@@ -0,0 +1,87 @@
+import json
+import logging
+import sqlite3
+import time
+
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS fsm (
+    key TEXT PRIMARY KEY,
+    state TEXT,
+    data TEXT NOT NULL DEFAULT '{}',
+    updated REAL NOT NULL
+);
+"""
+
+
+def _key(key):
+    return f"{key.bot_id}:{key.chat_id}:{key.user_id}:{key.thread_id or ''}:{key.destiny}"
+
+
+class SQLiteStorage(BaseStorage):
+    """FSM-хранилище aiogram, переживающее перезапуск бота.
+
+    Каждое изменение сразу пишется в SQLite, а читается из словаря в
+    памяти, который целиком поднимается из базы одним запросом при старте.
+    Состояния, не менявшиеся дольше ttl секунд (брошенные на полпути
+    диалоги), считаются пустыми и удаляются.
+    """
+
+    def __init__(self, path, ttl=86400):
+        self.ttl = ttl
+        self._conn = sqlite3.connect(path, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(SCHEMA)
+        self._conn.execute("DELETE FROM fsm WHERE updated < ?", (time.time() - ttl,))
+        self._cache = {
+            key: [state, json.loads(data), updated]
+            for key, state, data, updated in self._conn.execute("SELECT key, state, data, updated FROM fsm")
+        }
+        logger.info("FSM: восстановлено состояний %s из %s", len(self._cache), path)
+
+    def _record(self, key):
+        record = self._cache.get(key)
+        if record is not None and time.time() - record[2] > self.ttl:
+            self._cache.pop(key)
+            self._conn.execute("DELETE FROM fsm WHERE key = ?", (key,))
+            return None
+        return record
+
+    def _write(self, key, state, data):
+        now = time.time()
+        if state is None and not data:
+            self._cache.pop(key, None)
+            self._conn.execute("DELETE FROM fsm WHERE key = ?", (key,))
+            return
+        self._cache[key] = [state, data, now]
+        self._conn.execute(
+            "INSERT INTO fsm (key, state, data, updated) VALUES (?, ?, ?, ?) "
+            "ON CONFLICT(key) DO UPDATE SET state = excluded.state, data = excluded.data, updated = excluded.updated",
+            (key, state, json.dumps(data, ensure_ascii=False, separators=(",", ":")), now),
+        )
+
+    async def set_state(self, key, state=None):
+        key = _key(key)
+        record = self._record(key)
+        self._write(key, state.state if isinstance(state, State) else state, record[1] if record else {})
+
+    async def get_state(self, key):
+        record = self._record(_key(key))
+        return record[0] if record else None
+
+    async def set_data(self, key, data):
+        key = _key(key)
+        record = self._record(key)
+        self._write(key, record[0] if record else None, dict(data))
+
+    async def get_data(self, key):
+        record = self._record(_key(key))
+        return dict(record[1]) if record else {}
+
+    async def close(self):
+        self._conn.close()
@@ -0,0 +1,46 @@
+import atexit
+import logging
+import queue
+import sys
+from logging.handlers import QueueHandler, QueueListener
+
+# Логгер для полных дампов конфига, записей и данных групп: молчит, пока не включён явно
+DUMP_LOGGER = "dump"
+LOG_FORMAT = "%(asctime)s %(levelname)s %(name)s: %(message)s"
+
+_listener = None
+
+
+def setup_logging(level="INFO", dumps=False, stream=None):
+    """Уровневое логирование с неблокирующей записью.
+
+    Обработчики корневого логгера заменяются одним QueueHandler: event loop
+    только кладёт запись в очередь, а форматирование в строку и запись в
+    поток делает отдельный поток QueueListener. Сообщения логируются в
+    %-стиле, так что аргументы не форматируются для отключённых уровней.
+    dumps=True включает логгер "dump" (полные словари конфига на DEBUG).
+    """
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+    handler = logging.StreamHandler(stream or sys.stdout)
+    handler.setFormatter(logging.Formatter(LOG_FORMAT))
+    records = queue.SimpleQueue()
+    root = logging.getLogger()
+    root.handlers = [QueueHandler(records)]
+    root.setLevel(level.upper() if isinstance(level, str) else level)
+    logging.getLogger(DUMP_LOGGER).setLevel(logging.DEBUG if dumps else logging.CRITICAL + 1)
+    _listener = QueueListener(records, handler, respect_handler_level=True)
+    _listener.start()
+    return _listener
+
+
+def stop_logging():
+    """Дописывает оставшиеся в очереди записи."""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+atexit.register(stop_logging)
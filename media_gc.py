@@ -0,0 +1,135 @@
+import logging
+import os
+import time
+
+from media_store import is_media_name
+
+logger = logging.getLogger(__name__)
+
+# Служебные файлы в media/, которые сборщик не трогает
+SERVICE_FILES = {"index.json", "file_ids.json"}
+
+
+def media_refs(content):
+    """Локальные файлы, на которые ссылается сохранённый контент (группа или запись расписания)."""
+    refs = set()
+    if content.get("media"):
+        refs.add(os.path.normpath(content["media"]))
+    for item in content.get("media_group") or ():
+        if item.get("file_path"):
+            refs.add(os.path.normpath(item["file_path"]))
+    return refs
+
+
+class MediaCollector:
+    """Счётчик ссылок на файлы media/ и сборщик файлов, на которые никто не ссылается.
+
+    Ссылки считаются по всем группам режима задержки и записям расписания и
+    обновляются событиями ConfigStore (старый набор файла владельца
+    сравнивается с новым). Файл удаляется не сразу, а когда на него нет
+    ссылок дольше grace секунд: рассылка, уже собравшая план со старым
+    путём, успеет его отправить, а только что скачанное медиа недособранного
+    альбома не пропадёт до сохранения.
+    """
+
+    def __init__(self, media_dir="media", grace=3600, media_store=None, file_id_cache=None):
+        self.media_dir = os.path.normpath(media_dir)
+        self.grace = grace
+        self.media_store = media_store
+        self.file_id_cache = file_id_cache
+        self._owners = {}
+        self._counts = {}
+        self._released = {}
+        self.deleted_files = 0
+        self.reclaimed_bytes = 0
+
+    def refcount(self, path):
+        return self._counts.get(os.path.normpath(path), 0)
+
+    def _set_refs(self, owner, refs):
+        old = self._owners.pop(owner, set())
+        if refs:
+            self._owners[owner] = refs
+        now = time.time()
+        for path in refs - old:
+            self._counts[path] = self._counts.get(path, 0) + 1
+            self._released.pop(path, None)
+        for path in old - refs:
+            self._counts[path] -= 1
+            if not self._counts[path]:
+                del self._counts[path]
+                self._released[path] = now
+
+    def rebuild(self, config):
+        for owner in list(self._owners):
+            self._set_refs(owner, set())
+        for chat, data in config.get("chats", {}).items():
+            self._set_refs(("chat", chat), media_refs(data))
+        for entries in config.get("scheduled", {}).values():
+            for entry in entries:
+                self._set_refs(("scheduled", entry.get("id")), media_refs(entry))
+
+    def on_config_event(self, event, key, payload):
+        if event == "chat":
+            self._set_refs(("chat", key), media_refs(payload))
+        elif event == "chat_removed":
+            self._set_refs(("chat", key), set())
+            for entry in payload:
+                self._set_refs(("scheduled", entry.get("id")), set())
+        elif event == "scheduled":
+            self._set_refs(("scheduled", payload.get("id")), media_refs(payload))
+        elif event == "scheduled_removed":
+            self._set_refs(("scheduled", payload), set())
+        elif event == "reloaded":
+            self.rebuild(payload)
+
+    def _own_files(self):
+        """Пути из индекса MediaStore: только такие файлы (и файлы с именами бота) можно удалять."""
+        if self.media_store is None:
+            return set()
+        return {os.path.normpath(item["path"]) for item in self.media_store.index.values() if item.get("path")}
+
+    def sweep(self, now=None):
+        """Удаляет созданные ботом файлы без ссылок старше grace; возвращает (файлов, байт).
+
+        Чужие файлы в media/ (например, сессия юзербота) не трогаются.
+        """
+        now = time.time() if now is None else now
+        files, reclaimed = 0, 0
+        try:
+            names = os.listdir(self.media_dir)
+        except FileNotFoundError:
+            return 0, 0
+        own = self._own_files()
+        for name in names:
+            path = os.path.join(self.media_dir, name)
+            if name in SERVICE_FILES or path in self._counts or not os.path.isfile(path):
+                continue
+            if not is_media_name(name) and path not in own:
+                continue
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            # Отсчёт — от освобождения последней ссылки или от появления файла
+            idle_since = max(self._released.get(path, 0), st.st_mtime)
+            if now - idle_since < self.grace:
+                continue
+            if self.file_id_cache is not None:
+                self.file_id_cache.forget(path)
+            if self.media_store is not None:
+                self.media_store.forget(os.path.splitext(name)[0])
+            try:
+                os.remove(path)
+            except OSError as e:
+                logger.warning("Не удалось удалить %s: %s", path, e)
+                continue
+            self._released.pop(path, None)
+            files += 1
+            reclaimed += st.st_size
+        self.deleted_files += files
+        self.reclaimed_bytes += reclaimed
+        if files:
+            logger.info("Очистка медиа: удалено %s файлов, освобождено %s байт (всего %s байт)",
+                        files, reclaimed, self.reclaimed_bytes)
+        return files, reclaimed
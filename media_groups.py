@@ -0,0 +1,82 @@
+import asyncio
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class _Album:
+    __slots__ = ("items", "caption_message", "on_complete", "context", "timer")
+
+    def __init__(self, on_complete, context):
+        self.items = []
+        self.caption_message = None
+        self.on_complete = on_complete
+        self.context = context
+        self.timer = None
+
+
+async def _no_context():
+    return None
+
+
+class MediaGroupCollector:
+    """Собирает альбом (сообщения с одним media_group_id) в памяти.
+
+    Telegram присылает каждый элемент альбома отдельным апдейтом и не
+    помечает последний. Элементы копятся по media_group_id, загрузка каждого
+    стартует сразу при получении, а альбом считается полным, когда quiet
+    секунд не приходило новых элементов. Тогда on_complete(items,
+    caption_message, context) вызывается один раз со всеми элементами в
+    порядке message_id — и альбом сохраняется одной записью.
+
+    prepare() — корутинная функция, которая выполняется один раз на альбом
+    (например, читает данные FSM); её результат context получают capture и
+    on_complete, так что элементы не читают состояние по отдельности.
+    """
+
+    def __init__(self, quiet=1.0):
+        self.quiet = quiet
+        self._albums = {}
+
+    def add(self, message, capture, on_complete, prepare=None):
+        """capture(context) -> корутина захвата элемента или None, если элемент загружать не нужно.
+
+        Захват запускается сразу, как только готов context; on_complete и
+        prepare берутся у первого элемента альбома.
+        """
+        album = self._albums.get(message.media_group_id)
+        if album is None:
+            context = asyncio.ensure_future((prepare or _no_context)())
+            album = self._albums[message.media_group_id] = _Album(on_complete, context)
+        album.items.append((message.message_id, asyncio.ensure_future(self._capture(album, capture))))
+        if album.caption_message is None and (message.caption or message.text):
+            album.caption_message = message
+        if album.timer is not None:
+            album.timer.cancel()
+        loop = asyncio.get_running_loop()
+        album.timer = loop.call_later(self.quiet, self._finish, message.media_group_id, message)
+
+    @staticmethod
+    async def _capture(album, capture):
+        job = capture(await album.context)
+        return await job if job is not None else None
+
+    def _finish(self, media_group_id, last_message):
+        album = self._albums.pop(media_group_id, None)
+        if album is not None:
+            asyncio.ensure_future(self._complete(media_group_id, album, last_message))
+
+    async def _complete(self, media_group_id, album, last_message):
+        album.items.sort(key=lambda item: item[0])
+        results = await asyncio.gather(*(task for _, task in album.items), return_exceptions=True)
+        items = []
+        for result in results:
+            if isinstance(result, Exception):
+                logger.error("Не удалось скачать элемент медиа-группы %s: %s", media_group_id, result)
+            elif result:
+                items.append(result)
+        logger.debug("Медиа-группа %s собрана: %s из %s элементов", media_group_id, len(items), len(results))
+        try:
+            await album.on_complete(items, album.caption_message or last_message, await album.context)
+        except Exception as e:
+            logger.error("Не удалось сохранить медиа-группу %s: %s", media_group_id, e)
@@ -0,0 +1,109 @@
+import asyncio
+import json
+import logging
+import os
+import re
+import tempfile
+from contextlib import suppress
+
+from config_store import atomic_write_json
+
+logger = logging.getLogger(__name__)
+
+# Имена файлов, которые создаёт сам бот: {file_unique_id}.jpg|.mp4 и временные .{file_unique_id}.XXXX.part
+MEDIA_NAME_RE = re.compile(r"^[A-Za-z0-9_-]+\.(jpg|mp4)$")
+PART_NAME_RE = re.compile(r"^\.[A-Za-z0-9_-]+\.[^/]*\.part$")
+
+
+def is_media_name(name):
+    """Файл в media/ создан ботом (скачанное медиа или недокачанный временный файл)."""
+    return bool(MEDIA_NAME_RE.match(name) or PART_NAME_RE.match(name))
+
+
+class MediaStore:
+    """Медиа владельца на диске, адресуемые по file_unique_id.
+
+    Файл скачивается один раз: если media/{file_unique_id}{ext} уже есть,
+    повторный захват (то же фото в другой группе, повторная пересылка) не
+    делает ни одного запроса к Bot API. Одновременные запросы одного файла
+    ждут одну загрузку, а разные файлы качаются параллельно, но не больше
+    concurrency сразу. Файл пишется во временный и переименовывается, так что
+    недокачанных файлов под рабочим именем не бывает. Размер и тип каждого
+    файла лежат в индексе media/index.json.
+    """
+
+    def __init__(self, bot, media_dir="media", concurrency=4):
+        self.bot = bot
+        self.media_dir = media_dir
+        self.index_path = os.path.join(media_dir, "index.json")
+        self.concurrency = concurrency
+        self._semaphore = None
+        self._inflight = {}
+        self.downloads = 0
+        self.hits = 0
+        try:
+            with open(self.index_path, 'r', encoding='utf-8') as f:
+                self.index = json.load(f)
+        except FileNotFoundError:
+            self.index = {}
+        except Exception as e:
+            logger.error("Не удалось загрузить индекс медиа: %s", e)
+            self.index = {}
+
+    def path_for(self, file_unique_id, extension):
+        return os.path.join(self.media_dir, f"{file_unique_id}{extension}")
+
+    async def fetch(self, file_id, file_unique_id, extension, media_type):
+        """Путь к локальной копии файла; скачивает его, только если копии ещё нет."""
+        path = self.path_for(file_unique_id, extension)
+        if os.path.isfile(path):
+            self.hits += 1
+            if file_unique_id not in self.index:
+                self._record(file_unique_id, path, media_type)
+            return path
+        task = self._inflight.get(file_unique_id)
+        if task is None:
+            task = self._inflight[file_unique_id] = asyncio.ensure_future(
+                self._download(file_id, file_unique_id, path, media_type))
+            task.add_done_callback(lambda _: self._inflight.pop(file_unique_id, None))
+        else:
+            self.hits += 1
+        return await asyncio.shield(task)
+
+    async def _download(self, file_id, file_unique_id, path, media_type):
+        if self._semaphore is None:
+            # Семафор создаётся в работающем event loop
+            self._semaphore = asyncio.Semaphore(max(self.concurrency, 1))
+        async with self._semaphore:
+            os.makedirs(self.media_dir, exist_ok=True)
+            file = await self.bot.get_file(file_id)
+            fd, tmp_path = tempfile.mkstemp(dir=self.media_dir, prefix=f".{file_unique_id}.", suffix=".part")
+            os.close(fd)
+            try:
+                # download_file пишет файл по частям, не держа его целиком в памяти
+                await self.bot.download_file(file.file_path, destination=tmp_path)
+                os.replace(tmp_path, path)
+            except BaseException:
+                with suppress(OSError):
+                    os.remove(tmp_path)
+                raise
+        self.downloads += 1
+        self._record(file_unique_id, path, media_type)
+        logger.info("Скачан файл %s (%s байт)", path, self.index[file_unique_id]["size"])
+        return path
+
+    def forget(self, file_unique_id):
+        """Убирает удалённый с диска файл из индекса."""
+        if self.index.pop(file_unique_id, None) is not None:
+            try:
+                atomic_write_json(self.index_path, self.index)
+            except Exception as e:
+                logger.error("Не удалось сохранить индекс медиа: %s", e)
+
+    def _record(self, file_unique_id, path, media_type):
+        self.index[file_unique_id] = {"path": path, "size": os.path.getsize(path), "type": media_type}
+        try:
+            atomic_write_json(self.index_path, self.index)
+        except Exception as e:
+            logger.error("Не удалось сохранить индекс медиа: %s", e)
+
@@ -0,0 +1,188 @@
+"""Метрики бота в текстовом формате Prometheus.
+
+Свой минимальный реестр (счётчики и гистограммы с метками) без внешних
+зависимостей; отдаётся HTTP-сервером aiohttp, который и так приходит с
+aiogram:
+
+    METRICS_PORT=9108 python main.py
+    curl http://127.0.0.1:9108/metrics
+"""
+import bisect
+import logging
+import time
+
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware
+
+logger = logging.getLogger(__name__)
+
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+LATENESS_BUCKETS = (0.1, 0.5, 1, 2, 5, 10, 30, 60, 120, 300)
+DURATION_BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5, 30)
+
+
+def _labels_text(names, values):
+    if not names:
+        return ""
+    pairs = ",".join(f'{name}="{_escape(value)}"' for name, value in zip(names, values))
+    return "{" + pairs + "}"
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+class Counter:
+    def __init__(self, name, help_text, labels=()):
+        self.name = name
+        self.help = help_text
+        self.labels = tuple(labels)
+        self._values = {}
+
+    def inc(self, amount=1, **labels):
+        key = tuple(labels.get(name, "") for name in self.labels)
+        self._values[key] = self._values.get(key, 0) + amount
+
+    def total(self):
+        return sum(self._values.values())
+
+    def items(self):
+        return self._values.items()
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        for key, value in sorted(self._values.items()):
+            lines.append(f"{self.name}{_labels_text(self.labels, key)} {value}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, help_text, buckets=LATENCY_BUCKETS, labels=()):
+        self.name = name
+        self.help = help_text
+        self.buckets = tuple(sorted(buckets))
+        self.labels = tuple(labels)
+        # метки -> [счётчики по бакетам (+Inf последним), сумма, количество]
+        self._series = {}
+
+    def observe(self, value, **labels):
+        key = tuple(labels.get(name, "") for name in self.labels)
+        series = self._series.get(key)
+        if series is None:
+            series = self._series[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+        series[0][bisect.bisect_left(self.buckets, value)] += 1
+        series[1] += value
+        series[2] += 1
+
+    def summary(self, **labels):
+        """(количество, среднее, приблизительный p95 по верхним границам бакетов)."""
+        key = tuple(labels.get(name, "") for name in self.labels)
+        series = self._series.get(key)
+        if not series or not series[2]:
+            return 0, 0.0, 0.0
+        counts, total, count = series
+        rank, seen = 0.95 * count, 0
+        p95 = float("inf")
+        for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+            seen += bucket_count
+            if seen >= rank:
+                p95 = bound
+                break
+        return count, total / count, p95
+
+    def label_values(self):
+        return [dict(zip(self.labels, key)) for key in sorted(self._series)]
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        for key, (counts, total, count) in sorted(self._series.items()):
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + ("+Inf",), counts):
+                cumulative += bucket_count
+                labels = _labels_text(self.labels + ("le",), key + (bound,))
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _labels_text(self.labels, key)
+            lines.append(f"{self.name}_sum{labels} {total}")
+            lines.append(f"{self.name}_count{labels} {count}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def render(self):
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+SEND_LATENCY = REGISTRY.register(Histogram(
+    "bot_send_latency_seconds", "Длительность запроса к Bot API по методу", LATENCY_BUCKETS, labels=("method",)))
+SEND_ERRORS = REGISTRY.register(Counter(
+    "bot_send_errors_total", "Неудачные отправки рассылки по чатам", labels=("chat",)))
+SCHEDULED_LATENESS = REGISTRY.register(Histogram(
+    "bot_scheduled_lateness_seconds", "Опоздание отправки по расписанию относительно entry[\"time\"]", LATENESS_BUCKETS))
+DELAY_CYCLE = REGISTRY.register(Histogram(
+    "bot_delay_loop_cycle_seconds", "Длительность отправки пачки групп рассылки по задержке", LATENCY_BUCKETS))
+CONFIG_LOAD = REGISTRY.register(Histogram(
+    "bot_config_load_seconds", "Время чтения конфига из хранилища (файл или SQLite)", DURATION_BUCKETS))
+CONFIG_SAVE = REGISTRY.register(Histogram(
+    "bot_config_save_seconds", "Время записи конфига: файл целиком или транзакция SQLite", DURATION_BUCKETS))
+MEDIA_RECLAIMED = REGISTRY.register(Counter(
+    "bot_media_reclaimed_bytes_total", "Байт освобождено сборщиком неиспользуемых медиа"))
+
+
+class MetricsMiddleware(BaseRequestMiddleware):
+    """Middleware сессии бота: длительность каждого запроса к Bot API по методу."""
+
+    async def __call__(self, make_request, bot, method):
+        start = time.perf_counter()
+        try:
+            return await make_request(bot, method)
+        finally:
+            SEND_LATENCY.observe(time.perf_counter() - start, method=method.__api_method__)
+
+
+def format_summary():
+    """Короткая сводка для владельца (HTML)."""
+    lines = ["<b>📊 Метрики</b>"]
+    for labels in SEND_LATENCY.label_values():
+        count, mean, p95 = SEND_LATENCY.summary(**labels)
+        lines.append(f"{labels['method']}: {count} запросов, среднее {mean:.2f} с, p95 ≤ {p95:g} с")
+    count, mean, p95 = SCHEDULED_LATENESS.summary()
+    lines.append(f"Опоздание по расписанию: {count} отправок, среднее {mean:.1f} с, p95 ≤ {p95:g} с")
+    count, mean, p95 = DELAY_CYCLE.summary()
+    lines.append(f"Пачки по задержке: {count}, среднее {mean:.2f} с")
+    count, mean, _ = CONFIG_LOAD.summary()
+    lines.append(f"Чтение конфига: {count} раз, среднее {mean * 1000:.2f} мс")
+    count, mean, _ = CONFIG_SAVE.summary()
+    lines.append(f"Запись конфига: {count} раз, среднее {mean * 1000:.2f} мс")
+    errors = sorted(SEND_ERRORS.items(), key=lambda item: -item[1])
+    lines.append(f"Ошибок отправки: {SEND_ERRORS.total()}")
+    for (chat,), value in errors[:10]:
+        lines.append(f"  {chat}: {value}")
+    return "\n".join(lines)
+
+
+async def start_metrics_server(port, host="127.0.0.1"):
+    """Отдаёт REGISTRY на http://host:port/metrics; возвращает runner для остановки."""
+    from aiohttp import web
+
+    async def handle(request):
+        return web.Response(body=REGISTRY.render().encode("utf-8"),
+                            headers={"Content-Type": "text/plain; version=0.0.4; charset=utf-8"})
+
+    app = web.Application()
+    app.router.add_get("/metrics", handle)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    logger.info("Метрики Prometheus: http://%s:%s/metrics", host, port)
+    return runner
@@ -0,0 +1,220 @@
+"""Надёжная очередь отправок (outbox) в SQLite для отдельных процессов-отправителей.
+
+Админ-бот (SENDER_MODE=outbox) только кладёт в очередь "что и куда
+отправить" вместе со снимком сообщения, а рассылку выполняют процессы
+sender_worker.py — их можно запустить сколько угодно. Задание берётся в
+работу под аренду (lease): пока аренда действует, другой процесс его не
+получит; если отправитель упал, задание вернётся в очередь по истечении
+аренды.
+"""
+import json
+import logging
+import os
+import socket
+import sqlite3
+import time
+from collections import namedtuple
+from contextlib import contextmanager
+
+from file_ids import FileIdCache, load_file_ids
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS outbox (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    kind TEXT NOT NULL,
+    chat TEXT NOT NULL,
+    ref TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    dedup_key TEXT UNIQUE,
+    status TEXT NOT NULL DEFAULT 'pending',
+    not_before REAL NOT NULL,
+    not_after REAL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    lease_owner TEXT,
+    lease_until REAL,
+    created REAL NOT NULL,
+    finished REAL,
+    error TEXT
+);
+CREATE INDEX IF NOT EXISTS outbox_ready ON outbox(status, not_before);
+CREATE INDEX IF NOT EXISTS outbox_ref ON outbox(kind, ref, status);
+CREATE TABLE IF NOT EXISTS file_ids (
+    key TEXT PRIMARY KEY,
+    file_id TEXT NOT NULL
+);
+"""
+
+# Задание в аренде: тип ("scheduled"/"delay"), ссылка — id записи или группа,
+# payload — снимок сохранённого сообщения (JSON-строка), attempt — номер попытки
+OutboxItem = namedtuple("OutboxItem", "id kind chat ref payload attempt")
+STATUSES = ("pending", "leased", "done", "failed", "expired")
+
+
+def worker_id():
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+class Outbox:
+    def __init__(self, path, check_same_thread=True):
+        # check_same_thread=False — если соединение используется из отдельного потока
+        # (админ-бот обращается к outbox через однопоточный executor, вне event loop)
+        self.path = path
+        self._conn = sqlite3.connect(path, isolation_level=None, timeout=30, check_same_thread=check_same_thread)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(SCHEMA)
+
+    def close(self):
+        self._conn.close()
+
+    @contextmanager
+    def _transaction(self):
+        # BEGIN IMMEDIATE сразу берёт блокировку записи: два процесса не заберут одно задание
+        self._conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield self._conn
+        except BaseException:
+            self._conn.execute("ROLLBACK")
+            raise
+        self._conn.execute("COMMIT")
+
+    def enqueue(self, kind, chat, ref, payload, dedup_key=None, not_before=None, not_after=None, coalesce=False):
+        """Кладёт задание; возвращает его id или None, если такое уже есть.
+
+        dedup_key не даёт поставить одну отправку дважды (например, запись
+        расписания за конкретный день). coalesce=True пропускает задание,
+        если по этой же ссылке ещё есть невыполненное — так медленный
+        отправитель не копит очередь из одинаковых сообщений режима задержки.
+        """
+        now = time.time()
+        with self._transaction() as conn:
+            if coalesce and conn.execute(
+                "SELECT 1 FROM outbox WHERE kind = ? AND ref = ? AND status IN ('pending', 'leased') LIMIT 1",
+                (kind, str(ref)),
+            ).fetchone():
+                return None
+            cursor = conn.execute(
+                "INSERT OR IGNORE INTO outbox (kind, chat, ref, payload, dedup_key, not_before, not_after, created) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (kind, chat, str(ref), json.dumps(payload, ensure_ascii=False, separators=(",", ":")),
+                 dedup_key, now if not_before is None else not_before, not_after, now),
+            )
+            return cursor.lastrowid if cursor.rowcount else None
+
+    def claim(self, owner, limit=20, lease=180):
+        """Забирает до limit готовых заданий в аренду на lease секунд.
+
+        Готовые — ожидающие со сроком not_before в прошлом и взятые кем-то,
+        чья аренда истекла (процесс упал). Просроченные по not_after
+        помечаются expired и не отправляются.
+        """
+        now = time.time()
+        with self._transaction() as conn:
+            conn.execute(
+                "UPDATE outbox SET status = 'expired', finished = ?, lease_owner = NULL "
+                "WHERE status IN ('pending', 'leased') AND not_after IS NOT NULL AND not_after < ? "
+                "AND (status = 'pending' OR lease_until < ?)",
+                (now, now, now),
+            )
+            rows = conn.execute(
+                "SELECT id, kind, chat, ref, payload, attempts FROM outbox "
+                "WHERE (status = 'pending' AND not_before <= ?) OR (status = 'leased' AND lease_until < ?) "
+                "ORDER BY not_before, id LIMIT ?",
+                (now, now, limit),
+            ).fetchall()
+            conn.executemany(
+                "UPDATE outbox SET status = 'leased', lease_owner = ?, lease_until = ?, attempts = attempts + 1 WHERE id = ?",
+                [(owner, now + lease, row[0]) for row in rows],
+            )
+        return [OutboxItem(row[0], row[1], row[2], row[3], row[4], row[5] + 1) for row in rows]
+
+    def complete(self, item_id, owner):
+        """Отмечает задание выполненным; False — аренда уже ушла другому процессу."""
+        with self._transaction() as conn:
+            cursor = conn.execute(
+                "UPDATE outbox SET status = 'done', finished = ?, error = NULL WHERE id = ? AND lease_owner = ? AND status = 'leased'",
+                (time.time(), item_id, owner),
+            )
+        return cursor.rowcount == 1
+
+    def fail(self, item_id, owner, error, retry_in=None):
+        """Ошибка отправки: повтор через retry_in секунд или окончательный отказ (retry_in=None)."""
+        now = time.time()
+        with self._transaction() as conn:
+            if retry_in is None:
+                cursor = conn.execute(
+                    "UPDATE outbox SET status = 'failed', finished = ?, error = ? WHERE id = ? AND lease_owner = ? AND status = 'leased'",
+                    (now, str(error)[:500], item_id, owner),
+                )
+            else:
+                cursor = conn.execute(
+                    "UPDATE outbox SET status = 'pending', not_before = ?, error = ?, lease_owner = NULL, lease_until = NULL "
+                    "WHERE id = ? AND lease_owner = ? AND status = 'leased'",
+                    (now + retry_in, str(error)[:500], item_id, owner),
+                )
+        return cursor.rowcount == 1
+
+    def counts(self):
+        counts = dict.fromkeys(STATUSES, 0)
+        counts.update(self._conn.execute("SELECT status, COUNT(*) FROM outbox GROUP BY status").fetchall())
+        return counts
+
+    def recent_failures(self, limit=10):
+        return self._conn.execute(
+            "SELECT chat, kind, error, finished FROM outbox WHERE status = 'failed' ORDER BY finished DESC LIMIT ?", (limit,)
+        ).fetchall()
+
+    def purge(self, older_than):
+        """Удаляет завершённые задания старше older_than секунд."""
+        with self._transaction() as conn:
+            cursor = conn.execute(
+                "DELETE FROM outbox WHERE status IN ('done', 'failed', 'expired') AND finished < ?",
+                (time.time() - older_than,),
+            )
+        return cursor.rowcount
+
+
+class OutboxFileIdCache(FileIdCache):
+    """Кэш file_id в таблице file_ids базы outbox — общий для админ-бота и всех отправителей.
+
+    Каждое чтение и изменение сразу идёт в базу (одна инструкция — одна
+    транзакция): file_id, полученный одним отправителем, видят остальные, а
+    забытый сборщиком медиа админ-бота не отправляется больше никем. Отдельные
+    JSON-кэши процессов затирали бы изменения друг друга.
+    """
+
+    def __init__(self, db_path, media_dir="media", legacy_path=None):
+        self.legacy_path = legacy_path
+        super().__init__(db_path, media_dir)
+
+    def _load(self):
+        # Своё соединение: кэш вызывается из event loop, а не из потока outbox
+        self._conn = sqlite3.connect(self.path, isolation_level=None, timeout=5)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(SCHEMA)
+        if self.legacy_path and not self._conn.execute("SELECT 1 FROM file_ids LIMIT 1").fetchone():
+            # Первый запуск с общей таблицей: переносим накопленный JSON-кэш
+            legacy = load_file_ids(self.legacy_path)
+            self._conn.executemany("INSERT OR IGNORE INTO file_ids(key, file_id) VALUES (?, ?)", legacy.items())
+        return None
+
+    def _lookup(self, key):
+        row = self._conn.execute("SELECT file_id FROM file_ids WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def _store(self, key, file_id):
+        try:
+            self._conn.execute(
+                "INSERT INTO file_ids(key, file_id) VALUES (?, ?) ON CONFLICT(key) DO UPDATE SET file_id = excluded.file_id",
+                (key, file_id),
+            )
+        except sqlite3.Error as e:
+            logger.error("Не удалось сохранить file_id: %s", e)
+
+    def _drop(self, key):
+        try:
+            self._conn.execute("DELETE FROM file_ids WHERE key = ?", (key,))
+        except sqlite3.Error as e:
+            logger.error("Не удалось удалить file_id: %s", e)
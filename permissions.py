@@ -0,0 +1,82 @@
+import asyncio
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+ADMIN_STATUSES = ("administrator", "creator")
+
+
+def chat_keys(chat):
+    """Ключи, под которыми чат может лежать в конфиге: id и @username."""
+    keys = [str(chat.id)]
+    if getattr(chat, "username", None):
+        keys.append("@" + chat.username.lower())
+    return keys
+
+
+def _key(chat_id):
+    chat_id = str(chat_id)
+    return chat_id.lower() if chat_id.startswith("@") else chat_id
+
+
+class AdminStatusCache:
+    """Статус бота в группах с TTL вместо get_chat_member перед каждой отправкой.
+
+    Статус обновляется из апдейтов my_chat_member (бота повысили, понизили,
+    удалили), а по истечении ttl — одним фоновым запросом. Путь отправки
+    только читает кэш и никогда не ждёт Bot API; api_calls_saved считает
+    отправки, которым не понадобился get_chat_member.
+    """
+
+    def __init__(self, ttl=3600):
+        self.ttl = ttl
+        self._status = {}
+        self._refreshing = {}
+        self.api_calls_saved = 0
+        self.refreshes = 0
+
+    def get(self, chat_id, now=None):
+        now = time.monotonic() if now is None else now
+        cached = self._status.get(_key(chat_id))
+        if cached is None or cached[1] <= now:
+            return None
+        return cached[0]
+
+    def set(self, chat_id, status, now=None):
+        now = time.monotonic() if now is None else now
+        self._status[_key(chat_id)] = (status, now + self.ttl)
+
+    def forget(self, chat_id):
+        self._status.pop(_key(chat_id), None)
+
+    def on_my_chat_member(self, update):
+        """Апдейт my_chat_member: новый статус бота в чате, без запроса к API."""
+        status = update.new_chat_member.status
+        for key in chat_keys(update.chat):
+            self.set(key, status)
+        logger.info("Статус бота в %s: %s -> %s", update.chat.username or update.chat.id, update.old_chat_member.status, status)
+
+    async def refresh(self, bot, chat_id):
+        self.refreshes += 1
+        try:
+            member = await bot.get_chat_member(chat_id=chat_id, user_id=bot.id)
+            self.set(chat_id, member.status)
+        except Exception as e:
+            logger.warning("Не удалось проверить права бота в %s: %s", chat_id, e)
+            # Не повторяем запрос на каждую отправку: ждём апдейта или следующего TTL
+            self.set(chat_id, "unknown")
+        finally:
+            self._refreshing.pop(_key(chat_id), None)
+
+    def check(self, bot, chat_id):
+        """Статус из кэша для пути отправки; устаревший статус обновляется в фоне."""
+        status = self.get(chat_id)
+        if status is None:
+            if _key(chat_id) not in self._refreshing:
+                self._refreshing[_key(chat_id)] = asyncio.create_task(self.refresh(bot, chat_id))
+            return None
+        self.api_calls_saved += 1
+        if status not in ADMIN_STATUSES and status != "unknown":
+            logger.warning("Бот не является администратором в %s, статус: %s", chat_id, status)
+        return status
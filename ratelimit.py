@@ -0,0 +1,123 @@
+import asyncio
+import logging
+import time
+
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware
+from aiogram.exceptions import TelegramRetryAfter
+
+logger = logging.getLogger(__name__)
+
+# Как часто выбрасывать вёдра простаивающих чатов, секунд
+PRUNE_INTERVAL = 60
+
+
+class TokenBucket:
+    """Ведро токенов с резервированием: reserve() возвращает, сколько нужно подождать."""
+
+    def __init__(self, rate, capacity=None):
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(rate, 1)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+
+    def reserve(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        self.tokens -= 1
+        return max(0.0, -self.tokens / self.rate)
+
+    def is_full(self, now):
+        # Полное ведро ничем не отличается от нового — его можно выбросить
+        return self.tokens + (now - self.updated) * self.rate >= self.capacity
+
+
+def is_group_chat(chat_id):
+    # Личные чаты — положительные id; группы и каналы — отрицательные id или @username
+    if isinstance(chat_id, int):
+        return chat_id < 0
+    return not str(chat_id).isdigit()
+
+
+class RateLimiter:
+    """Общий лимит Bot API + лимит на чат + поминутный бюджет на группу.
+
+    Перед каждой отправкой резервируется токен во всех подходящих вёдрах и
+    выдерживается максимальная из задержек. Если Telegram всё же ответил
+    429 (RetryAfter), чат блокируется на указанное время и отправка
+    повторяется, а не теряется. Время ожидания копится в stats.
+    """
+
+    def __init__(self, global_per_sec=30, chat_per_sec=1, group_per_min=20, max_retries=3):
+        self.global_bucket = TokenBucket(global_per_sec)
+        self.chat_per_sec = chat_per_sec
+        self.group_per_min = group_per_min
+        self.max_retries = max_retries
+        self._chat_buckets = {}
+        self._group_buckets = {}
+        self._blocked_until = {}
+        self._pruned_at = time.monotonic()
+        self.stats = {"requests": 0, "throttled": 0, "throttled_seconds": 0.0, "retry_after": 0, "retry_after_seconds": 0.0}
+
+    def _prune(self, now):
+        """Выбрасывает вёдра, успевшие наполниться, и истёкшие блокировки: иначе словари растут с каждым новым чатом."""
+        self._pruned_at = now
+        for buckets in (self._chat_buckets, self._group_buckets):
+            for chat_id in [chat_id for chat_id, bucket in buckets.items() if bucket.is_full(now)]:
+                del buckets[chat_id]
+        self._blocked_until = {chat_id: until for chat_id, until in self._blocked_until.items() if until > now}
+
+    def _delay_for(self, chat_id, now):
+        if now - self._pruned_at >= PRUNE_INTERVAL:
+            self._prune(now)
+        wait = self.global_bucket.reserve(now)
+        if chat_id is not None:
+            group = is_group_chat(chat_id)
+            bucket = self._chat_buckets.get(chat_id)
+            if bucket is None:
+                # В личке (ответы владельцу) разрешаем короткую пачку из нескольких сообщений
+                bucket = self._chat_buckets[chat_id] = TokenBucket(self.chat_per_sec, 1 if group else 3)
+            wait = max(wait, bucket.reserve(now))
+            if group:
+                bucket = self._group_buckets.get(chat_id)
+                if bucket is None:
+                    bucket = self._group_buckets[chat_id] = TokenBucket(self.group_per_min / 60, self.group_per_min)
+                wait = max(wait, bucket.reserve(now))
+            wait = max(wait, self._blocked_until.get(chat_id, 0) - now)
+        return wait
+
+    async def acquire(self, chat_id):
+        self.stats["requests"] += 1
+        wait = self._delay_for(chat_id, time.monotonic())
+        if wait > 0:
+            self.stats["throttled"] += 1
+            self.stats["throttled_seconds"] += wait
+            await asyncio.sleep(wait)
+
+    def block(self, chat_id, seconds):
+        self.stats["retry_after"] += 1
+        self.stats["retry_after_seconds"] += seconds
+        self._blocked_until[chat_id] = max(self._blocked_until.get(chat_id, 0), time.monotonic() + seconds)
+
+    async def call(self, chat_id, make_call):
+        """Выполняет make_call() с учётом лимитов, повторяя её после RetryAfter."""
+        for attempt in range(self.max_retries + 1):
+            await self.acquire(chat_id)
+            try:
+                return await make_call()
+            except TelegramRetryAfter as e:
+                if attempt >= self.max_retries:
+                    raise
+                logger.warning("RetryAfter для %s: ждём %s с (попытка %s)", chat_id, e.retry_after, attempt + 1)
+                self.block(chat_id, e.retry_after)
+
+
+class RateLimitMiddleware(BaseRequestMiddleware):
+    """Middleware сессии бота: все методы send* проходят через RateLimiter."""
+
+    def __init__(self, limiter):
+        self.limiter = limiter
+
+    async def __call__(self, make_request, bot, method):
+        if not method.__api_method__.startswith("send"):
+            return await make_request(bot, method)
+        return await self.limiter.call(getattr(method, "chat_id", None), lambda: make_request(bot, method))
@@ -0,0 +1,177 @@
+"""Правила повторения записей расписания.
+
+Поле "time" записи — компактное правило из слов через пробел:
+
+    15:30:25                       каждый день в 15:30:25 (старый формат)
+    10:00 пн-пт                    по будням
+    09:00-18:00/15м пн,ср,пт       каждые 15 минут с 9 до 18 по пн, ср, пт
+    12:00 2026-11-01..2026-11-30   каждый день в ноябре
+    23:59 2026-12-31               один раз
+
+Время (ЧЧ:ММ или ЧЧ:ММ:СС, либо интервал ЧЧ:ММ-ЧЧ:ММ/N с шагом в
+с/м/ч, по умолчанию минуты) обязательно, дни недели и даты — нет. Одна
+такая запись заменяет сотни записей-дубликатов, а следующее срабатывание
+считается арифметикой, без перебора.
+"""
+import datetime
+import re
+from functools import lru_cache
+
+DAY_NAMES = ("пн", "вт", "ср", "чт", "пт", "сб", "вс")
+_DAY_ALIASES = {name: i for i, name in enumerate(DAY_NAMES)}
+_DAY_ALIASES.update({name: i for i, name in enumerate(("mo", "tu", "we", "th", "fr", "sa", "su"))})
+ALL_DAYS = 0b1111111
+
+_TIME = r"(\d{1,2}):(\d{2})(?::(\d{2}))?"
+_TIME_RE = re.compile(rf"^{_TIME}$")
+_INTERVAL_RE = re.compile(rf"^{_TIME}-{_TIME}/(\d+)([смчsmh]?)$")
+_DATES_RE = re.compile(r"^(\d{4}-\d{2}-\d{2})?(\.\.)?(\d{4}-\d{2}-\d{2})?$")
+_STEP_UNITS = {"с": 1, "s": 1, "м": 60, "m": 60, "": 60, "ч": 3600, "h": 3600}
+
+RULE_HELP = (
+    "ЧЧ:ММ:СС — каждый день; 10:00 пн-пт — по дням недели; "
+    "09:00-18:00/15м — каждые 15 минут в интервале; "
+    "2026-11-01..2026-11-30 или 2026-12-31 — только в эти даты"
+)
+
+
+def _seconds(hours, minutes, seconds):
+    hours, minutes, seconds = int(hours), int(minutes), int(seconds or 0)
+    if not (0 <= hours < 24 and 0 <= minutes < 60 and 0 <= seconds < 60):
+        raise ValueError("некорректное время")
+    return hours * 3600 + minutes * 60 + seconds
+
+
+def _format_seconds(value):
+    hours, rest = divmod(value, 3600)
+    minutes, seconds = divmod(rest, 60)
+    return f"{hours:02d}:{minutes:02d}:{seconds:02d}" if seconds else f"{hours:02d}:{minutes:02d}"
+
+
+def _parse_days(token):
+    mask = 0
+    for part in token.split(","):
+        first, _, last = part.partition("-")
+        if first not in _DAY_ALIASES or (last and last not in _DAY_ALIASES):
+            return None
+        start = _DAY_ALIASES[first]
+        end = _DAY_ALIASES[last] if last else start
+        # Диапазон может переходить через воскресенье: пт-пн
+        for offset in range((end - start) % 7 + 1):
+            mask |= 1 << (start + offset) % 7
+    return mask
+
+
+def _format_days(mask):
+    parts, day = [], 0
+    while day < 7:
+        if not mask >> day & 1:
+            day += 1
+            continue
+        end = day
+        while end + 1 < 7 and mask >> (end + 1) & 1:
+            end += 1
+        if end - day >= 2:
+            parts.append(f"{DAY_NAMES[day]}-{DAY_NAMES[end]}")
+        else:
+            parts.extend(DAY_NAMES[day:end + 1])
+        day = end + 1
+    return ",".join(parts)
+
+
+class Rule:
+    """Разобранное правило: моменты start, start+step, ... <= end в выбранные дни и даты."""
+
+    def __init__(self, start, end, step, days, first_date, last_date):
+        self.start = start
+        self.end = end
+        self.step = step
+        self.days = days
+        self.first_date = first_date
+        self.last_date = last_date
+
+    def __str__(self):
+        if self.step:
+            step, unit = (self.step // 3600, "ч") if self.step % 3600 == 0 else \
+                (self.step // 60, "м") if self.step % 60 == 0 else (self.step, "с")
+            parts = [f"{_format_seconds(self.start)}-{_format_seconds(self.end)}/{step}{unit}"]
+        else:
+            parts = [_format_seconds(self.start)]
+        if self.days != ALL_DAYS:
+            parts.append(_format_days(self.days))
+        if self.first_date and self.first_date == self.last_date:
+            parts.append(self.first_date.isoformat())
+        elif self.first_date or self.last_date:
+            parts.append(f"{self.first_date or ''}..{self.last_date or ''}")
+        return " ".join(parts)
+
+    def _next_in_day(self, offset):
+        # Первое срабатывание в течение суток не раньше offset секунд от полуночи
+        if offset <= self.start:
+            return self.start
+        if not self.step:
+            return None
+        value = self.start + -(-(offset - self.start) // self.step) * self.step
+        return value if value <= self.end else None
+
+    def next_at_or_after(self, moment):
+        """Ближайшее срабатывание не раньше moment (None, если правило исчерпано)."""
+        day = moment.date()
+        offset = moment.hour * 3600 + moment.minute * 60 + moment.second + (1 if moment.microsecond else 0)
+        if self.first_date and day < self.first_date:
+            day, offset = self.first_date, 0
+        # Маска дней недели пропускает не больше 6 дней подряд
+        for _ in range(8):
+            if self.last_date and day > self.last_date:
+                return None
+            if self.days >> day.weekday() & 1:
+                value = self._next_in_day(offset)
+                if value is not None:
+                    return datetime.datetime.combine(day, datetime.time()) + datetime.timedelta(seconds=value)
+            day += datetime.timedelta(days=1)
+            offset = 0
+        return None
+
+
+@lru_cache(maxsize=4096)
+def parse_rule(text):
+    """Строка правила -> Rule; ValueError с описанием, если строка некорректна.
+
+    Результат кэшируется: цикл расписания не разбирает строки заново.
+    """
+    if not isinstance(text, str) or not text.strip():
+        raise ValueError("пустое правило")
+    start = end = None
+    step, days, first_date, last_date = 0, None, None, None
+    for token in text.lower().split():
+        if (match := _TIME_RE.match(token)) and start is None:
+            start = end = _seconds(*match.groups())
+        elif (match := _INTERVAL_RE.match(token)) and start is None:
+            start = _seconds(*match.group(1, 2, 3))
+            end = _seconds(*match.group(4, 5, 6))
+            step = int(match.group(7)) * _STEP_UNITS[match.group(8)]
+            if not step or end < start:
+                raise ValueError(f"некорректный интервал: {token}")
+        elif (match := _DATES_RE.match(token)) and token != ".." and first_date is last_date is None:
+            try:
+                first = datetime.date.fromisoformat(match.group(1)) if match.group(1) else None
+                last = datetime.date.fromisoformat(match.group(3)) if match.group(3) else None
+            except ValueError:
+                raise ValueError(f"некорректная дата: {token}") from None
+            if not match.group(2):
+                first = last = first or last
+            elif first and last and last < first:
+                raise ValueError(f"конец периода раньше начала: {token}")
+            first_date, last_date = first, last
+        elif days is None and (mask := _parse_days(token)):
+            days = mask
+        else:
+            raise ValueError(f"непонятная часть правила: {token}")
+    if start is None:
+        raise ValueError("не указано время")
+    return Rule(start, end, step, ALL_DAYS if days is None else days, first_date, last_date)
+
+
+def normalize_rule(text):
+    """Каноническая запись правила (для хранения и сравнения на дубликаты)."""
+    return str(parse_rule(text.strip()))
@@ -0,0 +1,374 @@
+import asyncio
+import datetime
+import heapq
+import itertools
+import logging
+import time
+from contextlib import suppress
+
+from recurrence import parse_rule
+
+logger = logging.getLogger(__name__)
+
+# Сколько секунд после назначенного времени запись ещё можно "догнать"
+CATCH_UP_WINDOW = 300
+
+
+# Расхождение настенных и монотонных часов за один сон, после которого считаем, что часы перевели
+CLOCK_JUMP_THRESHOLD = 2
+
+UTC = datetime.timezone.utc
+
+
+def utc_now():
+    return datetime.datetime.now(UTC)
+
+
+def to_utc(local, tz=None, fold=0):
+    """Настенное время в часовом поясе tz (None — системный) -> момент в UTC."""
+    if tz is None:
+        return local.replace(fold=fold).astimezone(UTC)
+    return local.replace(tzinfo=tz, fold=fold).astimezone(UTC)
+
+
+def to_local(moment, tz=None):
+    """Момент (aware) -> настенное время в часовом поясе tz без tzinfo."""
+    return moment.astimezone(tz).replace(tzinfo=None)
+
+
+def entry_rule(entry):
+    """Разобранное правило записи (None и запись в лог, если правило некорректно)."""
+    try:
+        return parse_rule(entry.get("time"))
+    except ValueError as e:
+        logger.error("Некорректное время в записи #%s: %s (%s)", entry.get('id'), entry.get('time'), e)
+        return None
+
+
+def sent_mark(fire):
+    """Значение last_sent_date после отправки срабатывания fire (момент в UTC)."""
+    return fire.isoformat(timespec="seconds")
+
+
+def sent_through(entry, tz=None):
+    """Момент (UTC) последнего отправленного срабатывания записи (None, если ещё не отправлялась).
+
+    Старые записи хранят в last_sent_date только дату ("2024-05-01") — она
+    означает, что за этот день запись уже отправлена — или настенное время
+    без смещения; оба считаются временем часового пояса tz.
+    """
+    value = entry.get("last_sent_date")
+    if not value:
+        return None
+    if "T" not in value:
+        value += "T23:59:59"
+    moment = datetime.datetime.fromisoformat(value)
+    if moment.tzinfo is None:
+        return to_utc(moment, tz)
+    return moment.astimezone(UTC)
+
+
+def is_sent(entry, fire, tz=None):
+    sent = sent_through(entry, tz)
+    return sent is not None and fire <= sent
+
+
+def next_occurrence(rule, start, tz=None):
+    """Первое срабатывание правила (момент в UTC) не раньше start (UTC).
+
+    Правило задано в настенном времени tz. Время из "потерянного" при
+    переходе на летнее время часа срабатывает на час позже (02:30 -> 03:30),
+    а время из повторяющегося при переходе на зимнее часа — один раз, в
+    первый проход.
+    """
+    local = to_local(start, tz)
+    # Больше одной итерации бывает только во втором проходе повторяющегося часа
+    while True:
+        candidate = rule.next_at_or_after(local)
+        if candidate is None:
+            return None
+        moment = to_utc(candidate, tz)
+        if moment >= start:
+            return moment
+        local = candidate + datetime.timedelta(seconds=1)
+
+
+def next_fire_time(entry, now, window=CATCH_UP_WINDOW, tz=None):
+    """Ближайший момент отправки записи (UTC) относительно now (None, если правило некорректно или исчерпано).
+
+    Если срабатывание уже прошло, но не больше чем на window секунд и ещё
+    не отправлялось — возвращается оно, и запись считается просроченной,
+    но ещё актуальной. Отправленные срабатывания отсекаются по
+    last_sent_date, а не по часам, поэтому перевод часов назад не
+    приводит к повторной отправке.
+    """
+    rule = entry_rule(entry)
+    if rule is None:
+        return None
+    start = now - datetime.timedelta(seconds=window)
+    sent = sent_through(entry, tz)
+    if sent is not None and sent >= start:
+        start = sent + datetime.timedelta(seconds=1)
+    return next_occurrence(rule, start, tz)
+
+
+class BurstPlanner:
+    """Растягивает "залп" записей с одним временем отправки по бюджету отправок.
+
+    Без него десятки записей на 10:00:00 уходят разом и выбирают всё ведро
+    общего лимита, а ответы владельцу и режим задержки ждут. Записи залпа
+    упорядочиваются по id (порядок создания) и получают сдвиги 0, 1/rate,
+    2/rate, ... — но не больше max_skew: дальше записи отправляются без
+    паузы, и их темп держит уже RateLimiter.
+    """
+
+    def __init__(self, rate, max_skew=60):
+        self.rate = rate
+        self.max_skew = max_skew
+
+    def offset(self, position):
+        if self.rate <= 0:
+            return 0.0
+        return min(position / self.rate, self.max_skew)
+
+    def plan(self, due):
+        """[(группа, запись, назначенное время)] -> [(момент начала отправки, группа, запись, назначенное время)]."""
+        planned = []
+        positions = {}
+        for group, entry, fire in sorted(due, key=lambda item: (item[2], item[1]["id"])):
+            position = positions[fire] = positions.get(fire, -1) + 1
+            planned.append((fire + datetime.timedelta(seconds=self.offset(position)), group, entry, fire))
+        return planned
+
+    def expected_duration(self, size):
+        """Ожидаемое время (с) от назначенного момента до начала последней отправки залпа из size записей."""
+        if size <= 1 or self.rate <= 0:
+            return 0.0
+        return (size - 1) / self.rate
+
+
+class ScheduleIndex:
+    """Min-heap записей расписания по времени следующей отправки.
+
+    В куче у каждой записи ровно одно ближайшее срабатывание её правила;
+    следующее вычисляется при отметке об отправке (событие scheduled_sent).
+
+    Вместо опроса всех записей каждые 5 секунд цикл спит ровно до ближайшего
+    дедлайна. Изменения записей приходят событиями из ConfigStore и
+    обновляют кучу точечно: устаревшие элементы не удаляются из кучи, а
+    отбрасываются при извлечении (по номеру поколения записи).
+    """
+
+    def __init__(self, window=CATCH_UP_WINDOW, tz=None):
+        self.window = window
+        self.tz = tz
+        self.clock_jumps = 0
+        self._heap = []
+        self._generation = {}
+        self._counter = itertools.count()
+        self.changed = asyncio.Event()
+
+    def __len__(self):
+        return len(self._generation)
+
+    def _push(self, group, entry_id, fire, due_at):
+        generation = next(self._counter)
+        self._generation[entry_id] = generation
+        heapq.heappush(self._heap, (due_at, generation, entry_id, group, fire))
+        self.changed.set()
+
+    def rebuild(self, scheduled, now=None):
+        now = now or utc_now()
+        self._heap = []
+        self._generation = {}
+        for group, entries in scheduled.items():
+            for entry in entries:
+                fire = next_fire_time(entry, now, self.window, self.tz)
+                if fire is None:
+                    # Правило некорректно или больше не сработает (разовая дата прошла)
+                    continue
+                generation = next(self._counter)
+                self._generation[entry["id"]] = generation
+                self._heap.append((fire, generation, entry["id"], group, fire))
+        heapq.heapify(self._heap)
+        self.changed.set()
+
+    def upsert(self, group, entry, now=None):
+        fire = next_fire_time(entry, now or utc_now(), self.window, self.tz)
+        if fire is None:
+            self.remove(entry.get("id"))
+            return
+        self._push(group, entry["id"], fire, fire)
+
+    def retry(self, group, entry, fire, delay):
+        """Повторная попытка через delay секунд, пока не закрылось окно догонялки (потом — skip)."""
+        due_at = utc_now() + datetime.timedelta(seconds=delay)
+        if (due_at - fire).total_seconds() <= self.window:
+            self._push(group, entry["id"], fire, due_at)
+        else:
+            self.skip(group, entry, fire)
+
+    def skip(self, group, entry, fire):
+        """Срабатывание fire не состоялось и повторяться не будет: запись ждёт следующего."""
+        rule = entry_rule(entry)
+        after = next_occurrence(rule, fire + datetime.timedelta(seconds=1), self.tz) if rule else None
+        if after is None:
+            self.remove(entry.get("id"))
+            return
+        self._push(group, entry["id"], after, after)
+
+    def remove(self, entry_id):
+        self._generation.pop(entry_id, None)
+        self.changed.set()
+
+    def _drop_stale(self):
+        while self._heap and self._generation.get(self._heap[0][2]) != self._heap[0][1]:
+            heapq.heappop(self._heap)
+
+    def next_deadline(self):
+        self._drop_stale()
+        return self._heap[0][0] if self._heap else None
+
+    def burst_size(self, fire):
+        """Сколько записей (во всех группах) стоят в куче на момент fire."""
+        return sum(1 for item in self._heap if item[4] == fire and self._generation.get(item[2]) == item[1])
+
+    def pop_due(self, now):
+        """Извлекает все записи с наступившим сроком: [(группа, id, назначенное время), ...]."""
+        due = []
+        while True:
+            self._drop_stale()
+            if not self._heap or self._heap[0][0] > now:
+                return due
+            _, _, entry_id, group, fire = heapq.heappop(self._heap)
+            del self._generation[entry_id]
+            due.append((group, entry_id, fire))
+
+    def on_config_event(self, event, key, payload):
+        """Подписчик ConfigStore: точечно обновляет кучу при изменениях расписания."""
+        if event in ("scheduled", "scheduled_sent"):
+            self.upsert(key, payload)
+        elif event == "scheduled_removed":
+            self.remove(payload)
+        elif event == "chat_removed":
+            for entry in payload:
+                self.remove(entry.get("id"))
+        elif event == "reloaded":
+            self.rebuild(payload.get("scheduled", {}))
+        elif event == "flag":
+            self.changed.set()
+
+    async def wait(self, max_sleep=60):
+        """Спит до ближайшего дедлайна (не дольше max_sleep) или до изменения расписания.
+
+        Сон отмеряется по монотонным часам. Если за время сна настенные
+        часы ушли от монотонных (NTP, ручной перевод), возвращается True:
+        расписание нужно перестроить от нового текущего времени.
+        """
+        deadline = self.next_deadline()
+        wall, mono = utc_now(), time.monotonic()
+        timeout = max_sleep
+        if deadline is not None:
+            timeout = min(max((deadline - wall).total_seconds(), 0), max_sleep)
+        self.changed.clear()
+        with suppress(asyncio.TimeoutError):
+            await asyncio.wait_for(self.changed.wait(), timeout)
+        drift = (utc_now() - wall).total_seconds() - (time.monotonic() - mono)
+        if abs(drift) > CLOCK_JUMP_THRESHOLD:
+            self.clock_jumps += 1
+            logger.warning("Системные часы переведены на %+.1f с, расписание будет перестроено", drift)
+            return True
+        return False
+
+
+class DelayQueue:
+    """Очередь групп режима задержки по времени следующей отправки.
+
+    У каждой группы свой дедлайн (время последней отправки + её delay), так
+    что группа с задержкой 10 с не заставляет слать каждые 10 с в группы с
+    задержкой 6 ч. Время — по time.monotonic(), ему не страшны переводы часов.
+    """
+
+    def __init__(self, min_delay=1):
+        self.min_delay = min_delay
+        self._heap = []
+        self._generation = {}
+        self._last_sent = {}
+        self._counter = itertools.count()
+        self.changed = asyncio.Event()
+
+    def __len__(self):
+        return len(self._generation)
+
+    def _push(self, chat, due_at):
+        generation = next(self._counter)
+        self._generation[chat] = generation
+        heapq.heappush(self._heap, (due_at, generation, chat))
+        self.changed.set()
+
+    def _delay(self, data):
+        return max(data.get("delay", 60), self.min_delay)
+
+    def rebuild(self, chats, now=None):
+        now = time.monotonic() if now is None else now
+        self._heap = []
+        self._generation = {}
+        for chat, data in chats.items():
+            last_sent = self._last_sent.get(chat)
+            # Новые группы отправляются сразу, известные — по своему расписанию
+            self._push(chat, now if last_sent is None else last_sent + self._delay(data))
+        self._last_sent = {chat: t for chat, t in self._last_sent.items() if chat in chats}
+
+    def reschedule(self, chat, data, sent_at=None):
+        sent_at = time.monotonic() if sent_at is None else sent_at
+        self._last_sent[chat] = sent_at
+        self._push(chat, sent_at + self._delay(data))
+
+    def remove(self, chat):
+        self._generation.pop(chat, None)
+        self._last_sent.pop(chat, None)
+        self.changed.set()
+
+    def _drop_stale(self):
+        while self._heap and self._generation.get(self._heap[0][2]) != self._heap[0][1]:
+            heapq.heappop(self._heap)
+
+    def next_deadline(self):
+        self._drop_stale()
+        return self._heap[0][0] if self._heap else None
+
+    def pop_due(self, now=None):
+        now = time.monotonic() if now is None else now
+        due = []
+        while True:
+            self._drop_stale()
+            if not self._heap or self._heap[0][0] > now:
+                return due
+            _, _, chat = heapq.heappop(self._heap)
+            del self._generation[chat]
+            due.append(chat)
+
+    def on_config_event(self, event, key, payload):
+        if event == "chat":
+            last_sent = self._last_sent.get(key)
+            if last_sent is None:
+                if key not in self._generation:
+                    self._push(key, time.monotonic())
+            elif key in self._generation:
+                # Изменилась задержка — пересчитываем дедлайн от последней отправки
+                self._push(key, last_sent + self._delay(payload))
+        elif event == "chat_removed":
+            self.remove(key)
+        elif event == "reloaded":
+            self.rebuild(payload.get("chats", {}))
+        elif event == "flag":
+            self.changed.set()
+
+    async def wait(self, max_sleep=60):
+        deadline = self.next_deadline()
+        timeout = max_sleep
+        if deadline is not None:
+            timeout = min(max(deadline - time.monotonic(), 0), max_sleep)
+        self.changed.clear()
+        with suppress(asyncio.TimeoutError):
+            await asyncio.wait_for(self.changed.wait(), timeout)
@@ -0,0 +1,184 @@
+import asyncio
+import datetime
+import json
+import logging
+import os
+import time
+from contextlib import suppress
+
+logger = logging.getLogger(__name__)
+
+# Как часто журнал уплотняется на ходу, секунд
+COMPACT_INTERVAL = 600
+
+
+def send_key(chat, entry_id, fire):
+    """Ключ одной отправки: группа + запись расписания + назначенный момент."""
+    return f"{chat}:{entry_id}:{fire:%Y-%m-%dT%H:%M:%S}"
+
+
+def _moment(value):
+    return datetime.datetime.fromisoformat(value)
+
+
+class SendJournal:
+    """Журнал отправок по расписанию: intent -> sent / failed, только дописывается.
+
+    Перед отправкой в журнал пишется intent, после — sent или failed, и
+    запись считается сделанной только после fsync. fsync группируется:
+    все записи, пришедшие за batch_delay секунд (например, вся пачка
+    созревших записей), сбрасываются на диск одним вызовом в потоке, не
+    блокируя event loop.
+
+    При старте журнал проигрывается: отправленные (sent) больше не
+    отправляются, даже если last_sent_date в конфиге не успел сохраниться,
+    а начатые, но не завершённые (intent без исхода, процесс упал) отправки
+    повторяются, если их срок ещё в окне догонялки (window секунд).
+
+    Старше окна отметки не нужны: такие срабатывания расписание не
+    отправляет в любом случае. Поэтому журнал уплотняется до текущего
+    состояния в пределах окна — при старте и раз в COMPACT_INTERVAL секунд
+    (compact() из цикла расписания), и ни словари, ни файл не растут.
+    """
+
+    def __init__(self, path, window, batch_delay=0.005):
+        self.path = path
+        self.window = window
+        self.batch_delay = batch_delay
+        self.sent = {}
+        self.pending = {}
+        self._batch = None
+        self._syncing = None
+        # Запись в файл и его подмена при уплотнении не должны пересекаться
+        self._lock = asyncio.Lock()
+        self._replay()
+        self._file = open(path, "a", encoding="utf-8")
+        self.compacted_at = time.monotonic()
+
+    def _replay(self):
+        records = []
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        records.append(json.loads(line))
+                    except ValueError:
+                        # Оборванная последняя строка после падения
+                        logger.warning("Журнал отправок: пропущена повреждённая строка")
+        except FileNotFoundError:
+            return
+        for record in records:
+            key = record["key"]
+            if record["op"] == "intent":
+                self.pending[key] = record
+            elif record["op"] == "sent":
+                self.pending.pop(key, None)
+                self.sent[key] = record
+            elif record["op"] == "failed":
+                self.pending.pop(key, None)
+        cutoff = self._cutoff()
+        for key, record in list(self.pending.items()):
+            if _moment(record["fire"]) < cutoff:
+                # Окно догонялки закрылось: повтор опоздал бы, считаем отправку неудавшейся
+                logger.error("Журнал отправок: незавершённая отправка %s в %s не повторяется, окно догонялки закрыто",
+                             key, record["chat"])
+                del self.pending[key]
+        if self.pending:
+            logger.warning("Журнал отправок: незавершённых отправок %s, они будут повторены", len(self.pending))
+        self._prune(cutoff)
+        kept = self._state()
+        if len(kept) != len(records):
+            self._rewrite(kept)
+            logger.info("Журнал отправок уплотнён: %s -> %s записей", len(records), len(kept))
+
+    def _cutoff(self):
+        return datetime.datetime.now(datetime.timezone.utc) - datetime.timedelta(seconds=self.window)
+
+    def _prune(self, cutoff):
+        self.sent = {k: r for k, r in self.sent.items() if _moment(r["fire"]) >= cutoff}
+
+    def _state(self):
+        # Текущее состояние: подтверждённые отправки в пределах окна и ещё не завершённые
+        return list(self.sent.values()) + list(self.pending.values())
+
+    def _rewrite(self, records):
+        tmp = self.path + ".compact"
+        with open(tmp, "w", encoding="utf-8") as f:
+            for record in records:
+                f.write(json.dumps(record, ensure_ascii=False, separators=(",", ":")) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.path)
+
+    async def compact(self):
+        """Уплотняет журнал на ходу: записи старше окна догонялки уходят из памяти и с диска."""
+        async with self._lock:
+            # Дожидаемся fsync начатых пачек: файл закрывается, а их записи попадут в новый из памяти
+            for batch in (self._batch, self._syncing):
+                if batch is not None:
+                    with suppress(Exception):
+                        await asyncio.shield(batch)
+            self._prune(self._cutoff())
+            kept = self._state()
+            self._file.close()
+            try:
+                await asyncio.get_running_loop().run_in_executor(None, self._rewrite, kept)
+            finally:
+                self._file = open(self.path, "a", encoding="utf-8")
+                self.compacted_at = time.monotonic()
+        logger.debug("Журнал отправок уплотнён на ходу: %s записей", len(kept))
+
+    def compact_due(self):
+        return time.monotonic() - self.compacted_at >= COMPACT_INTERVAL
+
+    def is_sent(self, key):
+        return key in self.sent
+
+    async def record(self, op, chat, entry_id, fire, lateness=None):
+        """Дописывает запись и ждёт, пока она (вместе со всей пачкой) окажется на диске.
+
+        lateness — опоздание отправки в секундах, сохраняется в записи sent.
+        """
+        key = send_key(chat, entry_id, fire)
+        record = {"op": op, "key": key, "chat": chat, "id": entry_id, "fire": fire.isoformat(timespec="seconds")}
+        if lateness is not None:
+            record["late"] = round(lateness, 3)
+        async with self._lock:
+            self._file.write(json.dumps(record, ensure_ascii=False, separators=(",", ":")) + "\n")
+            if op == "intent":
+                self.pending[key] = record
+            else:
+                self.pending.pop(key, None)
+                if op == "sent":
+                    self.sent[key] = record
+            if self._batch is None:
+                self._batch = asyncio.get_running_loop().create_future()
+                asyncio.ensure_future(self._sync_batch(self._batch))
+            batch = self._batch
+        await asyncio.shield(batch)
+
+    async def _sync_batch(self, batch):
+        await asyncio.sleep(self.batch_delay)
+        # Новые записи с этого момента попадут в следующую пачку
+        self._batch = None
+        self._syncing = batch
+        try:
+            self._file.flush()
+            await asyncio.get_running_loop().run_in_executor(None, os.fsync, self._file.fileno())
+        except Exception as e:
+            batch.set_exception(e)
+        else:
+            batch.set_result(None)
+        finally:
+            self._syncing = None
+
+    def sent_sends(self):
+        """[(группа, id записи, назначенное время)] отправок, подтверждённых журналом."""
+        return [(r["chat"], r["id"], _moment(r["fire"])) for r in self.sent.values()]
+
+    def pending_sends(self):
+        """[(группа, id записи, назначенное время)] начатых, но не завершённых отправок."""
+        return [(r["chat"], r["id"], _moment(r["fire"])) for r in self.pending.values()]
+
+    def close(self):
+        self._file.close()
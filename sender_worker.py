@@ -0,0 +1,105 @@
+"""Процесс-отправитель: берёт задания из outbox (outbox.py) и отправляет их в Telegram.
+
+Админ-бот в режиме SENDER_MODE=outbox запускает SENDER_WORKERS таких
+процессов сам, но их можно запускать и отдельно, хоть на другой машине
+с общим диском:
+
+    python sender_worker.py
+
+Лимиты RATE_* действуют на каждый процесс отдельно, поэтому общий лимит
+Bot API нужно делить между процессами.
+"""
+import asyncio
+import json
+import logging
+import os
+import time
+from functools import lru_cache
+
+from aiogram import Bot
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
+from dotenv import load_dotenv
+
+from broadcast import fan_out, is_transient
+from content import PlanSender, compile_plan
+from log_setup import setup_logging
+from outbox import Outbox, OutboxFileIdCache, worker_id
+from ratelimit import RateLimiter, RateLimitMiddleware
+
+load_dotenv()
+setup_logging(os.getenv('LOG_LEVEL', 'INFO'), dumps=os.getenv('LOG_DUMPS', '0') == '1')
+logger = logging.getLogger("sender_worker")
+
+TOKEN = os.getenv('BOT_TOKEN')
+TELEGRAM_API_URL = os.getenv('TELEGRAM_API_URL')
+OUTBOX_PATH = os.getenv('OUTBOX_PATH', os.path.join(os.path.dirname(__file__), 'outbox.db'))
+BROADCAST_CONCURRENCY = int(os.getenv('BROADCAST_CONCURRENCY', '20'))
+SEND_TIMEOUT = float(os.getenv('SEND_TIMEOUT', '120'))
+RATE_GLOBAL_PER_SEC = float(os.getenv('RATE_GLOBAL_PER_SEC', '30'))
+RATE_CHAT_PER_SEC = float(os.getenv('RATE_CHAT_PER_SEC', '1'))
+RATE_GROUP_PER_MIN = float(os.getenv('RATE_GROUP_PER_MIN', '20'))
+# Аренда задания должна пережить самую долгую отправку пачки, иначе задание уйдёт другому процессу
+SENDER_LEASE = float(os.getenv('SENDER_LEASE', str(SEND_TIMEOUT + 60)))
+SENDER_POLL_INTERVAL = float(os.getenv('SENDER_POLL_INTERVAL', '0.5'))
+SENDER_MAX_ATTEMPTS = int(os.getenv('SENDER_MAX_ATTEMPTS', '5'))
+SENDER_RETRY_DELAY = float(os.getenv('SENDER_RETRY_DELAY', '5'))
+# Выполненные задания хранятся неделю
+OUTBOX_RETENTION = float(os.getenv('OUTBOX_RETENTION', str(7 * 86400)))
+
+
+@lru_cache(maxsize=1024)
+def plan_for(payload):
+    # Одинаковый снимок сообщения (группа в режиме задержки) компилируется один раз
+    return compile_plan(json.loads(payload))
+
+
+async def run_worker():
+    owner = worker_id()
+    outbox = Outbox(OUTBOX_PATH)
+    session = AiohttpSession(api=TelegramAPIServer.from_base(TELEGRAM_API_URL)) if TELEGRAM_API_URL else None
+    bot = Bot(token=TOKEN, session=session)
+    rate_limiter = RateLimiter(RATE_GLOBAL_PER_SEC, RATE_CHAT_PER_SEC, RATE_GROUP_PER_MIN)
+    bot.session.middleware(RateLimitMiddleware(rate_limiter))
+    # file_id общие для всех отправителей и админ-бота (таблица в базе outbox)
+    plan_sender = PlanSender(bot, OutboxFileIdCache(OUTBOX_PATH, legacy_path=os.path.join("media", "file_ids.json")))
+    logger.info("Отправитель %s запущен, outbox: %s", owner, OUTBOX_PATH)
+
+    async def send(item):
+        plan = plan_for(item.payload)
+        if plan.method is None:
+            logger.warning("Нет данных для отправки в %s", item.chat)
+            return
+        await plan_sender.send(item.chat, plan)
+
+    purged_at = 0
+    try:
+        while True:
+            items = outbox.claim(owner, BROADCAST_CONCURRENCY, SENDER_LEASE)
+            if not items:
+                if time.monotonic() - purged_at > 3600:
+                    purged_at = time.monotonic()
+                    outbox.purge(OUTBOX_RETENTION)
+                await asyncio.sleep(SENDER_POLL_INTERVAL)
+                continue
+            results = await fan_out(items, send, concurrency=BROADCAST_CONCURRENCY, timeout=SEND_TIMEOUT)
+            for result in results:
+                item = result.target
+                if result.ok:
+                    if not outbox.complete(item.id, owner):
+                        logger.warning("Аренда задания %s истекла до завершения отправки в %s", item.id, item.chat)
+                elif is_transient(result.error) and item.attempt < SENDER_MAX_ATTEMPTS:
+                    logger.warning("Повтор отправки в %s (%s) через %.0f с: %s",
+                                   item.chat, item.kind, SENDER_RETRY_DELAY * item.attempt, result.error)
+                    outbox.fail(item.id, owner, result.error, retry_in=SENDER_RETRY_DELAY * item.attempt)
+                else:
+                    logger.error("Отправка в %s (%s) не удалась (попыток: %s): %s",
+                                 item.chat, item.kind, item.attempt, result.error)
+                    outbox.fail(item.id, owner, result.error)
+    finally:
+        outbox.close()
+        await bot.session.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(run_worker())
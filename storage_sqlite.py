@@ -0,0 +1,357 @@
+"""SQLite-хранилище конфига (включается через STORAGE_BACKEND=sqlite).
+
+Вместо одного большого JSON-документа данные лежат в таблицах: группы,
+сообщения для режима задержки, записи расписания, элементы медиа-групп и
+состояние отправки. Обработчики меняют только затронутые строки. Что пора
+отправить, хранилище не решает: это делает куча ScheduleIndex в памяти
+(scheduler.py), которая обновляется по событиям конфига, а не запросами к базе.
+
+Разовый перенос существующего config.json:
+
+    python storage_sqlite.py config.json config.db
+"""
+import json
+import logging
+import os
+import sqlite3
+import sys
+from contextlib import contextmanager
+
+from config_store import ENTRY_ID_KEY, ConfigStore, default_config
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS settings (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS chats (
+    chat TEXT PRIMARY KEY,
+    delay INTEGER NOT NULL DEFAULT 60,
+    position INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS delay_messages (
+    chat TEXT PRIMARY KEY REFERENCES chats(chat) ON DELETE CASCADE,
+    content TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS scheduled (
+    id INTEGER PRIMARY KEY,
+    chat TEXT NOT NULL,
+    time TEXT NOT NULL,
+    content TEXT NOT NULL
+);
+-- В старых базах у scheduled остаётся пустая колонка seconds, индекс по ней больше не нужен
+DROP INDEX IF EXISTS scheduled_by_seconds;
+CREATE INDEX IF NOT EXISTS scheduled_by_chat ON scheduled(chat);
+CREATE TABLE IF NOT EXISTS media_items (
+    owner_kind TEXT NOT NULL,
+    owner_key TEXT NOT NULL,
+    position INTEGER NOT NULL,
+    type TEXT NOT NULL,
+    file_path TEXT,
+    file_id TEXT,
+    PRIMARY KEY (owner_kind, owner_key, position)
+);
+CREATE TABLE IF NOT EXISTS send_state (
+    entry_id INTEGER PRIMARY KEY REFERENCES scheduled(id) ON DELETE CASCADE,
+    last_sent_date TEXT
+);
+"""
+
+# Поля, которые живут в отдельных колонках/таблицах, а не в JSON-поле content
+CHAT_COLUMNS = ("delay", "media_group")
+ENTRY_COLUMNS = ("id", "time", "last_sent_date", "media_group")
+
+
+class SQLiteConfigStore(ConfigStore):
+    """Тот же интерфейс, что у ConfigStore, но точечные изменения пишутся отдельными строками.
+
+    Документ в памяти по-прежнему отдаётся через get(), а внешние изменения
+    базы (другим процессом) замечаются по PRAGMA data_version.
+    """
+
+    def __init__(self, db_path, default_factory=default_config, flush_delay=0.5):
+        super().__init__(db_path, default_factory, flush_delay)
+        self._conn = sqlite3.connect(db_path, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("PRAGMA foreign_keys=ON")
+        self._conn.executescript(SCHEMA)
+
+    def close(self):
+        self.flush()
+        self._conn.close()
+
+    @contextmanager
+    def _transaction(self):
+        # Все записи (точечные и полная перезапись в flush) идут через транзакцию — её и замеряем
+        with self._timed(self.observe_save):
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield self._conn
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._conn.execute("COMMIT")
+
+    def _committed(self):
+        self.version += 1
+        self.save_requests += 1
+        self.writes += 1
+
+    def _stat_signature(self):
+        return self._conn.execute("PRAGMA data_version").fetchone()[0]
+
+    # -----------------------------------
+    # Чтение
+    # -----------------------------------
+
+    def _read(self):
+        config = self.default_factory()
+        for key, value in self._conn.execute("SELECT key, value FROM settings"):
+            config[key] = json.loads(value)
+        media = {}
+        for kind, key, type_, file_path, file_id in self._conn.execute(
+            "SELECT owner_kind, owner_key, type, file_path, file_id FROM media_items ORDER BY owner_kind, owner_key, position"
+        ):
+            item = {"type": type_}
+            if file_path:
+                item["file_path"] = file_path
+            if file_id:
+                item["file_id"] = file_id
+            media.setdefault((kind, key), []).append(item)
+        for chat, delay in self._conn.execute("SELECT chat, delay FROM chats ORDER BY position"):
+            config["chats"][chat] = {"message": None, "delay": delay}
+            if ("chat", chat) in media:
+                config["chats"][chat]["media_group"] = media[("chat", chat)]
+        for chat, content in self._conn.execute("SELECT chat, content FROM delay_messages"):
+            if chat in config["chats"]:
+                config["chats"][chat].update(json.loads(content))
+        max_id = 0
+        for entry_id, chat, time_str, content, last_sent in self._conn.execute(
+            "SELECT s.id, s.chat, s.time, s.content, st.last_sent_date "
+            "FROM scheduled s LEFT JOIN send_state st ON st.entry_id = s.id ORDER BY s.id"
+        ):
+            entry = {"id": entry_id, "time": time_str}
+            entry.update(json.loads(content))
+            if last_sent:
+                entry["last_sent_date"] = last_sent
+            if ("scheduled", str(entry_id)) in media:
+                entry["media_group"] = media[("scheduled", str(entry_id))]
+            config["scheduled"].setdefault(chat, []).append(entry)
+            max_id = max(max_id, entry_id)
+        self._next_entry_id = max(max_id + 1, config.get(ENTRY_ID_KEY, 1))
+        logger.info("Загружен config из SQLite: %s групп, версия %s", len(config['chats']), self.version + 1)
+        return config
+
+    # -----------------------------------
+    # Запись отдельных строк
+    # -----------------------------------
+
+    def _write_media(self, kind, key, items):
+        self._conn.execute("DELETE FROM media_items WHERE owner_kind = ? AND owner_key = ?", (kind, str(key)))
+        self._conn.executemany(
+            "INSERT INTO media_items(owner_kind, owner_key, position, type, file_path, file_id) VALUES (?, ?, ?, ?, ?, ?)",
+            [(kind, str(key), i, item["type"], item.get("file_path"), item.get("file_id")) for i, item in enumerate(items or [])]
+        )
+
+    def _write_chat(self, chat, data):
+        self._conn.execute(
+            "INSERT INTO chats(chat, delay, position) "
+            "VALUES (?, ?, (SELECT COALESCE(MAX(position), 0) + 1 FROM chats)) "
+            "ON CONFLICT(chat) DO UPDATE SET delay = excluded.delay",
+            (chat, data.get("delay", 60))
+        )
+        content = {k: v for k, v in data.items() if k not in CHAT_COLUMNS}
+        self._conn.execute(
+            "INSERT INTO delay_messages(chat, content) VALUES (?, ?) "
+            "ON CONFLICT(chat) DO UPDATE SET content = excluded.content",
+            (chat, json.dumps(content, ensure_ascii=False))
+        )
+        self._write_media("chat", chat, data.get("media_group"))
+
+    def _write_entry(self, chat, entry):
+        content = {k: v for k, v in entry.items() if k not in ENTRY_COLUMNS}
+        self._conn.execute(
+            "INSERT INTO scheduled(id, chat, time, content) VALUES (?, ?, ?, ?) "
+            "ON CONFLICT(id) DO UPDATE SET chat = excluded.chat, time = excluded.time, "
+            "content = excluded.content",
+            (entry["id"], chat, entry["time"], json.dumps(content, ensure_ascii=False))
+        )
+        self._write_send_state(entry)
+        self._write_media("scheduled", entry["id"], entry.get("media_group"))
+
+    def _write_send_state(self, entry):
+        if entry.get("last_sent_date"):
+            self._conn.execute(
+                "INSERT INTO send_state(entry_id, last_sent_date) VALUES (?, ?) "
+                "ON CONFLICT(entry_id) DO UPDATE SET last_sent_date = excluded.last_sent_date",
+                (entry["id"], entry["last_sent_date"])
+            )
+        else:
+            self._conn.execute("DELETE FROM send_state WHERE entry_id = ?", (entry["id"],))
+
+    def _write_setting(self, key, value):
+        self._conn.execute(
+            "INSERT INTO settings(key, value) VALUES (?, ?) ON CONFLICT(key) DO UPDATE SET value = excluded.value",
+            (key, json.dumps(value))
+        )
+
+    def _delete_entry(self, entry_id):
+        self._conn.execute("DELETE FROM scheduled WHERE id = ?", (entry_id,))
+        self._conn.execute("DELETE FROM media_items WHERE owner_kind = 'scheduled' AND owner_key = ?", (str(entry_id),))
+
+    def set_flag(self, key, value):
+        self.get()[key] = value
+        with self._transaction():
+            self._write_setting(key, value)
+        self._committed()
+        self._notify("flag", key, value)
+
+    def add_chat(self, chat, fields):
+        self.get()["chats"][chat] = dict(fields)
+        with self._transaction():
+            self._write_chat(chat, fields)
+        self._committed()
+        self._notify("chat", chat, self.get()["chats"][chat])
+
+    def update_chat(self, chat, fields, drop=()):
+        data = self.get()["chats"][chat]
+        data.update(fields)
+        for key in drop:
+            data.pop(key, None)
+        with self._transaction():
+            self._write_chat(chat, data)
+        self._committed()
+        self._notify("chat", chat, data)
+
+    def remove_chat(self, chat):
+        config = self.get()
+        chat_data = config["chats"].pop(chat, None)
+        entries = config.get("scheduled", {}).pop(chat, [])
+        with self._transaction() as conn:
+            conn.execute("DELETE FROM chats WHERE chat = ?", (chat,))
+            conn.execute("DELETE FROM media_items WHERE owner_kind = 'chat' AND owner_key = ?", (chat,))
+            for entry in entries:
+                self._delete_entry(entry["id"])
+        self._committed()
+        self._notify("chat_removed", chat, entries)
+        return chat_data, entries
+
+    def add_scheduled(self, chat, entry):
+        config = self.get()
+        entry = dict(entry)
+        entry["id"] = self._take_entry_id(config)
+        config.setdefault("scheduled", {}).setdefault(chat, []).append(entry)
+        with self._transaction():
+            self._write_entry(chat, entry)
+            self._write_setting(ENTRY_ID_KEY, self._next_entry_id)
+        self._committed()
+        self._notify("scheduled", chat, entry)
+        return entry
+
+    def import_bulk(self, chats, entries):
+        config = self.get()
+        config["chats"].update(chats)
+        added = self._append_entries(config, entries)
+        with self._transaction():
+            for chat, data in chats.items():
+                self._write_chat(chat, data)
+            for chat, entry in added:
+                self._write_entry(chat, entry)
+            self._write_setting(ENTRY_ID_KEY, self._next_entry_id)
+        self._committed()
+        self._notify_bulk(chats, added)
+        return added
+
+    def update_scheduled(self, chat, entry_id, fields, drop=()):
+        entry = self.find_scheduled(chat, entry_id)
+        if entry is None:
+            return None
+        entry.update(fields)
+        for key in drop:
+            entry.pop(key, None)
+        with self._transaction():
+            self._write_entry(chat, entry)
+        self._committed()
+        self._notify("scheduled", chat, entry)
+        return entry
+
+    def remove_scheduled(self, chat, entry_id):
+        entries = self.get().get("scheduled", {}).get(chat, [])
+        for i, entry in enumerate(entries):
+            if entry.get("id") == entry_id:
+                removed = entries.pop(i)
+                with self._transaction():
+                    self._delete_entry(entry_id)
+                self._committed()
+                self._notify("scheduled_removed", chat, entry_id)
+                return removed
+        return None
+
+    def mark_sent(self, chat, entry_id, date_str):
+        entry = self.find_scheduled(chat, entry_id)
+        if entry is None:
+            return
+        entry["last_sent_date"] = date_str
+        with self._transaction():
+            self._write_send_state(entry)
+        self._committed()
+        self._notify("scheduled_sent", chat, entry)
+
+    def flush(self):
+        """Полная перезапись таблиц — только для save() целого документа."""
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        if not self._dirty or self._data is None:
+            return
+        try:
+            with self._transaction() as conn:
+                for table in ("settings", "chats", "delay_messages", "scheduled", "media_items", "send_state"):
+                    conn.execute(f"DELETE FROM {table}")
+                for key, value in self._data.items():
+                    if key not in ("chats", "scheduled"):
+                        conn.execute("INSERT INTO settings(key, value) VALUES (?, ?)", (key, json.dumps(value)))
+                for chat, data in self._data.get("chats", {}).items():
+                    self._write_chat(chat, data)
+                for chat, entries in self._data.get("scheduled", {}).items():
+                    for entry in entries:
+                        self._write_entry(chat, entry)
+        except Exception as e:
+            logger.error("Не удалось сохранить config в SQLite: %s", e)
+            return
+        self._dirty = False
+        self.writes += 1
+        logger.info("Сохранён config в SQLite, версия %s", self.version)
+
+
+def migrate_json_to_sqlite(json_path, db_path):
+    """Разовый перенос config.json в SQLite. Возвращает (число групп, число записей расписания)."""
+    with open(json_path, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+    for key, value in default_config().items():
+        data.setdefault(key, value)
+    store = SQLiteConfigStore(db_path, flush_delay=0)
+    store._assign_entry_ids(data)
+    store.save(data)
+    store.close()
+    entries = sum(len(group) for group in data["scheduled"].values())
+    logger.info("Перенесено в %s: %s групп, %s записей расписания", db_path, len(data['chats']), entries)
+    return len(data["chats"]), entries
+
+
+def open_sqlite_store(db_path, json_path=None, flush_delay=0.5):
+    """Открывает SQLite-хранилище; при первом запуске переносит в него существующий config.json."""
+    if not os.path.exists(db_path) and json_path and os.path.exists(json_path):
+        migrate_json_to_sqlite(json_path, db_path)
+    return SQLiteConfigStore(db_path, flush_delay=flush_delay)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 3:
+        print("Использование: python storage_sqlite.py config.json config.db")
+        sys.exit(1)
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    migrate_json_to_sqlite(sys.argv[1], sys.argv[2])
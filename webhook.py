@@ -0,0 +1,67 @@
+"""Приём апдейтов через webhook (BOT_MODE=webhook) вместо long polling.
+
+Бот слушает обычный HTTP на WEBHOOK_HOST:WEBHOOK_PORT (по умолчанию
+127.0.0.1:8080), а TLS снимает локальный обратный прокси, например nginx:
+
+    location /webhook {
+        proxy_pass http://127.0.0.1:8080;
+    }
+
+В Telegram регистрируется публичный адрес WEBHOOK_URL (https://домен/webhook).
+Каждый запрос проверяется по заголовку X-Telegram-Bot-Api-Secret-Token, а
+ответ 200 уходит сразу: апдейт обрабатывается в фоновой задаче.
+"""
+import asyncio
+import logging
+import secrets
+from urllib.parse import urlsplit
+
+from aiogram.types import FSInputFile
+from aiogram.webhook.aiohttp_server import SimpleRequestHandler, setup_application
+from aiohttp import web
+
+logger = logging.getLogger(__name__)
+
+
+def webhook_path(url):
+    return urlsplit(url).path or "/"
+
+
+async def start_webhook(dp, bot, url, host="127.0.0.1", port=8080, secret=None, certificate=None, **kwargs):
+    """Поднимает aiohttp-приложение и регистрирует webhook; возвращает runner для остановки.
+
+    secret — токен для заголовка X-Telegram-Bot-Api-Secret-Token (если не
+    задан, генерируется на каждый запуск). certificate — путь к
+    самоподписанному сертификату прокси, если он не от публичного УЦ.
+    kwargs передаются обработчикам апдейтов, как в dp.start_polling.
+    """
+    secret = secret or secrets.token_urlsafe(32)
+    app = web.Application()
+    # handle_in_background: Telegram получает ответ сразу, не дожидаясь обработчиков
+    SimpleRequestHandler(dispatcher=dp, bot=bot, secret_token=secret, handle_in_background=True,
+                         **kwargs).register(app, path=webhook_path(url))
+    setup_application(app, dp, bot=bot, **kwargs)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    await bot.set_webhook(
+        url,
+        secret_token=secret,
+        certificate=FSInputFile(certificate) if certificate else None,
+        allowed_updates=dp.resolve_used_update_types(),
+    )
+    logger.info("Webhook %s, слушаем http://%s:%s%s", url, host, port, webhook_path(url))
+    return runner
+
+
+async def run_webhook(dp, bot, url, host="127.0.0.1", port=8080, secret=None, certificate=None, **kwargs):
+    """Работает в режиме webhook до отмены задачи.
+
+    Webhook при выходе не снимается: пока бот перезапускается, Telegram
+    копит апдейты и дошлёт их. Для возврата к polling его снимает main().
+    """
+    runner = await start_webhook(dp, bot, url, host, port, secret, certificate, **kwargs)
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await runner.cleanup()